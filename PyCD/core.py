@@ -9,19 +9,32 @@ systems
 """
 from pathlib import Path
 from datetime import datetime
-import random as rnd
 from collections import defaultdict
 import itertools
 import pdb
+import os
+import time
+import copy
+import json
+import ast
+import hashlib
+import shutil
+import tempfile
+import threading
+import queue
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
+from numpy.lib.format import open_memmap
 from scipy.special import erfc, binom
+from scipy.sparse import csr_matrix
+from scipy.fft import next_fast_len
 from scipy.stats import linregress
 from scipy.optimize import fsolve
 import matplotlib.pyplot as plt
 from matplotlib.offsetbox import AnchoredText
 from textwrap import wrap
-import pickle
 
 from PyCD.io import read_poscar, generate_report
 from PyCD import constants
@@ -288,6 +301,14 @@ class Neighbors(object):
                                 np.array([x_offset, y_offset, z_offset]),
                                 system_size), self.material.lattice_matrix))
                     index += 1
+        # minimum image vectors between sites computed on demand
+        self.min_image_vectors = MinImageVectors(
+                                self.bulk_sites.cell_coordinates,
+                                self.system_size[:, None]
+                                * self.material.lattice_matrix, self.pbc,
+                                self.system_translational_vector_list)
+        # spatial index of the sites for radius and nearest neighbor queries
+        self.cell_list = PeriodicCellList(self.min_image_vectors, self.pbc)
 
     def get_system_element_index(self, system_size, quantum_indices):
         """Returns the system_element_index of the element
@@ -399,91 +420,153 @@ class Neighbors(object):
         displacement = np.min(neighbor_image_displacements)
         return displacement
 
+    def get_local_neighbor_offsets(self, center_basis_coord,
+                                   neighbor_basis_coords, cutoff_dist,
+                                   local_system_size):
+        """Returns the unit cell offsets and basis positions of the neighbor
+            sites within cutoff distance of a center basis site, enumerated
+            over a local supercell around the center unit cell which is
+            extended beyond local_system_size as the cutoff distance demands
+            :param center_basis_coord:
+            :param neighbor_basis_coords:
+            :param cutoff_dist:
+            :param local_system_size:
+            :return: """
+        reciprocal_lattice_vector_length = np.linalg.norm(
+                                np.linalg.inv(self.material.lattice_matrix),
+                                axis=0)
+        local_offset_limits = np.maximum(
+                    np.asarray(local_system_size) // 2,
+                    np.ceil(cutoff_dist * reciprocal_lattice_vector_length)
+                    .astype(int) + 1)
+        local_offset_limits[np.asarray(self.pbc) == 0] = np.minimum(
+                    local_offset_limits, self.system_size - 1)[
+                                                np.asarray(self.pbc) == 0]
+        local_cell_offsets = np.array(list(itertools.product(
+                        *[range(-limit, limit + 1)
+                          for limit in local_offset_limits])))
+        local_displacement_vectors = (
+                    np.dot(local_cell_offsets, self.material.lattice_matrix)[
+                                                            :, None, :]
+                    + neighbor_basis_coords - center_basis_coord)
+        # candidates are screened loosely and verified with the minimum
+        # image displacements of the system
+        (offset_indices, basis_positions) = np.nonzero(
+                    np.linalg.norm(local_displacement_vectors, axis=2)
+                    <= cutoff_dist * (1 + 1E-08))
+        return (local_cell_offsets[offset_indices], basis_positions)
+
     def hop_neighbor_sites(self, bulk_sites, center_site_indices,
                            neighbor_site_indices, cutoff_dist_limits,
-                           cutoff_dist_key):
+                           cutoff_dist_key, local_system_size=None):
         """Returns system_element_index_map and distances between center sites
-            and its neighbor sites within cutoff distance
+            and its neighbor sites within cutoff distance. Neighbor offsets
+            are enumerated once per center basis site on a local supercell
+            and translated over the system, after which the minimum image
+            displacements of the candidate pairs decide as for a search over
+            all pairs. Neighbors are listed in the order of
+            neighbor_site_indices
             :param bulk_sites:
             :param center_site_indices:
             :param neighbor_site_indices:
             :param cutoff_dist_limits:
             :param cutoff_dist_key:
+            :param local_system_size: minimum size of the local supercell
             :return: """
+        if local_system_size is None:
+            local_system_size = np.array([3, 3, 3])
         neighbor_site_coords = bulk_sites.cell_coordinates[
                                                         neighbor_site_indices]
         neighbor_site_system_element_index_list = (
                                         bulk_sites.system_element_index_list[
                                                         neighbor_site_indices])
         center_site_coords = bulk_sites.cell_coordinates[center_site_indices]
+        num_centers = len(center_site_indices)
 
-        neighbor_system_element_indices = np.empty(len(center_site_coords),
-                                                   dtype=object)
-        displacement_vector_list = np.empty(len(center_site_coords),
-                                            dtype=object)
-        num_neighbors = np.array([], dtype=int)
-
-        if cutoff_dist_key == 'Fe:Fe':
-            quick_test = 0  # commit reference: 1472bb4
-        else:
-            quick_test = 0
-
-        for center_site_index, center_coord in enumerate(center_site_coords):
-            i_neighbor_site_index_list = []
-            i_displacement_vectors = []
-            i_num_neighbors = 0
-            if quick_test:
-                displacement_list = np.zeros(len(neighbor_site_coords))
-            for neighbor_site_index, neighbor_coord in enumerate(
-                                                        neighbor_site_coords):
-                neighbor_image_coords = (self.system_translational_vector_list
-                                         + neighbor_coord)
-                neighbor_image_displacement_vectors = (neighbor_image_coords
-                                                       - center_coord)
+        # basis positions of sites within the unit cell
+        center_quantum_indices = bulk_sites.quantum_index_list[
+                                                        center_site_indices]
+        neighbor_quantum_indices = bulk_sites.quantum_index_list[
+                                                        neighbor_site_indices]
+        element_type_offset_array = np.cumsum(np.concatenate(
+                            ([0], self.material.n_elements_per_unit_cell)))
+        center_basis_indices = (
+                    element_type_offset_array[center_quantum_indices[:, 3]]
+                    + center_quantum_indices[:, 4])
+        neighbor_basis_indices = (
+                    element_type_offset_array[neighbor_quantum_indices[:, 3]]
+                    + neighbor_quantum_indices[:, 4])
+        (unique_neighbor_basis_indices, neighbor_basis_positions) = np.unique(
+                                neighbor_basis_indices, return_inverse=True)
+        # positions in neighbor_site_indices by unit cell and basis position
+        neighbor_position_map = np.full(
+                    tuple(self.system_size) + (len(unique_neighbor_basis_indices),),
+                    -1, dtype=int)
+        neighbor_position_map[tuple(neighbor_quantum_indices[:, :3].T)
+                              + (neighbor_basis_positions,)] = np.arange(
+                                                    len(neighbor_site_indices))
+
+        neighbor_system_element_indices = np.empty(num_centers, dtype=object)
+        displacement_vector_list = np.empty(num_centers, dtype=object)
+        num_neighbors = np.zeros(num_centers, dtype=int)
+        for center_basis_index in np.unique(center_basis_indices):
+            (cell_offsets, basis_positions) = self.get_local_neighbor_offsets(
+                    self.material.cartesian_unit_cell_coords[center_basis_index],
+                    self.material.cartesian_unit_cell_coords[
+                                            unique_neighbor_basis_indices],
+                    cutoff_dist_limits[1], local_system_size)
+            basis_center_indices = np.where(
+                            center_basis_indices == center_basis_index)[0]
+            block_size = max(1, 2**22 // max(
+                    1, len(cell_offsets) * self.system_translational_vector_list.size))
+            for start_index in range(0, len(basis_center_indices), block_size):
+                block_center_indices = basis_center_indices[
+                                        start_index:start_index + block_size]
+                neighbor_cell_indices = (
+                    center_quantum_indices[block_center_indices, None, :3]
+                    + cell_offsets)
+                within_system = np.all(
+                        (np.asarray(self.pbc) == 1)
+                        | ((neighbor_cell_indices >= 0)
+                           & (neighbor_cell_indices < self.system_size)),
+                        axis=2)
+                neighbor_cell_indices %= self.system_size
+                candidate_positions = neighbor_position_map[
+                            tuple(np.moveaxis(neighbor_cell_indices, 2, 0))
+                            + (basis_positions,)]
+                within_system &= candidate_positions >= 0
+                # minimum image displacements of the candidate pairs
+                neighbor_image_displacement_vectors = (
+                    (self.system_translational_vector_list
+                     + neighbor_site_coords[candidate_positions][:, :, None, :])
+                    - center_site_coords[block_center_indices][:, None, None, :])
                 neighbor_image_displacements = np.linalg.norm(
-                                        neighbor_image_displacement_vectors,
-                                        axis=1)
-                [displacement, image_index] = [
-                                    np.min(neighbor_image_displacements),
-                                    np.argmin(neighbor_image_displacements)]
-                if quick_test:
-                    displacement_list[neighbor_site_index] = displacement
-                if (cutoff_dist_limits[0] < displacement
-                        <= cutoff_dist_limits[1]):
-                    i_neighbor_site_index_list.append(neighbor_site_index)
-                    i_displacement_vectors.append(
-                            neighbor_image_displacement_vectors[image_index])
-                    i_num_neighbors += 1
-            neighbor_system_element_indices[center_site_index] = (
+                                neighbor_image_displacement_vectors, axis=3)
+                image_indices = np.argmin(neighbor_image_displacements, axis=2)
+                displacements = np.min(neighbor_image_displacements, axis=2)
+                candidate_displacement_vectors = np.take_along_axis(
+                                    neighbor_image_displacement_vectors,
+                                    image_indices[:, :, None, None],
+                                    axis=2)[:, :, 0]
+                within_cutoff = (within_system
+                                 & (cutoff_dist_limits[0] < displacements)
+                                 & (displacements <= cutoff_dist_limits[1]))
+                for block_index, center_site_index in enumerate(
+                                                    block_center_indices):
+                    (i_neighbor_site_index_list, unique_indices) = np.unique(
+                            candidate_positions[block_index][
+                                            within_cutoff[block_index]],
+                            return_index=True)
+                    neighbor_system_element_indices[center_site_index] = (
                                     neighbor_site_system_element_index_list[
                                                 i_neighbor_site_index_list])
-            displacement_vector_list[center_site_index] = np.asarray(
-                                                        i_displacement_vectors)
-            num_neighbors = np.append(num_neighbors, i_num_neighbors)
-            if quick_test == 1:
-                print(np.sort(displacement_list)[:10] / constants.ANG2BOHR)
-                pdb.set_trace()
-            elif quick_test == 2:
-                for cutoff_dist in range(2, 7):
-                    cutoff = cutoff_dist * constants.ANG2BOHR
-                    print(cutoff_dist)
-                    print(displacement_list[displacement_list < cutoff].shape)
-                    print(np.unique(np.sort(np.round(
-                                displacement_list[displacement_list < cutoff]
-                                / constants.ANG2BOHR, 4))).shape)
-                    print(np.unique(np.sort(np.round(
-                                displacement_list[displacement_list < cutoff]
-                                / constants.ANG2BOHR, 3))).shape)
-                    print(np.unique(np.sort(np.round(
-                                displacement_list[displacement_list < cutoff]
-                                / constants.ANG2BOHR, 2))).shape)
-                    print(np.unique(np.sort(np.round(
-                                displacement_list[displacement_list < cutoff]
-                                / constants.ANG2BOHR, 1))).shape)
-                    print(np.unique(np.sort(np.round(
-                                displacement_list[displacement_list < cutoff]
-                                / constants.ANG2BOHR, 0))).shape)
-                pdb.set_trace()
+                    i_displacement_vectors = candidate_displacement_vectors[
+                                block_index][within_cutoff[block_index]][
+                                                            unique_indices]
+                    displacement_vector_list[center_site_index] = (
+                                i_displacement_vectors if len(unique_indices)
+                                else np.asarray([]))
+                    num_neighbors[center_site_index] = len(unique_indices)
 
         return_neighbors = ReturnValues(
             neighbor_system_element_indices=neighbor_system_element_indices,
@@ -491,35 +574,29 @@ class Neighbors(object):
             num_neighbors=num_neighbors)
         return return_neighbors
 
+    def get_site_min_image_vector_data(self, site_indices):
+        """Returns the minimum image vectors from each of the given sites to
+            all sites of the system
+            :param site_indices:
+            :return: """
+        return self.min_image_vectors.get_rows(site_indices)
+
     def get_pairwise_min_image_vector_data(self, dst_path):
         """Returns cumulative displacement list for the given system size
-            printed out to disk
+            printed out to disk block by block
             :param dst_path:
             :return: """
-        pairwise_min_image_vector_data = np.zeros((self.num_system_elements,
-                                                 self.num_system_elements, 3))
-        for center_site_index, center_coord in enumerate(
-                                            self.bulk_sites.cell_coordinates):
-            cumulative_system_translational_vector_list = np.tile(
-                                        self.system_translational_vector_list,
-                                        (self.num_system_elements, 1, 1))
-            cumulative_neighbor_image_coords = (
-                cumulative_system_translational_vector_list
-                + np.tile(self.bulk_sites.cell_coordinates[:, np.newaxis, :],
-                          (1, len(self.system_translational_vector_list), 1)))
-            cumulative_neighbor_image_displacement_vectors = (
-                            cumulative_neighbor_image_coords - center_coord)
-            cumulative_neighbor_image_displacements = np.linalg.norm(
-                                cumulative_neighbor_image_displacement_vectors,
-                                axis=2)
-            pairwise_min_image_vector_data[center_site_index] = \
-                cumulative_neighbor_image_displacement_vectors[
-                    np.arange(self.num_system_elements),
-                    np.argmin(cumulative_neighbor_image_displacements, axis=1)]
         pairwise_min_image_vector_data_file_path = dst_path.joinpath(
                                             'pairwise_min_image_vector_data.npy')
-        np.save(pairwise_min_image_vector_data_file_path,
-                pairwise_min_image_vector_data)
+        pairwise_min_image_vector_data = open_memmap(
+                                pairwise_min_image_vector_data_file_path,
+                                mode='w+', dtype=float,
+                                shape=self.min_image_vectors.shape)
+        for row_sites in self.min_image_vectors.get_row_blocks(
+                                                    self.num_system_elements):
+            pairwise_min_image_vector_data[row_sites] = (
+                                self.min_image_vectors.get_rows(row_sites))
+        pairwise_min_image_vector_data.flush()
         return None
 
     def generate_neighbor_list(self, dst_path, local_system_size):
@@ -536,8 +613,6 @@ class Neighbors(object):
             'greater than or equal to 3'
 
         Path.mkdir(dst_path, parents=True, exist_ok=True)
-        hop_neighbor_list_file_path = dst_path.joinpath(
-                                                    'hop_neighbor_list.npy')
 
         hop_neighbor_list = {}
         tol_dist = self.material.neighbor_cutoff_dist_tol
@@ -583,13 +658,14 @@ class Neighbors(object):
                                                 center_site_indices,
                                                 neighbor_site_indices,
                                                 cutoff_dist_limits,
-                                                cutoff_dist_key))
+                                                cutoff_dist_key,
+                                                local_system_size))
                 neighbor_list_cutoff_dist_key.append(
                                             class_neighbor_list_cutoff_dist_key[:])
             hop_neighbor_list[cutoff_dist_key] = (
                 [class_neighbor_list_cutoff_dist_key[:]
                  for class_neighbor_list_cutoff_dist_key in neighbor_list_cutoff_dist_key])
-        np.save(hop_neighbor_list_file_path, hop_neighbor_list)
+        flatten_hop_neighbor_list(hop_neighbor_list).save(dst_path)
 
         file_name = 'neighbor_list'
         print_time_elapsed = 1
@@ -606,16 +682,34 @@ class System(object):
     """
     def __init__(self, material_info, material_neighbors,
                  hop_neighbor_list, pairwise_min_image_vector_data, alpha, r_cut,
-                 k_cut, precision_parameters, step_system_size_array, step_hop_neighbor_master_list):
+                 k_cut, precision_parameters, step_system_size_array, step_hop_neighbor_master_list,
+                 precomputed_array_format='dense',
+                 reciprocal_space_method='direct', pme_parameters=None,
+                 precomputed_array_dtype='float64'):
         """Return a system object whose size is *size*
         :param material_info:
         :param material_neighbors:
         :param hop_neighbor_list:
-        :param pairwise_min_image_vector_data:
+        :param pairwise_min_image_vector_data: pairwise min image vectors
+                loaded from disk or None for vectors computed on demand by
+                the min image vectors of the neighbors
         :param species_count:
         :param alpha:
         :param n_max:
         :param k_max:
+        :param precomputed_array_format: 'dense' for the full precomputed
+                array, 'packed' for its upper triangle from which
+                PackedSymmetricMatrix gathers all rows or 'compressed' for
+                the rows of the first unit cell from which InteractionMatrix
+                gathers all rows
+        :param reciprocal_space_method: 'direct' for the sum over k-vectors
+                or 'pme' for the smooth particle-mesh Ewald sum of the
+                Fourier-space precomputed array
+        :param pme_parameters: B-spline 'spline_order' and 'grid_factor',
+                the number of FFT grid points per k-vector along each
+                dimension of the Fourier-space sum
+        :param precomputed_array_dtype: 'float64' or 'float32' storage of
+                the precomputed array
         """
         self.start_time = datetime.now()
 
@@ -634,6 +728,21 @@ class System(object):
 
         self.pairwise_min_image_vector_data = pairwise_min_image_vector_data
 
+        # sites whose rows of the precomputed array are generated
+        assert precomputed_array_format in ['dense', 'packed', 'compressed'], \
+            'precomputed_array_format must be dense, packed or compressed'
+        self.precomputed_array_format = precomputed_array_format
+        assert precomputed_array_dtype in ['float64', 'float32'], \
+            'precomputed_array_dtype must be either float64 or float32'
+        self.precomputed_array_dtype = np.dtype(precomputed_array_dtype)
+        if precomputed_array_format == 'compressed':
+            assert np.all(self.pbc == 1), \
+                'Compressed precomputed array requires periodic boundary ' \
+                'conditions in all dimensions'
+            self.num_row_sites = self.material.total_elements_per_unit_cell
+        else:
+            self.num_row_sites = self.neighbors.num_system_elements
+
         # variables for ewald sum
         self.translational_matrix = np.multiply(
                         self.system_size, self.material.lattice_matrix)
@@ -725,42 +834,296 @@ class System(object):
         self.step_increase_tol = precision_parameters['step_increase_tol'] * constants.EV2HARTREE
         self.step_change_data_points = precision_parameters['step_change_data_points']
 
-    def pot_r_ewald(self, alpha, r_cut):
+        # bound on the number of elements of the site phase data built at
+        # once for the Fourier-space sums
+        self.max_site_phase_elements = 2**23
+        # bound on the number of elements of a block of rows of the
+        # precomputed array assembled at once
+        self.max_row_block_elements = 2**25
+        # temperature in K at which the rate deviation of the precomputed
+        # array storage is reported
+        self.storage_error_temperature = 300
+
+        assert reciprocal_space_method in ['direct', 'pme'], \
+            'reciprocal_space_method must be either direct or pme'
+        self.reciprocal_space_method = reciprocal_space_method
+        self.pme_parameters = {'spline_order': 6, 'grid_factor': 2.0}
+        self.pme_parameters.update(pme_parameters or {})
+        # FFT grid, interpolation matrix and influence function of the PME sum
+        self.pme_data = None
+        # number of rows and columns of the PME accuracy analysis
+        self.num_pme_error_sites = 256
+
+        # pair distances of the real-space energy profiles
+        self.pair_distance_data = None
+        # k-vector energy ledger of the Fourier-space energy profiles
+        self.k_vector_energy_ledger = None
+
+    def get_min_image_vector_rows(self, row_sites, column_sites=None):
+        """Returns the minimum image vectors from the row sites to the column
+            sites, read from the pairwise min image vector data when loaded
+            and computed on demand otherwise
+        :param row_sites: site index or array of site indices
+        :param column_sites: defaults to all sites
+        :return: """
+        if self.pairwise_min_image_vector_data is None:
+            return self.neighbors.min_image_vectors.get_rows(row_sites,
+                                                             column_sites)
+        rows = self.pairwise_min_image_vector_data[row_sites]
+        if column_sites is not None:
+            rows = rows[..., column_sites, :]
+        return rows
+
+    def get_pair_distance_data(self, charge_list=None):
+        """Returns the distance matrix of the row sites along with the
+            distances of all site pairs in ascending order. Pairs are i < j
+            for the dense format, each standing for (i, j) and (j, i), and
+            the row sites with all other sites for the compressed format,
+            each standing for its translations over all unit cells.
+            Computed once and cached. For a charge_list, the charge-product
+            weights of the sorted pairs and the self-pair energy
+            sum_i q_i^2 / 2 are cached as well
+        :param charge_list:
+        :return: """
+        pair_distance_data = self.pair_distance_data
+        if pair_distance_data is None:
+            distance_matrix = np.concatenate([
+                    np.linalg.norm(self.get_min_image_vector_rows(row_sites),
+                                   axis=2)
+                    for row_sites in self.get_row_site_blocks()])
+            if self.precomputed_array_format == 'compressed':
+                pair_indices = np.nonzero(
+                        np.arange(self.neighbors.num_system_elements)
+                        != np.arange(self.num_row_sites)[:, None])
+                pair_multiplicity = self.num_cells
+            else:
+                pair_indices = np.triu_indices(
+                                self.neighbors.num_system_elements, k=1)
+                pair_multiplicity = 2
+            pair_distances = distance_matrix[pair_indices]
+            sort_indices = np.argsort(pair_distances, kind='stable')
+            pair_distance_data = ReturnValues(
+                distance_matrix=distance_matrix,
+                pair_indices=(pair_indices[0][sort_indices],
+                              pair_indices[1][sort_indices]),
+                pair_distances=pair_distances[sort_indices],
+                pair_multiplicity=pair_multiplicity,
+                charge_list=None)
+            self.pair_distance_data = pair_distance_data
+        if charge_list is not None and not np.array_equal(
+                                pair_distance_data.charge_list, charge_list):
+            charges = np.ravel(charge_list)
+            (site_indices_i, site_indices_j) = pair_distance_data.pair_indices
+            pair_distance_data.charge_list = np.copy(charge_list)
+            pair_distance_data.pair_weights = (
+                                    pair_distance_data.pair_multiplicity
+                                    * charges[site_indices_i]
+                                    * charges[site_indices_j])
+            pair_distance_data.self_pair_energy = np.sum(charges**2) / 2
+        return pair_distance_data
+
+    def get_distance_rows(self, row_sites):
+        """Returns the distances from the row sites to all sites, taken from
+            the cached distance matrix when available
+        :param row_sites:
+        :return: """
+        if self.pair_distance_data is not None:
+            return self.pair_distance_data.distance_matrix[row_sites]
+        return np.linalg.norm(self.get_min_image_vector_rows(row_sites), axis=2)
+
+    def get_row_site_blocks(self):
+        """Returns blocks of row sites such that a block of rows of the
+            precomputed array stays within max_row_block_elements
+        :return: """
+        row_block_size = max(1, self.max_row_block_elements
+                             // self.neighbors.num_system_elements)
+        row_site_blocks = [
+                np.arange(start_index, min(start_index + row_block_size,
+                                           self.num_row_sites))
+                for start_index in range(0, self.num_row_sites, row_block_size)]
+        return row_site_blocks
+
+    def pot_r_ewald(self, alpha, r_cut, row_sites=None):
         """Generates precomputed array with potential energy contributions from
            real-space confined to simulation cell i.e. n_max=[0, 0, 0]"""
-        precomputed_array = np.zeros((self.neighbors.num_system_elements,
+        if row_sites is None:
+            row_sites = np.arange(self.num_row_sites)
+        precomputed_array = np.zeros((len(row_sites),
                                       self.neighbors.num_system_elements))
 
         sqrt_alpha = np.sqrt(alpha)
-        dr_translated = np.linalg.norm((self.pairwise_min_image_vector_data), axis=2)
+        dr_translated = self.get_distance_rows(row_sites)
         cutoff_neighbor_pairs = dr_translated < r_cut
         precomputed_array[cutoff_neighbor_pairs] += erfc(sqrt_alpha * dr_translated[cutoff_neighbor_pairs]) / 2
 
         # avoid division for diagonal elements for original simulation cell
         num_neighbor_pairs = cutoff_neighbor_pairs.sum()
-        np.fill_diagonal(dr_translated, 1)
+        cutoff_neighbor_pairs[np.arange(len(row_sites)), row_sites] = False
         precomputed_array[cutoff_neighbor_pairs] /= dr_translated[cutoff_neighbor_pairs]
         return (precomputed_array, num_neighbor_pairs)
 
+    def get_real_space_energy(self, charge_list, alpha_data, r_cut_data):
+        """Returns the real-space energy for every alpha (rows) and r_cut
+            (columns) as cumulative sums over the pairs sorted by distance.
+            erfc is evaluated once per alpha and pair within the largest
+            r_cut
+        :param charge_list:
+        :param alpha_data:
+        :param r_cut_data:
+        :return: """
+        pair_distance_data = self.get_pair_distance_data(charge_list)
+        alpha_data = np.atleast_1d(alpha_data)
+        num_cutoff_pairs = np.searchsorted(pair_distance_data.pair_distances,
+                                           r_cut_data, side='left')
+        max_num_cutoff_pairs = np.max(num_cutoff_pairs)
+        pair_distances = pair_distance_data.pair_distances[:max_num_cutoff_pairs]
+        pair_energy_data = (
+                pair_distance_data.pair_weights[:max_num_cutoff_pairs]
+                * erfc(np.sqrt(alpha_data)[:, None] * pair_distances)
+                / (2 * pair_distances))
+        cumulative_pair_energy_data = np.concatenate(
+                            (np.zeros((len(alpha_data), 1)),
+                             np.cumsum(pair_energy_data, axis=1)), axis=1)
+        real_space_energy_data = (
+                    (pair_distance_data.self_pair_energy
+                     + cumulative_pair_energy_data[:, num_cutoff_pairs])
+                    / self.material.dielectric_constant)
+        return real_space_energy_data
+
+    def get_alpha_sequence(self, alpha, alpha_change_factor, num_alpha):
+        """Returns alpha followed by its successive products with
+            alpha_change_factor, identical to repeated in-place updates
+        :param alpha:
+        :param alpha_change_factor:
+        :param num_alpha:
+        :return: """
+        alpha_data = np.cumprod(np.concatenate(
+                    ([alpha], np.full(num_alpha - 1, alpha_change_factor))))
+        return alpha_data
+
     def get_effective_k_vectors(self, k_max):
-        k_vector_list = []
-        exclude_list = []
-        for i in range(-k_max[0], k_max[0]+1):
-            for j in range(-k_max[1], k_max[1]+1):
-                for k in range(-k_max[2], k_max[2]+1):
-                    if [i, j, k] not in exclude_list:
-                        k_vector_list.append([i, j, k])
-                        exclude_list.append([-i, -j, -k])
-        k_vector_list.remove([0, 0, 0])
-        k_vector_data = np.asarray(k_vector_list)
+        """Returns the half-space of k-vectors within k_max whose first
+            non-zero component is negative, in lexicographic order. k and -k
+            contribute equally, hence only one of them is retained"""
+        k_vector_data = np.stack(np.meshgrid(
+                            *[np.arange(-k_max_value, k_max_value + 1)
+                              for k_max_value in k_max], indexing='ij'),
+                                 axis=-1).reshape(-1, len(k_max))
+        first_non_zero_component = k_vector_data[
+                    np.arange(len(k_vector_data)),
+                    np.argmax(k_vector_data != 0, axis=1)]
+        k_vector_data = k_vector_data[first_non_zero_component < 0]
         return k_vector_data
 
+    def get_k_vector_weights(self, k_vector_data, alpha):
+        """Returns |k|^2 and the Fourier-space weight
+            (2 pi / V) exp(-k^2 / 4 alpha) / k^2 of every k-vector"""
+        k_vectors = np.dot(k_vector_data, self.reciprocal_lattice_matrix)
+        k_vector_2 = np.sum(k_vectors**2, axis=1)
+        fourier_sum_coeff = (2 * np.pi) / self.system_volume
+        k_vector_weights = (fourier_sum_coeff * np.exp(-k_vector_2 / (4 * alpha))
+                            / k_vector_2)
+        return (k_vector_2, k_vector_weights)
+
+    def get_site_phase_data(self, k_vector_data, site_indices=None):
+        """Returns exp(i k.r) of every site (columns) for every k-vector
+            (rows). Phase factors are built per reciprocal axis by
+            recurrence from exp(i b.r) such that trigonometric functions
+            are evaluated once per site and axis. site_indices restricts
+            the columns to a subset of sites"""
+        k_vector_data = np.asarray(k_vector_data, dtype=int).reshape(
+                                                        -1, self.neighbors.n_dim)
+        site_coordinates = self.neighbors.bulk_sites.cell_coordinates
+        if site_indices is not None:
+            site_coordinates = site_coordinates[site_indices]
+        unit_phase_data = np.exp(1j * np.dot(
+                                    site_coordinates,
+                                    self.reciprocal_lattice_matrix.T))
+        site_phase_data = np.ones(
+                (len(k_vector_data), len(site_coordinates)),
+                dtype=complex)
+        for axis_index in range(self.neighbors.n_dim):
+            axis_k_vector_data = k_vector_data[:, axis_index]
+            axis_k_max = np.abs(axis_k_vector_data).max(initial=0)
+            axis_phase_data = np.ones(
+                (axis_k_max + 1, len(site_coordinates)),
+                dtype=complex)
+            for multiple in range(1, axis_k_max + 1):
+                axis_phase_data[multiple] = (axis_phase_data[multiple - 1]
+                                             * unit_phase_data[:, axis_index])
+            axis_site_phase_data = axis_phase_data[np.abs(axis_k_vector_data)]
+            negative_k_indices = axis_k_vector_data < 0
+            axis_site_phase_data[negative_k_indices] = np.conj(
+                                    axis_site_phase_data[negative_k_indices])
+            site_phase_data *= axis_site_phase_data
+        return site_phase_data
+
+    def get_structure_factor_energy_contributions(self, charge_list, alpha,
+                                                  k_vector_data):
+        """Returns the Fourier-space energy contribution
+            (2 pi / V) exp(-k^2 / 4 alpha) / k^2 |S(k)|^2 of every k-vector
+            from the structure factor S(k) = sum_i q_i exp(i k.r_i)"""
+        k_vector_weights = self.get_k_vector_weights(k_vector_data, alpha)[1]
+        structure_factor_data = np.zeros(len(k_vector_data), dtype=complex)
+        for k_vector_block in self.get_k_vector_blocks(len(k_vector_data)):
+            structure_factor_data[k_vector_block] = np.dot(
+                            self.get_site_phase_data(k_vector_data[k_vector_block]),
+                            np.ravel(charge_list))
+        energy_contribution_data = (k_vector_weights
+                                    * np.abs(structure_factor_data)**2)
+        return energy_contribution_data
+
+    def get_k_vector_blocks(self, num_k_vectors):
+        """Returns slices over the k-vectors such that the site phase data
+            of a block of k-vectors stays within max_site_phase_elements
+        :param num_k_vectors:
+        :return: """
+        k_vector_block_size = max(1, self.max_site_phase_elements
+                                  // self.neighbors.num_system_elements)
+        k_vector_blocks = [slice(start_index, start_index + k_vector_block_size)
+                           for start_index in range(0, num_k_vectors,
+                                                    k_vector_block_size)]
+        return k_vector_blocks
+
+    def get_blocked_weighted_phase_product(self, k_vector_data,
+                                           k_vector_weights, row_sites=None):
+        """Returns the weighted phase product of the row sites accumulated
+            over blocks of k-vectors
+        :param k_vector_data:
+        :param k_vector_weights:
+        :param row_sites: defaults to all row sites
+        :return: """
+        if row_sites is None:
+            row_sites = np.arange(self.num_row_sites)
+        precomputed_array = np.zeros((len(row_sites),
+                                      self.neighbors.num_system_elements))
+        for k_vector_block in self.get_k_vector_blocks(len(k_vector_data)):
+            site_phase_data = self.get_site_phase_data(
+                                            k_vector_data[k_vector_block])
+            precomputed_array += self.get_weighted_phase_product(
+                            site_phase_data, k_vector_weights[k_vector_block],
+                            row_sites)
+        return precomputed_array
+
+    def get_weighted_phase_product(self, site_phase_data, k_vector_weights,
+                                   row_sites):
+        """Returns sum_k w_k cos(k.(r_j - r_i)) over the k-vectors for the
+            row sites i as one weighted product of the site phase matrices"""
+        site_phase_data = np.concatenate((site_phase_data.real,
+                                          site_phase_data.imag))
+        k_vector_weights = np.tile(k_vector_weights, 2)
+        precomputed_array = np.dot(site_phase_data[:, row_sites].T,
+                                   k_vector_weights[:, None] * site_phase_data)
+        return precomputed_array
+
     def get_cosine_data(self, k_max):
         max_k_max = max(k_max)
         unit_k_vector = np.dot(np.ones(self.neighbors.n_dim),
                                self.reciprocal_lattice_matrix)
-        unit_cosine_data = np.cos(np.tensordot(self.pairwise_min_image_vector_data, unit_k_vector, axes=([2], [0])))
-        unit_sine_data = np.sin(np.tensordot(self.pairwise_min_image_vector_data, unit_k_vector, axes=([2], [0])))
+        min_image_vector_data = self.get_min_image_vector_rows(
+                                np.arange(self.neighbors.num_system_elements))
+        unit_cosine_data = np.cos(np.tensordot(min_image_vector_data, unit_k_vector, axes=([2], [0])))
+        unit_sine_data = np.sin(np.tensordot(min_image_vector_data, unit_k_vector, axes=([2], [0])))
         cosine_data_shape = (max_k_max, unit_cosine_data.shape[0], unit_cosine_data.shape[1])
         cosine_data = np.zeros(cosine_data_shape)
         for n_index in range(1, max_k_max+1):
@@ -768,65 +1131,185 @@ class System(object):
                 cosine_data[n_index] += (-1)**(k_index / 2) * binom(n_index, k_index) * unit_cosine_data**(n_index - k_index) * unit_sine_data**k_index
         return cosine_data
 
-    def pot_k_ewald(self, k_max, alpha, k_cut):
+    def pot_k_ewald(self, k_max, alpha, k_cut, row_sites=None):
         """Updates precomputed array with potential energy contributions from
            reciprocal-space"""
-        precomputed_array = np.zeros((self.neighbors.num_system_elements,
-                                      self.neighbors.num_system_elements))
-
-        alpha4 = 4 * alpha
-        fourier_sum_coeff = (2 * np.pi) / self.system_volume
-        k_cut_2 = k_cut**2
-
         k_vector_data = self.get_effective_k_vectors(k_max)
-        for k_vector_value in k_vector_data:
-            k_vector = np.dot(k_vector_value,
-                              self.reciprocal_lattice_matrix)
-            k_vector_2 = np.dot(k_vector, k_vector)
-            if k_vector_2 < k_cut_2:
-                precomputed_array += (
-                                fourier_sum_coeff
-                                * np.exp(-k_vector_2 / alpha4)
-                                * np.cos(np.tensordot(
-                                    self.pairwise_min_image_vector_data,
-                                    k_vector, axes=([2], [0])))
-                                / k_vector_2)
+        (k_vector_2, k_vector_weights) = self.get_k_vector_weights(
+                                                        k_vector_data, alpha)
+        k_cut_indices = k_vector_2 < k_cut**2
+        precomputed_array = self.get_blocked_weighted_phase_product(
+                k_vector_data[k_cut_indices], k_vector_weights[k_cut_indices],
+                row_sites)
         # effective k_vectors only include half of all possible k_vectors
         precomputed_array *= 2
         return precomputed_array
 
-    def pot_k_ewald_with_k_vector_data(self, charge_list_prod, k_max, alpha, k_cut):
-        """Updates precomputed array with potential energy contributions from
-           reciprocal-space"""
-        precomputed_array = np.zeros((self.neighbors.num_system_elements,
+    def get_k_vector_energy_contributions(self, charge_list, alpha, k_cut):
+        """Returns the effective k-vectors along with their energy
+            contributions, which are zero beyond k_cut
+        :param charge_list:
+        :param alpha:
+        :param k_cut:
+        :return: """
+        k_vector_data = self.get_effective_k_vectors(self.get_k_max(k_cut))
+        k_cut_indices = self.get_k_vector_weights(k_vector_data, alpha)[0] < k_cut**2
+        energy_contribution_data = np.zeros(len(k_vector_data))
+        energy_contribution_data[k_cut_indices] = (
+                self.get_structure_factor_energy_contributions(
+                            charge_list, alpha, k_vector_data[k_cut_indices]))
+        return (k_vector_data, energy_contribution_data)
+
+    def get_k_max(self, k_cut):
+        """Returns the max number of multiples of reciprocal lattice length
+            vectors within k_cut
+        :param k_cut:
+        :return: """
+        k_max = np.ceil(k_cut / self.reciprocal_lattice_vector_length).astype(int)
+        return k_max
+
+    def get_bspline_weights(self, fraction_data, spline_order):
+        """Returns the cardinal B-spline values M_n(w + j), j = 0, ..., n-1,
+            of the fractional parts w of the scaled site coordinates
+        :param fraction_data:
+        :param spline_order:
+        :return: """
+        bspline_weights = np.stack((fraction_data, 1 - fraction_data), axis=-1)
+        for order in range(3, spline_order + 1):
+            shifted_fraction_data = fraction_data[..., None] + np.arange(order)
+            padded_bspline_weights = np.concatenate(
+                    (bspline_weights, np.zeros(fraction_data.shape + (1,))),
+                    axis=-1)
+            lower_bspline_weights = np.concatenate(
+                    (np.zeros(fraction_data.shape + (1,)), bspline_weights),
+                    axis=-1)
+            bspline_weights = (
+                        (shifted_fraction_data * padded_bspline_weights
+                         + (order - shifted_fraction_data)
+                         * lower_bspline_weights) / (order - 1))
+        return bspline_weights
+
+    def get_pme_data(self, alpha, k_cut):
+        """Returns the FFT grid, the B-spline interpolation matrix from
+            grid points to sites and the influence function of the smooth
+            particle-mesh Ewald sum. The influence function is restricted to
+            the k-vectors of pot_k_ewald, such that the PME sum only differs
+            from the direct sum by the B-spline interpolation error.
+            Computed once per alpha and k_cut and cached
+        :param alpha:
+        :param k_cut:
+        :return: """
+        pme_data = self.pme_data
+        if (pme_data is not None and pme_data.alpha == alpha
+                and pme_data.k_cut == k_cut):
+            return pme_data
+        spline_order = self.pme_parameters['spline_order']
+        k_max = self.get_k_max(k_cut)
+        grid_shape = np.array([
+                    next_fast_len(int(np.ceil(self.pme_parameters['grid_factor']
+                                              * (2 * axis_k_max + 1))))
+                    for axis_k_max in k_max])
+        assert np.all(grid_shape >= spline_order), \
+            'PME grid must hold at least spline_order points in all dimensions'
+
+        # B-spline interpolation matrix
+        scaled_coordinates = np.dot(self.neighbors.bulk_sites.cell_coordinates,
+                                    np.linalg.inv(self.translational_matrix)) * grid_shape
+        grid_origin_indices = np.floor(scaled_coordinates).astype(int)
+        axis_bspline_weights = self.get_bspline_weights(
+                        scaled_coordinates - grid_origin_indices, spline_order)
+        axis_grid_indices = ((grid_origin_indices[..., None]
+                              - np.arange(spline_order)) % grid_shape[:, None])
+        grid_indices = np.ravel_multi_index(
+            (axis_grid_indices[:, 0, :, None, None],
+             axis_grid_indices[:, 1, None, :, None],
+             axis_grid_indices[:, 2, None, None, :]), grid_shape)
+        bspline_weights = (axis_bspline_weights[:, 0, :, None, None]
+                           * axis_bspline_weights[:, 1, None, :, None]
+                           * axis_bspline_weights[:, 2, None, None, :])
+        num_system_elements = self.neighbors.num_system_elements
+        interpolation_matrix = csr_matrix(
+                (bspline_weights.ravel(), grid_indices.ravel(),
+                 np.arange(num_system_elements + 1) * spline_order**3),
+                shape=(num_system_elements, grid_shape.prod()))
+        interpolation_matrix.sum_duplicates()
+
+        # influence function over the k-vectors of the real FFT grid
+        axis_k_vector_data = [np.fft.fftfreq(axis_grid_size, 1 / axis_grid_size).astype(int)
+                              for axis_grid_size in grid_shape[:-1]]
+        axis_k_vector_data.append(np.fft.rfftfreq(grid_shape[-1], 1 / grid_shape[-1]).astype(int))
+        k_vector_data = np.stack(np.meshgrid(*axis_k_vector_data, indexing='ij'),
+                                 axis=-1).reshape(-1, self.neighbors.n_dim)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            (k_vector_2, k_vector_weights) = self.get_k_vector_weights(
+                                                        k_vector_data, alpha)
+        k_cut_indices = ((k_vector_2 < k_cut**2) & (k_vector_2 > 0)
+                         & np.all(np.abs(k_vector_data) <= k_max, axis=1))
+        # |b(m)|^2 of the B-spline interpolation of the structure factor
+        spline_knot_values = self.get_bspline_weights(np.zeros(1), spline_order)[0, 1:]
+        bspline_moduli = np.ones(len(k_vector_data))
+        for axis_index, axis_grid_size in enumerate(grid_shape):
+            axis_bspline_moduli = np.abs(np.dot(
+                np.exp(2j * np.pi * np.outer(axis_k_vector_data[axis_index],
+                                             np.arange(spline_order - 1))
+                       / axis_grid_size), spline_knot_values))**2
+            bspline_moduli /= axis_bspline_moduli[
+                        k_vector_data[:, axis_index] % axis_grid_size]
+        influence_function = np.zeros(len(k_vector_data))
+        influence_function[k_cut_indices] = (k_vector_weights[k_cut_indices]
+                                             * bspline_moduli[k_cut_indices])
+        pme_data = ReturnValues(
+                    alpha=alpha, k_cut=k_cut, grid_shape=grid_shape,
+                    interpolation_matrix=interpolation_matrix,
+                    influence_function=influence_function.reshape(
+                        [len(axis_k_vectors) for axis_k_vectors in axis_k_vector_data]))
+        self.pme_data = pme_data
+        return pme_data
+
+    def get_pme_grid_potential(self, pme_data, grid_charge_data):
+        """Returns the Fourier-space potential on the grid points due to
+            grid charges by one FFT convolution with the influence function.
+            Leading axes of grid_charge_data are batch axes
+        :param pme_data:
+        :param grid_charge_data:
+        :return: """
+        grid_axes = tuple(range(-self.neighbors.n_dim, 0))
+        grid_potential_data = np.fft.irfftn(
+                    np.fft.rfftn(grid_charge_data, axes=grid_axes)
+                    * pme_data.influence_function, s=tuple(pme_data.grid_shape),
+                    axes=grid_axes)
+        grid_potential_data *= pme_data.grid_shape.prod()
+        return grid_potential_data
+
+    def pot_k_pme(self, alpha, k_cut, row_sites=None):
+        """Returns the rows of the row sites of the Fourier-space precomputed
+            array with the smooth particle-mesh Ewald sum, one FFT
+            convolution per row site
+        :param alpha:
+        :param k_cut:
+        :param row_sites: defaults to all row sites
+        :return: """
+        if row_sites is None:
+            row_sites = np.arange(self.num_row_sites)
+        pme_data = self.get_pme_data(alpha, k_cut)
+        interpolation_matrix = pme_data.interpolation_matrix
+        num_grid_points = pme_data.grid_shape.prod()
+        row_block_size = max(1, self.max_site_phase_elements // num_grid_points)
+        precomputed_array = np.zeros((len(row_sites),
                                       self.neighbors.num_system_elements))
-
-        alpha4 = 4 * alpha
-        fourier_sum_coeff = (2 * np.pi) / self.system_volume
-        k_cut_2 = k_cut**2
-
-        k_vector_data = self.get_effective_k_vectors(k_max)
-        num_vectors = len(k_vector_data)
-        energy_contribution_data = np.zeros(num_vectors)
-        for k_vector_index, k_vector_value in enumerate(k_vector_data):
-            k_vector = np.dot(np.asarray(k_vector_value),
-                              self.reciprocal_lattice_matrix)
-            k_vector_2 = np.dot(k_vector, k_vector)
-            if k_vector_2 < k_cut_2:
-                k_vector_precomputed_array = (
-                                fourier_sum_coeff
-                                * np.exp(-k_vector_2 / alpha4)
-                                * np.cos(np.tensordot(
-                                    self.pairwise_min_image_vector_data,
-                                    k_vector, axes=([2], [0])))
-                                / k_vector_2)
-                energy_contribution_data[k_vector_index] = np.sum(np.multiply(charge_list_prod, k_vector_precomputed_array))
-                precomputed_array += k_vector_precomputed_array
-            else:
-                energy_contribution_data[k_vector_index] = 0
-        # effective k_vectors only include half of all possible k_vectors
-        precomputed_array *= 2
-        return (precomputed_array, k_vector_data, energy_contribution_data)
+        for start_index in range(0, len(row_sites), row_block_size):
+            block_indices = np.arange(start_index,
+                                      min(start_index + row_block_size,
+                                          len(row_sites)))
+            grid_charge_data = interpolation_matrix[
+                    row_sites[block_indices]].toarray().reshape(
+                            (len(block_indices),) + tuple(pme_data.grid_shape))
+            grid_potential_data = self.get_pme_grid_potential(pme_data,
+                                                              grid_charge_data)
+            precomputed_array[block_indices] = (
+                    interpolation_matrix
+                    @ grid_potential_data.reshape(len(block_indices), -1).T).T
+        return precomputed_array
 
     def benchmark_ewald(self, num_repeats, benchmark_parameters):
         k_max = benchmark_parameters['k_max']
@@ -834,6 +1317,9 @@ class System(object):
         r_cut = benchmark_parameters['r_cut']
         k_cut = benchmark_parameters['k_cut']
 
+        # time the real-space sum over cached pair distances rather than the
+        # min image vectors computed on demand
+        self.get_pair_distance_data()
         start_time_r = datetime.now()
         for _ in range(num_repeats):
             self.pot_r_ewald(alpha, r_cut)
@@ -850,7 +1336,8 @@ class System(object):
         time_elapsed_f = end_time_f - start_time_f
         time_elapsed_f_seconds = time_elapsed_f.total_seconds()
         num_k_vectors = np.ceil(np.prod(2 * k_max + 1) * np.pi / 6 - 1).astype(int)
-        tau_f = time_elapsed_f_seconds / num_repeats / self.neighbors.num_system_elements**2 / num_k_vectors
+        tau_f = (time_elapsed_f_seconds / num_repeats
+                 / (self.num_row_sites * self.neighbors.num_system_elements) / num_k_vectors)
 
         tau_ratio = tau_r / tau_f
         time_ratio = time_elapsed_r_seconds / time_elapsed_f_seconds
@@ -901,38 +1388,91 @@ class System(object):
         prefix_list.append(f'Fourier-space cutoff error: {fourier_space_cutoff_error:.3e}\n\n')
         return prefix_list
 
-    def convergence_check_with_r_cut(self, charge_list_prod, alpha, r_cut_max, lower_bound, upper_bound):
+    def compute_pme_errors(self, alpha, k_cut, prefix_list):
+        """Reports the deviation of the PME Fourier-space precomputed array
+            from the direct sum over k-vectors, evaluated for up to
+            num_pme_error_sites rows and columns spread over the system"""
+        num_system_elements = self.neighbors.num_system_elements
+        row_sites = np.unique(np.linspace(0, self.num_row_sites - 1,
+                                          min(self.num_row_sites, self.num_pme_error_sites)).astype(int))
+        column_sites = np.unique(np.linspace(0, num_system_elements - 1,
+                                             min(num_system_elements, self.num_pme_error_sites)).astype(int))
+        k_vector_data = self.get_effective_k_vectors(self.get_k_max(k_cut))
+        (k_vector_2, k_vector_weights) = self.get_k_vector_weights(k_vector_data, alpha)
+        k_cut_indices = k_vector_2 < k_cut**2
+        k_vector_data = k_vector_data[k_cut_indices]
+        k_vector_weights = k_vector_weights[k_cut_indices]
+        direct_precomputed_array_fourier = np.zeros((len(row_sites), len(column_sites)))
+        for k_vector_block in self.get_k_vector_blocks(len(k_vector_data)):
+            site_phase_data = self.get_site_phase_data(k_vector_data[k_vector_block],
+                                                       np.concatenate((row_sites, column_sites)))
+            site_phase_data = np.concatenate((site_phase_data.real, site_phase_data.imag))
+            block_k_vector_weights = np.tile(k_vector_weights[k_vector_block], 2)
+            direct_precomputed_array_fourier += np.dot(
+                    site_phase_data[:, :len(row_sites)].T,
+                    block_k_vector_weights[:, None] * site_phase_data[:, len(row_sites):])
+        # effective k_vectors only include half of all possible k_vectors
+        direct_precomputed_array_fourier *= 2 / self.material.dielectric_constant
+        precomputed_array_fourier = self.get_precomputed_array_fourier(alpha, k_cut, row_sites)
+        pme_error = np.max(np.abs(precomputed_array_fourier[:, column_sites]
+                                  - direct_precomputed_array_fourier))
+        relative_pme_error = pme_error / np.max(np.abs(direct_precomputed_array_fourier))
+        pme_data = self.get_pme_data(alpha, k_cut)
+        prefix_list.append(f'PME grid: [{",".join(str(element) for element in pme_data.grid_shape)}]; '
+                           f'B-spline order: {self.pme_parameters["spline_order"]}\n')
+        prefix_list.append(f'PME Fourier-space error over {len(row_sites)} x {len(column_sites)} site pairs: '
+                           f'{pme_error / constants.EV2HARTREE:.3e} eV (relative: {relative_pme_error:.3e})\n\n')
+        return prefix_list
+
+    def compute_storage_errors(self, max_element_deviation, max_potential_deviation, energy_deviation, prefix_list):
+        """Reports the deviation of the stored precomputed array from
+            float64. The delG0 bound follows from delG0 = 2 q (phi_new -
+            phi_old + q (A_oo - A_on)) with the site potential deviation of
+            the lattice charges, and the rate deviation from the change of
+            the Marcus barrier by half of delG0"""
+        max_species_charge = max(np.max(np.abs(species_charge_list))
+                                 for species_charge_list in self.material.species_charge_list.values())
+        delg_0_deviation = (4 * max_species_charge
+                            * (max_potential_deviation + max_species_charge * max_element_deviation))
+        rate_deviation = np.expm1(delg_0_deviation / (2 * self.storage_error_temperature * constants.K2AUTEMP))
+        prefix_list.append(f'Maximum element deviation from float64: '
+                           f'{max_element_deviation / constants.EV2HARTREE:.3e} eV\n')
+        prefix_list.append(f'Maximum site potential deviation from float64: '
+                           f'{max_potential_deviation / constants.V2AUPOT:.3e} V\n')
+        prefix_list.append(f'Energy deviation from float64: {energy_deviation / constants.EV2HARTREE:.3e} eV\n')
+        prefix_list.append(f'delG0 deviation bound: {delg_0_deviation / constants.EV2HARTREE:.3e} eV '
+                           f'({"within" if delg_0_deviation <= self.err_tol else "exceeds"} err_tol)\n')
+        prefix_list.append(f'Relative rate deviation bound at {self.storage_error_temperature} K: '
+                           f'{rate_deviation:.3e}\n\n')
+        return prefix_list
+
+    def convergence_check_with_r_cut(self, charge_list, alpha, r_cut_max, lower_bound, upper_bound):
+        """Returns the convergence status of the real-space energy between
+            the r_cut bounds for alpha, or for each value of an array of
+            alpha"""
         r_cut_lower = lower_bound * r_cut_max
         r_cut_upper = upper_bound * r_cut_max
-        precomputed_array_real = self.get_precomputed_array_real(alpha, r_cut_lower)
-        real_space_energy_lower = np.sum(np.multiply(charge_list_prod, precomputed_array_real))
-
-        precomputed_array_real = self.get_precomputed_array_real(alpha, r_cut_upper)
-        real_space_energy_upper = np.sum(np.multiply(charge_list_prod, precomputed_array_real))
-        if abs(real_space_energy_lower - real_space_energy_upper) < self.err_tol:
-            convergence_status = 1
-        else:
-            convergence_status = 0
+        real_space_energy_data = self.get_real_space_energy(charge_list, alpha, [r_cut_lower, r_cut_upper])
+        convergence_status = (abs(real_space_energy_data[:, 0] - real_space_energy_data[:, 1])
+                              < self.err_tol).astype(int)
+        if np.ndim(alpha) == 0:
+            convergence_status = convergence_status[0]
         return convergence_status
 
-    def get_energy_profile_with_r_cut(self, charge_list_prod, alpha, r_cut_max,
+    def get_energy_profile_with_r_cut(self, charge_list, alpha, r_cut_max,
                                       lower_bound, upper_bound, num_data_points):
         # compute real-space energy by varying r_cut
         r_cut_lower = lower_bound * r_cut_max
         r_cut_upper = upper_bound * r_cut_max
         r_cut_data = np.linspace(r_cut_lower, r_cut_upper, num_data_points)
-        real_space_energy_data = np.zeros(int(num_data_points))
-        for r_cut_index, r_cut in enumerate(r_cut_data):
-            precomputed_array_real = self.get_precomputed_array_real(alpha, r_cut)
-            real_space_energy_data[r_cut_index] = np.sum(np.multiply(charge_list_prod, precomputed_array_real))
+        real_space_energy_data = self.get_real_space_energy(charge_list, alpha, r_cut_data)
+        if np.ndim(alpha) == 0:
+            real_space_energy_data = real_space_energy_data[0]
         return (r_cut_data, real_space_energy_data)
 
-    def convergence_check_with_k_cut(self, charge_list_prod, alpha, k_cut_lower, k_cut_upper):
-        precomputed_array_fourier = self.get_precomputed_array_fourier(alpha, k_cut_lower)[0]
-        fourier_space_energy_lower = np.sum(np.multiply(charge_list_prod, precomputed_array_fourier))
-
-        precomputed_array_fourier = self.get_precomputed_array_fourier(alpha, k_cut_upper)[0]
-        fourier_space_energy_upper = np.sum(np.multiply(charge_list_prod, precomputed_array_fourier))
+    def convergence_check_with_k_cut(self, charge_list, alpha, k_cut_lower, k_cut_upper):
+        (fourier_space_energy_lower, fourier_space_energy_upper) = self.get_fourier_space_energy(
+                                    charge_list, alpha, np.array([k_cut_lower, k_cut_upper]))
 
         energy_difference = abs(fourier_space_energy_lower - fourier_space_energy_upper)
         if energy_difference < self.err_tol:
@@ -941,14 +1481,11 @@ class System(object):
             convergence_status = 0
         return convergence_status
 
-    def get_energy_profile_with_k_cut(self, charge_list_prod, alpha, k_cut_lower,
+    def get_energy_profile_with_k_cut(self, charge_list, alpha, k_cut_lower,
                                       k_cut_upper, num_data_points):
-        # compute fourier-space energy by varying r_cut
+        # compute fourier-space energy by varying k_cut
         k_cut_data = np.linspace(k_cut_lower, k_cut_upper, num_data_points)
-        fourier_space_energy_data = np.zeros(int(num_data_points))
-        for k_cut_index, k_cut in enumerate(k_cut_data):
-            precomputed_array_fourier = self.get_precomputed_array_fourier(alpha, k_cut)[0]
-            fourier_space_energy_data[k_cut_index] = np.sum(np.multiply(charge_list_prod, precomputed_array_fourier))
+        fourier_space_energy_data = self.get_fourier_space_energy(charge_list, alpha, k_cut_data)
         return (k_cut_data, fourier_space_energy_data)
 
     def check_for_k_cut_step_energy_convergence(self, step_energy_k_cut_data, energy_changes, k_cut_lower, k_cut_upper):
@@ -962,47 +1499,72 @@ class System(object):
             convergence_status = 0
         return convergence_status
 
-    def get_convergence_rcut(self, charge_list_prod, alpha, r_cut_max, lower_bound, upper_bound):
-
+    def get_convergence_rcut(self, charge_list, alpha, r_cut_max, lower_bound, upper_bound):
+        """Returns the r_cut beyond which the real-space energy is converged
+            for alpha, or for each value of an array of alpha"""
         (r_cut_data, real_space_energy_data) = self.get_energy_profile_with_r_cut(
-            charge_list_prod, alpha, r_cut_max, lower_bound, upper_bound, self.num_data_points_low)
-
-        real_space_energy_deviation = np.abs(real_space_energy_data - real_space_energy_data[-1])
-        indices_of_non_convergence = np.where(real_space_energy_deviation > self.err_tol)[0]
-        if len(indices_of_non_convergence) == 0:
-            r_cut_convergence = r_cut_data[0]
-        else:
-            r_cut_convergence = r_cut_data[indices_of_non_convergence.max() + 1]
+            charge_list, np.atleast_1d(alpha), r_cut_max, lower_bound, upper_bound, self.num_data_points_low)
+
+        real_space_energy_deviation = np.abs(real_space_energy_data - real_space_energy_data[:, -1:])
+        non_convergence = real_space_energy_deviation > self.err_tol
+        num_data_points = non_convergence.shape[1]
+        # index following the last non-converged r_cut
+        convergence_indices = np.where(non_convergence.any(axis=1),
+                                       num_data_points - np.argmax(non_convergence[:, ::-1], axis=1),
+                                       0)
+        r_cut_convergence = r_cut_data[convergence_indices]
+        if np.ndim(alpha) == 0:
+            r_cut_convergence = r_cut_convergence[0]
         return r_cut_convergence
 
-    def get_simulation_cell_real_space_parameters(self, charge_list_prod, charge_list_einsum, real_space_parameters, x_real_initial_guess, dst_path):
+    def get_simulation_cell_real_space_parameters(self, charge_list, charge_list_einsum, real_space_parameters,
+                                                  x_real_initial_guess, dst_path):
         r_cut_max = min(self.translational_vector_length) / 2
         initial_fractional_r_cut = 0.75
         real_space_parameters['r_cut'] = initial_fractional_r_cut * r_cut_max
         # optimize real-space cutoff error for alpha
         real_space_parameters = self.minimize_real_space_cutoff_error(charge_list_einsum, real_space_parameters, x_real_initial_guess)
         alpha = real_space_parameters['alpha']
+        # number of alpha values examined at once in the alpha searches
+        alpha_block_size = 8
 
         alpha_percent_increase = 10
         print(f'Attempting to find best alpha towards converging real-space energy within the simulation cell:\n')
         print(f'Starting with an estimate for alpha={alpha * constants.ANG2BOHR:.3e} / angstrom')
-        while not self.convergence_check_with_r_cut(charge_list_prod, alpha, r_cut_max,
-                                                   self.threshold_fraction, self.upper_bound_rcut):
-            alpha = (1 + alpha_percent_increase / 100) * alpha
-            print(f'Couldn\'t find real-space energy convergence within simulation cell. Re-attempting with {alpha_percent_increase} % increased alpha={alpha * constants.ANG2BOHR:.3e} / angstrom')
+        while True:
+            alpha_data = self.get_alpha_sequence(alpha, 1 + alpha_percent_increase / 100, alpha_block_size + 1)
+            convergence_status = self.convergence_check_with_r_cut(charge_list, alpha_data[:-1], r_cut_max,
+                                                                   self.threshold_fraction, self.upper_bound_rcut)
+            num_attempts = np.argmax(convergence_status) if convergence_status.any() else alpha_block_size
+            for alpha in alpha_data[1:num_attempts+1]:
+                print(f'Couldn\'t find real-space energy convergence within simulation cell. Re-attempting with '
+                      f'{alpha_percent_increase} % increased alpha={alpha * constants.ANG2BOHR:.3e} / angstrom')
+            alpha = alpha_data[num_attempts]
+            if convergence_status.any():
+                break
 
         print(f'Preliminary convergence in real-space energy achieved at alpha={alpha * constants.ANG2BOHR:.3e} / angstrom\n')
         alpha_convergence = alpha
-        r_cut_convergence = self.get_convergence_rcut(charge_list_prod, alpha_convergence, r_cut_max, self.lower_bound_real, self.upper_bound_rcut)
+        r_cut_convergence = self.get_convergence_rcut(charge_list, alpha_convergence, r_cut_max,
+                                                      self.lower_bound_real, self.upper_bound_rcut)
         print(f'alpha={alpha_convergence * constants.ANG2BOHR:.3e} / angstrom; r_cut={r_cut_convergence / r_cut_max:.3f} max L/2')
         alpha_vs_fraction_r_cut_convergence = []
         alpha_vs_fraction_r_cut_convergence.append([alpha_convergence, r_cut_convergence / r_cut_max])
 
         alpha_percent_decrease = 5
         print(f'Attempting to achieve convergence above {self.threshold_fraction * 100:.1f} % of max L/2:')
+        alpha_data = r_cut_new_data = []
+        block_index = 0
         while r_cut_convergence / r_cut_max < self.threshold_fraction:
-            alpha_new = (1 - alpha_percent_decrease / 100) * alpha_convergence
-            r_cut_new = self.get_convergence_rcut(charge_list_prod, alpha_new, r_cut_max, self.lower_bound_real, self.upper_bound_rcut)
+            if block_index == len(alpha_data):
+                alpha_data = self.get_alpha_sequence(alpha_convergence, 1 - alpha_percent_decrease / 100,
+                                                     alpha_block_size + 1)[1:]
+                r_cut_new_data = self.get_convergence_rcut(charge_list, alpha_data, r_cut_max,
+                                                           self.lower_bound_real, self.upper_bound_rcut)
+                block_index = 0
+            alpha_new = alpha_data[block_index]
+            r_cut_new = r_cut_new_data[block_index]
+            block_index += 1
             if r_cut_new / r_cut_max < self.upper_bound_rcut:
                 r_cut_convergence = r_cut_new
                 alpha_convergence = alpha_new
@@ -1019,7 +1581,7 @@ class System(object):
         lower_bound = 0.7500
         print(f'Generating energy profile between {lower_bound:.3f} and {self.upper_bound_rcut:.3f} fractions of max L/2')
         (r_cut_data, real_space_energy_data) = self.get_energy_profile_with_r_cut(
-            charge_list_prod, alpha_convergence, r_cut_max, lower_bound, self.upper_bound_rcut, self.num_data_points_high)
+            charge_list, alpha_convergence, r_cut_max, lower_bound, self.upper_bound_rcut, self.num_data_points_high)
 
         fig1 = plt.figure()        
         ax = fig1.add_subplot(111)
@@ -1067,37 +1629,104 @@ class System(object):
         plt.close()
         return None
 
-    def get_new_k_vectors(self, k_cut0, k_cut1):
-        k_cut0_2 = k_cut0**2
-        k_cut1_2 = k_cut1**2
+    def get_k_vector_thresholds(self, k_vector_data):
+        """Returns the k_cut above which each k-vector enters the
+            Fourier-space sum, i.e. |k| < k_cut and the k-vector lies within
+            k_max = ceil(k_cut / |b|)"""
+        k_vector_length = np.linalg.norm(
+                np.dot(k_vector_data, self.reciprocal_lattice_matrix), axis=1)
+        k_max_threshold = np.max((np.abs(k_vector_data) - 1)
+                                 * self.reciprocal_lattice_vector_length, axis=1)
+        k_vector_thresholds = np.maximum(k_vector_length, k_max_threshold)
+        return k_vector_thresholds
+
+    def get_new_k_vectors(self, k_cut0, k_cut1, half_space=0):
+        """Returns the k-vectors entering the Fourier-space sum as k_cut
+            increases from k_cut0 to k_cut1
+        :param k_cut0:
+        :param k_cut1:
+        :param half_space: return only the effective half of the k-vectors
+        :return: """
         k_max = np.ceil(k_cut1 / self.reciprocal_lattice_vector_length).astype(int)
-        new_k_vectors = []
-        for i in range(-k_max[0], k_max[0]+1):
-            for j in range(-k_max[1], k_max[1]+1):
-                for k in range(-k_max[2], k_max[2]+1):
-                    k_vector = np.dot(np.array([i, j, k]),
-                                      self.reciprocal_lattice_matrix)
-                    k_vector_2 = np.dot(k_vector, k_vector)
-                    if k_vector_2 >= k_cut0_2 and k_vector_2 < k_cut1_2:
-                        new_k_vectors.append([i, j, k])
+        if half_space:
+            k_vector_data = self.get_effective_k_vectors(k_max)
+        else:
+            k_vector_data = np.stack(np.meshgrid(
+                                *[np.arange(-k_max_value, k_max_value + 1)
+                                  for k_max_value in k_max], indexing='ij'),
+                                     axis=-1).reshape(-1, len(k_max))
+            k_vector_data = k_vector_data[np.any(k_vector_data != 0, axis=1)]
+        k_vector_thresholds = self.get_k_vector_thresholds(k_vector_data)
+        new_k_vectors = k_vector_data[(k_vector_thresholds >= k_cut0)
+                                      & (k_vector_thresholds < k_cut1)]
         return new_k_vectors
 
-    def get_k_vector_energy_contribution(self, charge_list_prod, alpha, k_vector):
-        alpha4 = 4 * alpha
-        fourier_sum_coeff = (2 * np.pi) / self.system_volume
-
-        k_vector_exact = np.dot(k_vector, self.reciprocal_lattice_matrix)
-        k_vector_exact_2 = np.dot(k_vector_exact, k_vector_exact)
-        precomputed_array = (fourier_sum_coeff * np.exp(-k_vector_exact_2 / alpha4)
-                             * np.cos(np.tensordot(
-                                 self.pairwise_min_image_vector_data,
-                                 k_vector_exact, axes=([2], [0])))
-                             / k_vector_exact_2)
-
-        energy_contribution = np.sum(np.multiply(charge_list_prod, precomputed_array))
+    def get_k_vector_energy_ledger(self, charge_list, alpha, k_cut):
+        """Returns the ledger of Fourier-space energy contributions of the
+            k-vectors entering the Fourier-space sum below k_cut, sorted by
+            their k_cut thresholds. The ledger of the previous call is
+            extended with the new k-vectors only if alpha and charges are
+            unchanged
+        :param charge_list:
+        :param alpha:
+        :param k_cut:
+        :return: """
+        ledger = self.k_vector_energy_ledger
+        if (ledger is None or ledger.alpha != alpha
+                or not np.array_equal(ledger.charge_list, charge_list)):
+            ledger = ReturnValues(
+                        alpha=alpha, charge_list=np.copy(charge_list), k_cut=0,
+                        k_vector_data=np.zeros((0, self.neighbors.n_dim), int),
+                        k_vector_thresholds=np.zeros(0),
+                        energy_contribution_data=np.zeros(0),
+                        cumulative_energy_data=np.zeros(1))
+            self.k_vector_energy_ledger = ledger
+        if k_cut > ledger.k_cut:
+            new_k_vectors = self.get_new_k_vectors(ledger.k_cut, k_cut,
+                                                   half_space=1)
+            # effective k_vectors only include half of all possible k_vectors
+            new_energy_contribution_data = (
+                2 * self.get_structure_factor_energy_contributions(
+                                            charge_list, alpha, new_k_vectors)
+                / self.material.dielectric_constant)
+            k_vector_data = np.concatenate((ledger.k_vector_data,
+                                            new_k_vectors))
+            k_vector_thresholds = np.concatenate((
+                                    ledger.k_vector_thresholds,
+                                    self.get_k_vector_thresholds(new_k_vectors)))
+            energy_contribution_data = np.concatenate((
+                    ledger.energy_contribution_data, new_energy_contribution_data))
+            sort_indices = np.argsort(k_vector_thresholds, kind='stable')
+            ledger.k_vector_data = k_vector_data[sort_indices]
+            ledger.k_vector_thresholds = k_vector_thresholds[sort_indices]
+            ledger.energy_contribution_data = energy_contribution_data[
+                                                                sort_indices]
+            ledger.cumulative_energy_data = np.concatenate((
+                            [0], np.cumsum(ledger.energy_contribution_data)))
+            ledger.k_cut = k_cut
+        return ledger
+
+    def get_fourier_space_energy(self, charge_list, alpha, k_cut_data):
+        """Returns the Fourier-space energy at each k_cut as a prefix sum of
+            the k-vector energy ledger
+        :param charge_list:
+        :param alpha:
+        :param k_cut_data:
+        :return: """
+        ledger = self.get_k_vector_energy_ledger(charge_list, alpha,
+                                                 np.max(k_cut_data))
+        num_k_vectors = np.searchsorted(ledger.k_vector_thresholds, k_cut_data,
+                                        side='left')
+        fourier_space_energy_data = ledger.cumulative_energy_data[num_k_vectors]
+        return fourier_space_energy_data
+
+    def get_k_vector_energy_contribution(self, charge_list, alpha, k_vector):
+        energy_contribution = self.get_structure_factor_energy_contributions(
+                                            charge_list, alpha, [k_vector])[0]
         return energy_contribution
 
-    def get_k_vector_based_energy_contribution(self, charge_list_prod, alpha, k_cut0_of_step_change, k_cut1_of_step_change, prefix_list):
+    def get_k_vector_based_energy_contribution(self, charge_list, alpha, k_cut0_of_step_change,
+                                               k_cut1_of_step_change, prefix_list):
         num_steps = len(k_cut0_of_step_change)
         new_k_vectors_list = []
         num_new_k_vectors = np.zeros(num_steps, int)
@@ -1110,10 +1739,8 @@ class System(object):
         new_k_vectors_consolidated = np.asarray([k_vector for new_k_vectors in new_k_vectors_list for k_vector in new_k_vectors])
         num_new_k_vectors_consolidated = len(new_k_vectors_consolidated)
         print(f'Identified a total of {num_new_k_vectors_consolidated} k-vectors contributing towards energy changes')
-        energy_contribution_data = np.zeros(num_new_k_vectors_consolidated)
-        for k_vector_index in range(num_new_k_vectors_consolidated):
-            k_vector = new_k_vectors_consolidated[k_vector_index]
-            energy_contribution_data[k_vector_index] = self.get_k_vector_energy_contribution(charge_list_prod, alpha, k_vector)
+        energy_contribution_data = self.get_structure_factor_energy_contributions(
+                            charge_list, alpha, new_k_vectors_consolidated)
 
         # sorting in descending order
         sort_indices = np.argsort(energy_contribution_data)[::-1]
@@ -1126,7 +1753,7 @@ class System(object):
             prefix_list.append(f'{k_vector[0]:4d} {k_vector[1]:4d} {k_vector[2]:4d}: {energy_contribution / constants.EV2HARTREE:.3e} eV\n')
         return prefix_list
 
-    def get_precise_step_change_data(self, charge_list_prod, alpha,
+    def get_precise_step_change_data(self, charge_list, alpha,
                                      k_cut_lower, k_cut_upper, dst_path,
                                      sub_prefix_list):
         k_max_lower = np.ceil(k_cut_lower / self.reciprocal_lattice_vector_length).astype(int)
@@ -1137,7 +1764,7 @@ class System(object):
         print(f'Maximum number of k-vectors vary from {num_k_vectors_lower} to {num_k_vectors_upper}')
 
         (k_cut_data, fourier_space_energy_data) = self.get_energy_profile_with_k_cut(
-                    charge_list_prod, alpha, k_cut_lower, k_cut_upper, self.num_data_points_high)
+                    charge_list, alpha, k_cut_lower, k_cut_upper, self.num_data_points_high)
 
         title_suffix = f'_{int(self.lower_bound_kcut)}x-{int(self.upper_bound_kcut)}x k_estimate'
         self.plot_energy_profile_in_bounded_k_cut(k_cut_data, fourier_space_energy_data, title_suffix, dst_path)
@@ -1165,7 +1792,7 @@ class System(object):
             print(f'k_max vary from [{",".join(str(element) for element in k_max_lower)}] to [{",".join(str(element) for element in k_max_upper)}]')
             print(f'Maximum number of k-vectors vary from {num_k_vectors_lower} to {num_k_vectors_upper}')
             (step_k_cut_data, step_fourier_space_energy_data) = self.get_energy_profile_with_k_cut(
-                        charge_list_prod, alpha, k_cut_lower, k_cut_upper, self.step_change_data_points)
+                        charge_list, alpha, k_cut_lower, k_cut_upper, self.step_change_data_points)
             title_suffix = f'_step{step_index+1}'
             self.plot_energy_profile_in_bounded_k_cut(step_k_cut_data, step_fourier_space_energy_data, title_suffix, dst_path)
 
@@ -1231,15 +1858,16 @@ class System(object):
         print(f'Step energy changes have {convergence_keyword}converged\n')
         return (k_cut_stringent, sub_prefix_list)
 
-    def get_optimized_r_cut(self, charge_list_prod, alpha, choice_parameters,
+    def get_optimized_r_cut(self, charge_list, alpha, choice_parameters,
                             dst_path, prefix_list):
         r_cut_max = min(self.translational_vector_length) / 2
         
         (r_cut_data, real_space_energy_data) = self.get_energy_profile_with_r_cut(
-            charge_list_prod, alpha, r_cut_max, self.lower_bound_rcut, self.upper_bound_rcut, self.num_data_points_high)
+            charge_list, alpha, r_cut_max, self.lower_bound_rcut, self.upper_bound_rcut, self.num_data_points_high)
 
         # check for energy-convergence with r_cut at user-specified alpha between 0 to L/2
-        if self.convergence_check_with_r_cut(charge_list_prod, alpha, r_cut_max, self.threshold_fraction, self.upper_bound_rcut):
+        if self.convergence_check_with_r_cut(charge_list, alpha, r_cut_max, self.threshold_fraction,
+                                             self.upper_bound_rcut):
             converged_real_space_energy = real_space_energy_data[-1]
             # get more precise r_cut by looking at the convergence point.
             if self.precise_r_cut:
@@ -1247,7 +1875,7 @@ class System(object):
                 upper_bound = r_cut_data[abs(real_space_energy_data - converged_real_space_energy) < self.err_tol][0] / r_cut_max
     
                 (r_cut_data_local, real_space_energy_data_local) = self.get_energy_profile_with_r_cut(
-                    charge_list_prod, alpha, r_cut_max, lower_bound, upper_bound, self.num_data_points_high)
+                    charge_list, alpha, r_cut_max, lower_bound, upper_bound, self.num_data_points_high)
                 r_cut = r_cut_data_local[abs(real_space_energy_data_local - converged_real_space_energy) < self.err_tol][0]
             else:
                 r_cut = r_cut_data[abs(real_space_energy_data - converged_real_space_energy) < self.err_tol][0]
@@ -1309,15 +1937,15 @@ class System(object):
         # Assumption for the accuracy analysis
         ion_charge_type = 'full'
         charge_list = self.base_charge_config_for_accuracy_analysis(ion_charge_type)
-        charge_list_prod = np.multiply(charge_list.transpose(), charge_list)
-        charge_list_einsum = np.einsum('ii', charge_list_prod)
+        charge_list_einsum = np.einsum('ij,ij', charge_list, charge_list)
 
         x_real_initial_guess = 0.5
         x_fourier_initial_guess = 0.5
         volume_derived_length = np.power(self.system_volume, 1/3)
         # real space contribution confined to the simulation cell
         if self.r_cut == 'simulation_cell':
-            real_space_parameters = self.get_simulation_cell_real_space_parameters(charge_list_prod, charge_list_einsum, real_space_parameters, x_real_initial_guess, dst_path)
+            real_space_parameters = self.get_simulation_cell_real_space_parameters(
+                            charge_list, charge_list_einsum, real_space_parameters, x_real_initial_guess, dst_path)
             alpha = real_space_parameters['alpha']
             r_cut = real_space_parameters['r_cut']
 
@@ -1376,7 +2004,7 @@ class System(object):
             k_cut_upper = self.upper_bound_kcut * k_cut_estimate
             k_cut_threshold = self.threshold_fraction * k_cut_upper
             # check for convergence in the absolute value of energy with k_cut
-            while not self.convergence_check_with_k_cut(charge_list_prod, alpha, k_cut_threshold, k_cut_upper):
+            while not self.convergence_check_with_k_cut(charge_list, alpha, k_cut_threshold, k_cut_upper):
                 k_cut_upper = (1 + percent_increase_in_k_cut_upper / 100) * k_cut_upper
                 print(f'Could not find convergence in given k_cut range. Re-attempting with upper bound increased by {percent_increase_in_k_cut_upper:.3f} %')
             sub_prefix_list_01.append(f'Preliminary convergence in Fourier-space energy achieved at k_cut: {k_cut_upper * constants.ANG2BOHR:.3e} / angstrom\n')
@@ -1391,7 +2019,7 @@ class System(object):
             (k_cut_data, k_cut0_of_step_change, k_cut1_of_step_change,
              energy_changes, max_divergent_k_cut, sub_prefix_list_01
              ) = self.get_precise_step_change_data(
-                 charge_list_prod, alpha, k_cut_lower, k_cut_upper,
+                 charge_list, alpha, k_cut_lower, k_cut_upper,
                  output_dir_path, sub_prefix_list_01)
 
             # NOTE: k_cut outputted below is the k_cut_stringent
@@ -1403,7 +2031,7 @@ class System(object):
             # analyze the k-vectors and their energy contributions towards Fourier-space energy
             sub_prefix_list_02 = []
             sub_prefix_list_02 = self.get_k_vector_based_energy_contribution(
-                                charge_list_prod, alpha, k_cut0_of_step_change,
+                                charge_list, alpha, k_cut0_of_step_change,
                                 k_cut1_of_step_change, sub_prefix_list_02)
 
             file_name = 'k_vector_energy_contribution'
@@ -1423,7 +2051,7 @@ class System(object):
                 k_cut = fourier_space_parameters['k_cut']
             elif np.isreal(self.alpha) & (np.isreal(self.k_cut) or isinstance(self.k_cut, list)):
                 r_cut = self.get_optimized_r_cut(
-                            charge_list_prod, alpha, choice_parameters,
+                            charge_list, alpha, choice_parameters,
                             dst_path, prefix_list)
             elif np.isreal(self.r_cut) and (np.isreal(self.k_cut) or isinstance(self.k_cut, list)):
                 # optimize real-space cutoff error for alpha
@@ -1431,7 +2059,7 @@ class System(object):
                 alpha = real_space_parameters['alpha']
             elif np.isreal(self.alpha):
                 r_cut = self.get_optimized_r_cut(
-                            charge_list_prod, alpha, choice_parameters,
+                            charge_list, alpha, choice_parameters,
                             dst_path, prefix_list)
                 print(f'Convergence in real-space energy achieved at alpha={alpha * constants.ANG2BOHR:.3e} / angstrom with r_cut:{r_cut / constants.ANG2BOHR:.3e}\n')
 
@@ -1452,7 +2080,7 @@ class System(object):
 
                 # explore real-space convergence for r_cut
                 r_cut = self.get_optimized_r_cut(
-                            charge_list_prod, alpha, choice_parameters,
+                            charge_list, alpha, choice_parameters,
                             dst_path, prefix_list)
             else:
                 # current implementation of pot_k_ewald has O(N^2) complexity resulting in N-independt expression for alpha 
@@ -1462,7 +2090,7 @@ class System(object):
 
                 # explore real-space convergence for r_cut
                 r_cut = self.get_optimized_r_cut(
-                            charge_list_prod, alpha, choice_parameters,
+                            charge_list, alpha, choice_parameters,
                             dst_path, prefix_list)
 
                 # optimize fourier-space cutoff error for k_cut
@@ -1505,49 +2133,58 @@ class System(object):
                             'k_cut': k_cut}
         return (ewald_parameters, prefix_list, dst_path)
 
-    def get_precomputed_array_real(self, alpha, r_cut):
-        precomputed_array_real = self.pot_r_ewald(alpha, r_cut)[0] / self.material.dielectric_constant
+    def get_precomputed_array_real(self, alpha, r_cut, row_sites=None):
+        precomputed_array_real = self.pot_r_ewald(alpha, r_cut, row_sites)[0] / self.material.dielectric_constant
         return precomputed_array_real
 
-    def get_precomputed_array_fourier(self, alpha, k_cut):
-        k_max = np.ceil(k_cut / self.reciprocal_lattice_vector_length).astype(int)  # max number of multiples of reciprocal lattice length vectors
-        num_k_vectors = np.ceil(np.prod(2 * k_max + 1) * np.pi / 6 - 1).astype(int)
-        precomputed_array_fourier = self.pot_k_ewald(k_max, alpha, k_cut) / self.material.dielectric_constant
-        return (precomputed_array_fourier, k_max, num_k_vectors)
-
-    def get_precomputed_array_fourier_with_k_vector_data(self, charge_list_prod, alpha, k_cut):
-        k_max = np.ceil(k_cut / self.reciprocal_lattice_vector_length).astype(int)  # max number of multiples of reciprocal lattice length vectors
-        num_k_vectors = np.ceil(np.prod(2 * k_max + 1) * np.pi / 6 - 1).astype(int)
-        (precomputed_array_fourier, k_vector_data, energy_contribution_data) = self.pot_k_ewald_with_k_vector_data(charge_list_prod, k_max, alpha, k_cut)
-        precomputed_array_fourier /= self.material.dielectric_constant
-        return (precomputed_array_fourier, k_max, num_k_vectors, k_vector_data, energy_contribution_data)
+    def get_precomputed_array_fourier(self, alpha, k_cut, row_sites=None):
+        if self.reciprocal_space_method == 'pme':
+            precomputed_array_fourier = (self.pot_k_pme(alpha, k_cut, row_sites)
+                                         / self.material.dielectric_constant)
+        else:
+            precomputed_array_fourier = (self.pot_k_ewald(self.get_k_max(k_cut), alpha, k_cut, row_sites)
+                                         / self.material.dielectric_constant)
+        return precomputed_array_fourier
+
+    def get_precomputed_array_self(self, alpha, row_sites=None):
+        if row_sites is None:
+            row_sites = np.arange(self.num_row_sites)
+        precomputed_array_self = np.zeros((len(row_sites), self.neighbors.num_system_elements))
+        precomputed_array_self[np.arange(len(row_sites)), row_sites] = (
+                            - np.sqrt(alpha / np.pi) / self.material.dielectric_constant)
+        return precomputed_array_self
 
     def get_precomputed_array(self, dst_path, compute_energy_contributions,
                               return_k_vector_data):
-        """
+        """Assembles the precomputed array block by block of rows directly
+            into precomputed_array.npy in the output directory, such that
+            the peak memory is bounded by max_row_block_elements
 
         :param dst_path:
-        :return:
+        :return: memory-mapped precomputed array and the output directory
         """
         prefix_list = []
         (ewald_parameters, prefix_list, dst_path) = self.get_ewald_parameters(prefix_list, dst_path)
         alpha = ewald_parameters['alpha']
         r_cut = ewald_parameters['r_cut']
         k_cut = ewald_parameters['k_cut']
+        k_max = self.get_k_max(k_cut)
+        num_k_vectors = np.ceil(np.prod(2 * k_max + 1) * np.pi / 6 - 1).astype(int)
 
-        precomputed_array_real = self.get_precomputed_array_real(alpha, r_cut)
-
-        if return_k_vector_data or compute_energy_contributions:
+        store_float64 = self.precomputed_array_dtype == np.float64
+        if return_k_vector_data or compute_energy_contributions or not store_float64:
             # Assumption for the accuracy analysis
             ion_charge_type = 'full'
             charge_list = self.base_charge_config_for_accuracy_analysis(ion_charge_type)
-            charge_list_prod = np.multiply(charge_list.transpose(), charge_list)
+            charges = np.ravel(charge_list)
+            # each row site stands for its translations over all unit cells
+            row_multiplicity = self.neighbors.num_system_elements // self.num_row_sites
 
+        prefix_list.append(f'k_max: [{k_max[0]}, {k_max[1]}, {k_max[2]}]\n')
+        prefix_list.append(f'number of k-vectors: {num_k_vectors}\n\n')
         if return_k_vector_data:
-            (precomputed_array_fourier, k_max, num_k_vectors, k_vector_data,
-             energy_contribution_data) = self.get_precomputed_array_fourier_with_k_vector_data(charge_list_prod, alpha, k_cut)
-            prefix_list.append(f'k_max: [{k_max[0]}, {k_max[1]}, {k_max[2]}]\n')
-            prefix_list.append(f'number of k-vectors: {num_k_vectors}\n\n')
+            (k_vector_data, energy_contribution_data) = self.get_k_vector_energy_contributions(
+                                                                        charge_list, alpha, k_cut)
 
             # sorting in descending order
             sort_indices = np.argsort(energy_contribution_data)[::-1]
@@ -1565,27 +2202,66 @@ class System(object):
             sub_prefix_01 = ''.join(sub_prefix_list_01)
             generate_report(self.start_time, dst_path, file_name, print_time_elapsed, sub_prefix_01)
             print('Finished k-vector analysis')
-        else:
-            (precomputed_array_fourier, k_max, num_k_vectors) = self.get_precomputed_array_fourier(alpha, k_cut)
-            prefix_list.append(f'k_max: [{k_max[0]}, {k_max[1]}, {k_max[2]}]\n')
-            prefix_list.append(f'number of k-vectors: {num_k_vectors}\n\n')
 
-        precomputed_array_self = - np.eye(self.neighbors.num_system_elements) * np.sqrt(alpha / np.pi) / self.material.dielectric_constant
+        if self.reciprocal_space_method == 'pme':
+            prefix_list = self.compute_pme_errors(alpha, k_cut, prefix_list)
 
-        precomputed_array = precomputed_array_real + precomputed_array_fourier + precomputed_array_self
+        num_system_elements = self.neighbors.num_system_elements
+        if self.precomputed_array_format == 'compressed':
+            precomputed_array_shape = (self.num_row_sites, self.num_cells, self.num_row_sites)
+        elif self.precomputed_array_format == 'packed':
+            precomputed_array_shape = (num_system_elements * (num_system_elements + 1) // 2,)
+        else:
+            precomputed_array_shape = (self.num_row_sites, num_system_elements)
+        precomputed_array = open_memmap(dst_path.joinpath('precomputed_array.npy'), mode='w+',
+                                        dtype=self.precomputed_array_dtype, shape=precomputed_array_shape)
+        real_space_energy = fourier_space_energy = self_interaction_energy = 0
+        max_element_deviation = max_potential_deviation = energy_deviation = 0
+        for row_sites in self.get_row_site_blocks():
+            precomputed_array_real = self.get_precomputed_array_real(alpha, r_cut, row_sites)
+            precomputed_array_fourier = self.get_precomputed_array_fourier(alpha, k_cut, row_sites)
+            precomputed_array_self = self.get_precomputed_array_self(alpha, row_sites)
+            precomputed_array_block = precomputed_array_real + precomputed_array_fourier + precomputed_array_self
+            stored_precomputed_array_block = precomputed_array_block.astype(self.precomputed_array_dtype)
+            if self.precomputed_array_format == 'packed':
+                # upper triangle of the rows, which are contiguous in the packed array
+                packed_start_index = (row_sites[0] * num_system_elements
+                                      - row_sites[0] * (row_sites[0] - 1) // 2)
+                upper_triangle = np.arange(num_system_elements) >= row_sites[:, None]
+                precomputed_array[packed_start_index:packed_start_index + upper_triangle.sum()] = (
+                                                        stored_precomputed_array_block[upper_triangle])
+            else:
+                precomputed_array.reshape(self.num_row_sites, num_system_elements)[
+                                            row_sites[0]:row_sites[-1] + 1] = stored_precomputed_array_block
+            if not store_float64:
+                precomputed_array_deviation = stored_precomputed_array_block - precomputed_array_block
+                site_potential_deviation = np.dot(precomputed_array_deviation, charges)
+                max_element_deviation = max(max_element_deviation, np.max(np.abs(precomputed_array_deviation)))
+                max_potential_deviation = max(max_potential_deviation, np.max(np.abs(site_potential_deviation)))
+                energy_deviation += row_multiplicity * np.dot(charges[row_sites], site_potential_deviation)
+            if compute_energy_contributions:
+                real_space_energy += row_multiplicity * np.dot(
+                                    charges[row_sites], np.dot(precomputed_array_real, charges))
+                fourier_space_energy += row_multiplicity * np.dot(
+                                    charges[row_sites], np.dot(precomputed_array_fourier, charges))
+                self_interaction_energy += row_multiplicity * np.dot(
+                                    charges[row_sites], np.dot(precomputed_array_self, charges))
+        precomputed_array.flush()
 
         if compute_energy_contributions:
-            real_space_energy = np.sum(np.multiply(charge_list_prod, precomputed_array_real))
             prefix_list.append(f'Energy contribution from Real space: {real_space_energy/ constants.EV2HARTREE} eV\n')
-
-            fourier_space_energy = np.sum(np.multiply(charge_list_prod, precomputed_array_fourier))
             prefix_list.append(f'Energy contribution from Fourier-space: {fourier_space_energy / constants.EV2HARTREE} eV\n')
-
-            self_interaction_energy = np.sum(np.multiply(charge_list_prod, precomputed_array_self))
             prefix_list.append(f'Energy contribution from self-interactions: {self_interaction_energy / constants.EV2HARTREE} eV\n')
-
             total_system_energy = real_space_energy + fourier_space_energy + self_interaction_energy
             prefix_list.append(f'Total system energy (neutral): {total_system_energy / constants.EV2HARTREE} eV\n\n')
+        prefix_list.append(f'Storage: {self.precomputed_array_format} {self.precomputed_array_dtype.name}, '
+                           f'{precomputed_array.nbytes / 2**20:.3f} MiB '
+                           f'({precomputed_array.nbytes / (8 * num_system_elements**2):.3f} of dense float64)\n')
+        if not store_float64:
+            prefix_list = self.compute_storage_errors(max_element_deviation, max_potential_deviation,
+                                                      energy_deviation, prefix_list)
+        else:
+            prefix_list.append('\n')
         file_name = 'precomputed_array'
         print_time_elapsed = 1
         prefix = ''.join(prefix_list)
@@ -1596,36 +2272,83 @@ class System(object):
 class Run(object):
     """defines the subroutines for running Kinetic Monte Carlo and
         computing electrostatic interaction energies"""
+    # record of a kmc step in the event log
+    event_log_dtype = np.dtype([('time', np.float64),
+                                ('species_index', np.int32),
+                                ('process_index', np.int32)])
+    checkpoint_file_name = 'checkpoint.npz'
+
     def __init__(self, system, precomputed_array, temp, ion_charge_type,
                  species_charge_type, n_traj, t_final, time_interval,
                  species_count, initial_occupancy, relative_energies,
-                 external_field, doping):
+                 external_field, doping, potential_check_interval=1000,
+                 selection_backend='dense', interaction_radius=None,
+                 potential_evaluation='auto'):
         """Returns the PBC condition of the system
         :param system:
-        :param precomputed_array:
-        :param temp:
+        :param precomputed_array: full precomputed array, its packed upper
+                triangle which is wrapped in a PackedSymmetricMatrix or the
+                compressed rows of the first unit cell sites which are
+                wrapped in an InteractionMatrix. Only its block over the
+                sublattice of hop and dopant sites is retained
+        :param temp: temperature, or a list of n_traj temperatures to assign
+                one to each trajectory
         :param ion_charge_type:
         :param species_charge_type:
         :param n_traj:
         :param t_final:
         :param time_interval:
+        :param potential_check_interval: number of kmc steps between
+                consistency checks of the site potential cache against a
+                full recomputation
+        :param selection_backend: 'dense' evaluates the rates of all
+                processes at every kmc step while 'fenwick' keeps the rates
+                in a binary indexed tree and only updates the rates of
+                carriers within interaction_radius of the moved charge
+        :param interaction_radius: interaction radius in angstrom of the
+                'fenwick' selection backend. Defaults to all carriers, in
+                which case the tree is rebuilt at every kmc step and the
+                trajectory is the same as with 'dense'
+        :param potential_evaluation: 'dense' recomputes the site potential
+                from the charge configuration at every kmc step,
+                'incremental' updates the cached site potential by the rows
+                of the moved charge and 'sparse' keeps only the static site
+                potential and adds the pair terms with every carrier to the
+                processes. 'auto' picks the cheaper of 'incremental' and
+                'sparse' for the carrier density
         """
         self.start_time = datetime.now()
 
         self.system = system
         self.material = self.system.material
         self.neighbors = self.system.neighbors
-        self.precomputed_array = precomputed_array
-        self.temp = temp * constants.K2AUTEMP
+        if np.ndim(precomputed_array) == 3:
+            precomputed_array = InteractionMatrix(precomputed_array,
+                                                  self.system.system_size)
+        elif np.ndim(precomputed_array) == 1:
+            precomputed_array = PackedSymmetricMatrix(precomputed_array)
         self.ion_charge_type = ion_charge_type
         self.species_charge_type = species_charge_type
         self.n_traj = int(n_traj)
+        # temperature may be given as a list with one value per trajectory
+        self.traj_temp = np.broadcast_to(
+                np.asarray(temp, dtype=float) * constants.K2AUTEMP, self.n_traj)
+        self.temp = self.traj_temp[0]
         self.t_final = t_final * constants.SEC2AUTIME
         self.time_interval = time_interval * constants.SEC2AUTIME
         self.species_count = species_count
         self.initial_occupancy = initial_occupancy
         self.system_size = self.system.system_size
         self.relative_energies = relative_energies
+        self.potential_check_interval = int(potential_check_interval)
+        assert selection_backend in ['dense', 'fenwick'], \
+            f'Unknown selection_backend {selection_backend}'
+        self.selection_backend = selection_backend
+        self.interaction_radius = (None if interaction_radius is None
+                                   else interaction_radius * constants.ANG2BOHR)
+        assert potential_evaluation in ['auto', 'dense', 'incremental',
+                                        'sparse'], \
+            f'Unknown potential_evaluation {potential_evaluation}'
 
         # relative energies
         unit_cell_relative_energies = np.zeros(self.material.total_elements_per_unit_cell)
@@ -1662,17 +2385,23 @@ class Run(object):
         # electric field
         electric_field = external_field['electric']
         self.electric_field_ld = electric_field['ld']
-        self.electric_field_mag = electric_field['mag']
+        # field magnitude may be given as a list with one value per trajectory
+        self.traj_electric_field_mag = np.broadcast_to(
+                np.asarray(electric_field['mag'], dtype=float), self.n_traj)
+        self.electric_field_mag = self.traj_electric_field_mag[0]
         if electric_field['active']:
             self.electric_field_active = 1
             field_dir = np.asarray(electric_field['dir'])
             if self.electric_field_ld == 1:
                 field_dir = np.dot(field_dir, self.material.lattice_matrix)
-            self.electric_field = (self.electric_field_mag
-                                   * (field_dir / np.linalg.norm(field_dir)))
+            self.traj_electric_field = (
+                        self.traj_electric_field_mag[:, None]
+                        * (field_dir / np.linalg.norm(field_dir)))
         else:
             self.electric_field_active = 0
-            self.electric_field = np.zeros(self.neighbors.n_dim)
+            self.traj_electric_field = np.zeros((self.n_traj,
+                                                 self.neighbors.n_dim))
+        self.electric_field = self.traj_electric_field[0]
 
         # doping
         self.doping = doping
@@ -1713,12 +2442,11 @@ class Run(object):
                                 self.system.hop_neighbor_list)
                 outer_shell_neighbors = shell_based_neighbors[-1]
                 if len(outer_shell_neighbors):
-                    for outer_shell_neighbor in outer_shell_neighbors:
-                        dist_value = self.neighbors.compute_distance(self.system.system_size,
-                                                                     sample_site_index,
-                                                                     outer_shell_neighbor) / constants.ANG2BOHR
-                        pairwise_dist_list.append(dist_value)
-                        shell_index_list.append(num_shells)
+                    pairwise_dist_list.extend(np.linalg.norm(
+                            self.neighbors.min_image_vectors.get_elements(
+                                sample_site_index, outer_shell_neighbors),
+                            axis=1) / constants.ANG2BOHR)
+                    shell_index_list.extend([num_shells] * len(outer_shell_neighbors))
                     num_shells += 1
                 else:
                     break
@@ -1747,98 +2475,29 @@ class Run(object):
         self.hop_element_type_list = [
                             self.material.hop_element_types[species_type][0]
                             for species_type in self.species_type_list]
-        # NOTE: Assuming number of neighbors is identical to all class indices
-        class_index = 0
-        self.len_hop_dist_type_list = [
-                    len(self.material.neighbor_cutoff_dist[hop_element_type][class_index])
-                    for hop_element_type in self.hop_element_type_list]
-
-        class_based_sample_site_indices = {}
-        for species_type_index, species_type in enumerate(
-                                                self.material.species_types):
-            element_type = self.material.species_to_element_type_map[
-                                                            species_type][0]
-            element_type_index = self.material.element_types.index(
-                                                                element_type)
-            class_based_sample_site_indices[element_type] = []
-            start_index = self.material.n_elements_per_unit_cell[
-                                                    :element_type_index].sum()
-            end_index = start_index + self.material.n_elements_per_unit_cell[
-                                                            element_type_index]
-            for class_index in range(self.material.num_classes[
-                                                        element_type_index]):
-                sample_site_index = self.material.unit_cell_class_list[
-                                    start_index:end_index].index(class_index)
-                class_based_sample_site_indices[element_type].append(
-                                                            sample_site_index)
 
         self.n_proc_species_index_list = []
-        self.n_proc_hop_element_type_list = []
-        self.n_proc_site_element_type_index_list = []
-        self.n_proc_hop_dist_type_list = {}
-        self.n_proc_neighbor_index_list = {}
-        self.n_proc_lambda_value_list = {}
-        self.n_proc_v_ab_list = {}
-        for species_type_index, species_type in enumerate(
-                                                self.material.species_types):
-            species_type_species_count = self.species_count[species_type_index]
-            hop_element_type = self.material.hop_element_types[species_type][0]
-            element_type = self.material.species_to_element_type_map[
-                                                            species_type][0]
-            element_type_index = self.material.element_types.index(
-                                                                element_type)
+        for species_type_index, species_type_species_count in enumerate(
+                                                        self.species_count):
             self.n_proc_species_index_list.extend(
                                 np.repeat(range(species_type_species_count),
                                 self.system.num_neighbors[species_type_index]))
-            self.n_proc_hop_element_type_list.extend(
-                            [hop_element_type] * species_type_species_count
-                            * self.system.num_neighbors[species_type_index])
-            self.n_proc_site_element_type_index_list.extend(
-                            [element_type_index] * species_type_species_count
-                            * self.system.num_neighbors[species_type_index])
-            if species_type_species_count != 0:
-                self.n_proc_hop_dist_type_list[hop_element_type] = []
-                self.n_proc_neighbor_index_list[hop_element_type] = []
-                self.n_proc_lambda_value_list[hop_element_type] = []
-                self.n_proc_v_ab_list[hop_element_type] = []
-                for class_index in range(self.material.num_classes[
-                                                        element_type_index]):
-                    sample_site_index = class_based_sample_site_indices[
-                                                    element_type][class_index]
-                    local_num_neighbors = []
-                    len_local_num_neighbors = len(
-                        self.material.neighbor_cutoff_dist[hop_element_type][class_index])
-                    for hop_dist_type in range(len_local_num_neighbors):
-                        local_num_neighbors.append(
-                            self.system.hop_neighbor_list[hop_element_type][class_index][
-                                hop_dist_type].num_neighbors[sample_site_index]
-                            )
-                    self.n_proc_hop_dist_type_list[hop_element_type].append(
-                        np.repeat(range(len_local_num_neighbors),
-                                  local_num_neighbors))
-                    self.n_proc_neighbor_index_list[hop_element_type].append(
-                                [index
-                                 for value in np.unique(
-                                     self.n_proc_hop_dist_type_list[
-                                         hop_element_type][class_index],
-                                     return_counts=True)[1]
-                                 for index in range(value)])
-                self.n_proc_lambda_value_list[hop_element_type].extend(
-                    [[self.material.lambda_values[hop_element_type][
-                                                class_index][hop_dist_type]
-                     for hop_dist_type in self.n_proc_hop_dist_type_list[
-                                        hop_element_type][class_index]]
-                    for class_index in range(self.material.num_classes[element_type_index])])
-                self.n_proc_v_ab_list[hop_element_type].extend(
-                    [[self.material.v_ab[hop_element_type][class_index][hop_dist_type]
-                     for hop_dist_type in self.n_proc_hop_dist_type_list[
-                                        hop_element_type][class_index]]
-                    for class_index in range(self.material.num_classes[element_type_index])])
 
         self.n_proc_species_proc_list = [
             species_proc_index
             for index in self.species_type_index_list
             for species_proc_index in range(self.system.num_neighbors[index])]
+        self.n_proc_species_charge_array = np.asarray(
+                        self.species_charge_list)[self.n_proc_species_index_list]
+        # position in occupancy of the species associated with each process
+        self.n_proc_occupancy_index_array = np.repeat(
+                    np.arange(len(self.species_type_index_list)),
+                    self.system.num_neighbors[self.species_type_index_list])
+        self.n_proc_species_proc_array = np.asarray(
+                                        self.n_proc_species_proc_list, dtype=int)
+
+        # static process table of all hoppable sites
+        self.process_table = self.get_process_table()
 
         # system coordinates
         self.system_coordinates = self.neighbors.bulk_sites.cell_coordinates
@@ -1846,6 +2505,20 @@ class Run(object):
         # total number of species
         self.total_species = self.species_count.sum()
 
+        # only the sublattice block of precomputed_array is retained while
+        # the fixed charges outside the sublattice enter as a static potential
+        self.sublattice_site_indices = self.get_sublattice_site_indices()
+        self.sublattice_index_array = np.full(
+                            self.neighbors.num_system_elements, -1, dtype=int)
+        self.sublattice_index_array[self.sublattice_site_indices] = np.arange(
+                                            len(self.sublattice_site_indices))
+        (self.precomputed_array, self.lattice_site_potential,
+         self.lattice_energy) = self.get_sublattice_interaction_data(
+                                                            precomputed_array)
+        if potential_evaluation == 'auto':
+            potential_evaluation = self.get_potential_evaluation()
+        self.potential_evaluation = potential_evaluation
+
     def get_element_type_element_index(self, site_element_type_index,
                                        system_element_index):
         element_index = (
@@ -1857,116 +2530,441 @@ class Run(object):
             + element_index)
         return (element_type_element_index, element_index)
 
-    def get_process_attributes(self, occupancy):
-        i_proc = i_proc_old = 0
-        old_site_system_element_index_list = np.zeros(self.n_proc, dtype=int)
-        new_site_system_element_index_list = np.zeros(self.n_proc, dtype=int)
-        element_type_element_index_list = np.zeros(self.n_proc, dtype=int)
-        for species_site_system_element_index in occupancy:
-            species_index = self.n_proc_species_index_list[i_proc]
-            hop_element_type = self.n_proc_hop_element_type_list[i_proc]
-            site_element_type_index = self.n_proc_site_element_type_index_list[i_proc]
-            (element_type_element_index, element_index) = (
-                                self.get_element_type_element_index(
-                                    site_element_type_index,
-                                    species_site_system_element_index))
-            site_element_type_index = self.n_proc_site_element_type_index_list[
-                                                                        i_proc]
-            class_index = self.material.unit_cell_class_list[
-                self.material.n_elements_per_unit_cell[:site_element_type_index].sum()
-                + element_index]
-            for hop_dist_type in range(self.len_hop_dist_type_list[
-                                                            species_index]):
-                local_neighbor_site_system_element_index_list = (
-                            self.system.hop_neighbor_list[hop_element_type][
-                                            class_index][hop_dist_type]
-                            .neighbor_system_element_indices[
-                                                element_type_element_index])
-                num_neighbors = len(
-                                local_neighbor_site_system_element_index_list)
-                # TODO: Introduce If condition if neighbor_system_element_index
-                # not in current_state_occupancy: commit 898baa8
-                new_site_system_element_index_list[
-                    i_proc:i_proc+num_neighbors] = \
-                        local_neighbor_site_system_element_index_list
-                i_proc += num_neighbors
-            old_site_system_element_index_list[i_proc_old:i_proc] = \
-                                            species_site_system_element_index
-            element_type_element_index_list[i_proc_old:i_proc] = \
-                                                    element_type_element_index
-            i_proc_old = i_proc
-        process_attributes = (old_site_system_element_index_list,
-                              new_site_system_element_index_list,
-                              element_type_element_index_list)
+    def get_process_table(self):
+        """Returns a compressed sparse row (CSR) table of kinetic processes
+            available from every hoppable site. Processes of the site with
+            system element index i are stored contiguously between
+            site_ptr[i] and site_ptr[i+1], ordered by hop distance type and
+            then by neighbor index as listed in hop_neighbor_list
+        :return: """
+        num_system_elements = self.neighbors.num_system_elements
+        site_index_blocks = []
+        hop_dist_type_blocks = []
+        destination_blocks = []
+        hop_vector_blocks = []
+        lambda_value_blocks = []
+        v_ab_blocks = []
+        hop_site_num_neighbors = []
+        for species_type_index, species_type in enumerate(
+                                                self.material.species_types):
+            hop_element_type = self.material.hop_element_types[species_type][0]
+            if (self.species_count[species_type_index] == 0
+                    or hop_element_type not in self.system.hop_neighbor_list):
+                continue
+            element_type = self.material.species_to_element_type_map[
+                                                            species_type][0]
+            element_type_index = self.material.element_types.index(
+                                                                element_type)
+            system_element_index_offset_array = np.repeat(
+                np.arange(0, (self.material.total_elements_per_unit_cell
+                              * self.system.num_cells),
+                          self.material.total_elements_per_unit_cell),
+                self.material.n_elements_per_unit_cell[element_type_index])
+            site_indices = (
+                np.tile(self.material.n_elements_per_unit_cell[:element_type_index].sum()
+                        + np.arange(0, self.material.n_elements_per_unit_cell[element_type_index]),
+                        self.system.num_cells)
+                + system_element_index_offset_array)
+            site_class_index_list = self.system.system_class_index_list[
+                                                                site_indices]
+            hop_site_num_neighbors.append(
+                    (site_indices, self.system.num_neighbors[species_type_index]))
+            for class_index, class_hop_neighbor_list in enumerate(
+                        self.system.hop_neighbor_list[hop_element_type]):
+                # element type element indices of sites in the class
+                class_site_indices = np.where(
+                                    site_class_index_list == class_index)[0]
+                if len(class_site_indices) == 0:
+                    continue
+                for hop_dist_type, hop_dist_type_neighbors in enumerate(
+                                                    class_hop_neighbor_list):
+                    num_neighbors = hop_dist_type_neighbors.num_neighbors[
+                                                        class_site_indices]
+                    site_index_blocks.append(
+                        np.repeat(site_indices[class_site_indices],
+                                  num_neighbors))
+                    hop_dist_type_blocks.append(
+                        np.full(num_neighbors.sum(), hop_dist_type, dtype=int))
+                    destination_blocks.append(np.concatenate(
+                        [np.asarray(neighbor_indices, dtype=int)
+                         for neighbor_indices in (
+                             hop_dist_type_neighbors.neighbor_system_element_indices[
+                                                        class_site_indices])]))
+                    hop_vector_blocks.append(np.concatenate(
+                        [np.reshape(displacement_vectors, (-1, self.neighbors.n_dim))
+                         for displacement_vectors in (
+                             hop_dist_type_neighbors.displacement_vector_list[
+                                                        class_site_indices])]))
+                    lambda_value_blocks.append(
+                        np.full(num_neighbors.sum(),
+                                self.material.lambda_values[hop_element_type][
+                                                    class_index][hop_dist_type]))
+                    v_ab_blocks.append(
+                        np.full(num_neighbors.sum(),
+                                self.material.v_ab[hop_element_type][
+                                                    class_index][hop_dist_type]))
+
+        if site_index_blocks:
+            process_site_index_array = np.concatenate(site_index_blocks)
+            hop_dist_type_array = np.concatenate(hop_dist_type_blocks)
+            # stable ordering by site and by hop distance type within a site
+            sort_indices = np.lexsort((np.arange(len(process_site_index_array)),
+                                       hop_dist_type_array,
+                                       process_site_index_array))
+            process_site_index_array = process_site_index_array[sort_indices]
+            hop_dist_type_array = hop_dist_type_array[sort_indices]
+            destination_array = np.concatenate(destination_blocks)[sort_indices]
+            hop_vector_array = np.concatenate(hop_vector_blocks)[sort_indices]
+            lambda_value_array = np.concatenate(lambda_value_blocks)[sort_indices]
+            v_ab_array = np.concatenate(v_ab_blocks)[sort_indices]
+        else:
+            process_site_index_array = np.zeros(0, dtype=int)
+            hop_dist_type_array = np.zeros(0, dtype=int)
+            destination_array = np.zeros(0, dtype=int)
+            hop_vector_array = np.zeros((0, self.neighbors.n_dim))
+            lambda_value_array = np.zeros(0)
+            v_ab_array = np.zeros(0)
+        site_ptr = np.zeros(num_system_elements + 1, dtype=int)
+        site_ptr[1:] = np.cumsum(np.bincount(process_site_index_array,
+                                             minlength=num_system_elements))
+        for (site_indices, num_neighbors) in hop_site_num_neighbors:
+            assert np.all(np.diff(site_ptr)[site_indices] == num_neighbors), \
+                'Number of kinetic processes should be identical for all ' \
+                'sites of a hopping element type'
+
+        process_table = ReturnValues(site_ptr=site_ptr,
+                                     destination_array=destination_array,
+                                     hop_vector_array=hop_vector_array,
+                                     lambda_value_array=lambda_value_array,
+                                     v_ab_array=v_ab_array,
+                                     hop_dist_type_array=hop_dist_type_array)
+        return process_table
+
+    def get_sublattice_site_indices(self):
+        """Returns the system element indices of the sublattice sites whose
+            charge may change between configurations. These are the sites of
+            the element types hosting charge carriers and the sites of the
+            element types substituted by dopants, in ascending order such
+            that the sublattice is ordered by unit cell like the system
+        :return: """
+        sublattice_element_types = set()
+        for species_type_index, species_type in enumerate(
+                                                self.material.species_types):
+            if self.species_count[species_type_index]:
+                sublattice_element_types.update(
+                    self.material.species_to_element_type_map[species_type])
+        if self.doping_active:
+            sublattice_element_types.update(self.substitution_element_types)
+        unit_cell_site_indices = np.where(np.isin(
+                np.asarray(self.material.element_types)[
+                                    self.material.element_type_index_list],
+                list(sublattice_element_types)))[0]
+        sublattice_site_indices = (
+                (np.arange(self.system.num_cells)[:, None]
+                 * self.material.total_elements_per_unit_cell
+                 + unit_cell_site_indices).ravel())
+        return sublattice_site_indices
+
+    def get_sublattice_interaction_data(self, precomputed_array):
+        """Returns the block of precomputed_array over the sublattice sites
+            along with the potential at the sublattice sites due to the
+            lattice charges outside the sublattice and the interaction
+            energy of those lattice charges. The lattice charges outside the
+            sublattice never change, hence the full array is needed only
+            once to fold them into a static potential
+        :param precomputed_array: full precomputed array or InteractionMatrix
+        :return: """
+        lattice_charge_config = self.base_charge_config()[:, 0]
+        lattice_charge_config[self.sublattice_site_indices] = 0
+        lattice_site_potential = precomputed_array.dot(lattice_charge_config)
+        lattice_energy = np.dot(lattice_charge_config, lattice_site_potential)
+        if isinstance(precomputed_array, InteractionMatrix):
+            unit_cell_site_indices = self.sublattice_site_indices[
+                    :len(self.sublattice_site_indices) // self.system.num_cells]
+            sublattice_precomputed_array = InteractionMatrix(
+                    precomputed_array.compressed_array[unit_cell_site_indices][
+                                                :, :, unit_cell_site_indices],
+                    self.system.system_size)
+        elif isinstance(precomputed_array, PackedSymmetricMatrix):
+            sublattice_precomputed_array = precomputed_array.get_block(
+                                                self.sublattice_site_indices)
+        else:
+            sublattice_precomputed_array = precomputed_array[
+                        np.ix_(self.sublattice_site_indices,
+                               self.sublattice_site_indices)]
+        return (sublattice_precomputed_array,
+                lattice_site_potential[self.sublattice_site_indices],
+                lattice_energy)
+
+    def get_potential_evaluation(self):
+        """Returns the cheaper potential evaluation path for the carrier
+            density. The incremental path updates all sublattice site
+            potentials at every kmc step while the sparse path gathers the
+            pair terms between the old and new sites of every process and
+            every carrier
+        :return: """
+        num_incremental_terms = len(self.sublattice_site_indices)
+        num_sparse_terms = 2 * self.n_proc * self.total_species
+        if num_sparse_terms < num_incremental_terms:
+            return 'sparse'
+        return 'incremental'
+
+    def get_process_attributes(self, occupancy, proc_indices=None):
+        """Returns the attributes of all kinetic processes available from
+            the current occupancy gathered from the process table
+        :param occupancy: occupancy of a trajectory, or a 2-D array with the
+                occupancies of a batch of trajectories
+        :param proc_indices: subset of processes to gather. Defaults to all
+                processes
+        :return: """
+        if proc_indices is None:
+            proc_indices = slice(None)
+        old_site_system_element_index_list = np.asarray(occupancy)[
+                            ..., self.n_proc_occupancy_index_array[proc_indices]]
+        process_table_indices = (
+                self.process_table.site_ptr[old_site_system_element_index_list]
+                + self.n_proc_species_proc_array[proc_indices])
+        new_site_system_element_index_list = (
+                self.process_table.destination_array[process_table_indices])
+        process_attributes = (
+                old_site_system_element_index_list,
+                new_site_system_element_index_list,
+                self.process_table.hop_vector_array[process_table_indices],
+                self.process_table.lambda_value_array[process_table_indices],
+                self.process_table.v_ab_array[process_table_indices])
         return process_attributes
 
-    def get_process_rates(self, process_attributes, charge_config):
-        nproc_delg_0_array = np.zeros(self.n_proc)
-        nproc_hop_vector_array = np.zeros((self.n_proc, self.neighbors.n_dim))
-        k_list = np.zeros(self.n_proc)
+    def get_local_proc_indices(self, occupancy, old_site_system_element_index,
+                               new_site_system_element_index):
+        """Returns the processes of all carriers within the interaction
+            radius of the old or the new site of a moved charge
+        :param occupancy:
+        :param old_site_system_element_index:
+        :param new_site_system_element_index:
+        :return: """
+        if self.interaction_radius is None:
+            return np.arange(self.n_proc)
+        occupancy = np.asarray(occupancy)
+        carrier_dist_array = np.minimum(
+            np.linalg.norm(self.system.get_min_image_vector_rows(
+                                old_site_system_element_index, occupancy), axis=1),
+            np.linalg.norm(self.system.get_min_image_vector_rows(
+                                new_site_system_element_index, occupancy), axis=1))
+        local_carrier_indices = np.where(
+                        carrier_dist_array <= self.interaction_radius)[0]
+        local_proc_indices = np.where(np.isin(self.n_proc_occupancy_index_array,
+                                              local_carrier_indices))[0]
+        return local_proc_indices
+
+    def update_process_rates(self, rate_tree, process_rate_arrays, occupancy,
+                             site_potential, proc_indices):
+        """Reevaluates the rates of a subset of processes and updates the
+            process rate arrays and the rate tree in place
+        :param rate_tree: FenwickTree over the process rates
+        :param process_rate_arrays: new site indices, rates, delG0 and hop
+                vectors of all processes
+        :param occupancy:
+        :param site_potential:
+        :param proc_indices:
+        :return: """
+        process_attributes = self.get_process_attributes(occupancy,
+                                                         proc_indices)
+        process_rate_info = self.get_process_rates(
+                process_attributes, site_potential, occupancy, proc_indices)
+        (new_site_system_element_index_list, k_list, nproc_delg_0_array,
+         nproc_hop_vector_array) = process_rate_arrays
+        new_site_system_element_index_list[proc_indices] = process_attributes[1]
+        (k_list[proc_indices], nproc_delg_0_array[proc_indices],
+         nproc_hop_vector_array[proc_indices]) = process_rate_info
+        if len(proc_indices) == rate_tree.size:
+            # a rebuild is vectorized, unlike per process updates
+            rate_tree.rebuild(k_list)
+            return None
+        for proc_index, k_value in zip(proc_indices.tolist(),
+                                       process_rate_info[0].tolist()):
+            rate_tree.update(proc_index, k_value)
+        return None
+
+    def get_site_potential(self, charge_config, static_site_potential):
+        """Returns the electrostatic potential at every sublattice site due
+            to the carrier charge configuration and the fixed charges
+        :param charge_config: carrier charges on the sublattice sites
+        :param static_site_potential: potential of the fixed charges
+        :return: """
+        site_potential = (static_site_potential
+                          + self.precomputed_array.dot(charge_config))
+        return site_potential
+
+    def update_site_potential(self, site_potential, old_site_system_element_index,
+                              new_site_system_element_index, species_charge):
+        """Updates the site potential in place for a charge moving from the
+            old site to the new site. precomputed_array is symmetric, hence
+            its rows are used in place of the columns
+        :param site_potential:
+        :param old_site_system_element_index:
+        :param new_site_system_element_index:
+        :param species_charge:
+        :return: """
+        site_potential += species_charge * (
+            self.precomputed_array[
+                self.sublattice_index_array[new_site_system_element_index]]
+            - self.precomputed_array[
+                self.sublattice_index_array[old_site_system_element_index]])
+        return None
+
+    def check_site_potential(self, site_potential, charge_config,
+                             static_site_potential):
+        """Returns the recomputed site potential along with the maximum
+            deviation of the incrementally updated site potential from it
+        :param site_potential:
+        :param charge_config:
+        :param static_site_potential:
+        :return: """
+        exact_site_potential = self.get_site_potential(charge_config,
+                                                       static_site_potential)
+        potential_drift = np.max(np.abs(site_potential - exact_site_potential))
+        return (exact_site_potential, potential_drift)
+
+    def get_site_potential_difference(self, site_potential, occupancy,
+                                      old_sublattice_index_list,
+                                      new_sublattice_index_list):
+        """Returns the potential difference between the new and the old
+            sites of the processes. The sparse potential evaluation holds
+            only the static site potential, hence the pair terms between the
+            process sites and every carrier are gathered from
+            precomputed_array and added
+        :param site_potential: site potential of a trajectory, or of a batch
+                of trajectories with one row per trajectory
+        :param occupancy: occupancy of the trajectory or the batch
+        :param old_sublattice_index_list:
+        :param new_sublattice_index_list:
+        :return: """
+        site_potential_difference = (
+            np.take_along_axis(site_potential, new_sublattice_index_list, -1)
+            - np.take_along_axis(site_potential, old_sublattice_index_list, -1))
+        if self.potential_evaluation == 'sparse':
+            carrier_sublattice_index_list = self.sublattice_index_array[
+                                        np.asarray(occupancy)][..., None, :]
+            site_potential_difference += np.dot(
+                (self.precomputed_array[new_sublattice_index_list[..., None],
+                                        carrier_sublattice_index_list]
+                 - self.precomputed_array[old_sublattice_index_list[..., None],
+                                          carrier_sublattice_index_list]),
+                self.species_charge_list)
+        return site_potential_difference
+
+    def get_process_rates(self, process_attributes, site_potential,
+                          occupancy, proc_indices=None):
+        """Returns rates, delG0 and hop vectors of all kinetic processes
+            evaluated at once with array operations
+        :param process_attributes:
+        :param site_potential: electrostatic potential at every site due to
+                the current charge configuration, or the static site
+                potential for the sparse potential evaluation
+        :param occupancy:
+        :param proc_indices: subset of processes the attributes were
+                gathered for. Defaults to all processes
+        :return: """
         (old_site_system_element_index_list,
          new_site_system_element_index_list,
-         element_type_element_index_list) = process_attributes
-
-        for i_proc in range(self.n_proc):
-            species_site_system_element_index = \
-                                    old_site_system_element_index_list[i_proc]
-            neighbor_site_system_element_index = \
-                                    new_site_system_element_index_list[i_proc]
-            species_index = self.n_proc_species_index_list[i_proc]
-            species_proc_index = self.n_proc_species_proc_list[i_proc]
-            term01 = np.dot(
-                charge_config[:, 0],
-                (self.precomputed_array[neighbor_site_system_element_index, :]
-                 - self.precomputed_array[species_site_system_element_index, :]
-                 ))
-            term02 = (
-                self.species_charge_list[species_index]
-                * (self.precomputed_array[species_site_system_element_index,
-                                          species_site_system_element_index]
-                   - self.precomputed_array[species_site_system_element_index,
-                                            neighbor_site_system_element_index]))
-
-            delg_0_ewald = (2 * self.species_charge_list[species_index]
-                            * (term01 + term02))
-            class_index = self.system.system_class_index_list[
-                                            species_site_system_element_index]
-            hop_element_type = self.n_proc_hop_element_type_list[i_proc]
-            hop_dist_type = self.n_proc_hop_dist_type_list[hop_element_type][
-                                            class_index][species_proc_index]
-            delg_0_shift = (
-                self.system_relative_energies[neighbor_site_system_element_index]
-                - self.system_relative_energies[species_site_system_element_index])
-            delg_0 = (delg_0_ewald + delg_0_shift)
-
-            nproc_delg_0_array[i_proc] = delg_0
-            lambda_value = self.n_proc_lambda_value_list[hop_element_type][
-                                            class_index][species_proc_index]
-            v_ab = self.n_proc_v_ab_list[hop_element_type][class_index][
-                                                            species_proc_index]
-            element_type_element_index = element_type_element_index_list[
-                                                                        i_proc]
-            neighbor_index = self.n_proc_neighbor_index_list[hop_element_type][
-                                            class_index][species_proc_index]
-            hop_vector = (self.system.hop_neighbor_list[hop_element_type][
-                            class_index][hop_dist_type].displacement_vector_list[
-                                element_type_element_index][neighbor_index])
-            nproc_hop_vector_array[i_proc] = hop_vector
-            if self.electric_field_active:
-                delg_s_shift = 0.5 * np.dot(self.electric_field, hop_vector)
-            else:
-                delg_s_shift = 0
-            delg_s = (((lambda_value + delg_0) ** 2
-                       / (4 * lambda_value)) - v_ab) - delg_s_shift
-            k_list[i_proc] = self.material.vn * np.e**(-delg_s / self.temp)
+         nproc_hop_vector_array, lambda_value_array,
+         v_ab_array) = process_attributes
+        if proc_indices is None:
+            proc_indices = slice(None)
+        n_proc_species_charge_array = self.n_proc_species_charge_array[
+                                                                proc_indices]
+
+        old_sublattice_index_list = self.sublattice_index_array[
+                                        old_site_system_element_index_list]
+        new_sublattice_index_list = self.sublattice_index_array[
+                                        new_site_system_element_index_list]
+        term01 = self.get_site_potential_difference(
+                                site_potential, occupancy,
+                                old_sublattice_index_list,
+                                new_sublattice_index_list)
+        term02 = (
+            n_proc_species_charge_array
+            * (self.precomputed_array[old_sublattice_index_list,
+                                      old_sublattice_index_list]
+               - self.precomputed_array[old_sublattice_index_list,
+                                        new_sublattice_index_list]))
+        delg_0_ewald = 2 * n_proc_species_charge_array * (term01 + term02)
+        delg_0_shift = (
+            self.system_relative_energies[new_site_system_element_index_list]
+            - self.system_relative_energies[old_site_system_element_index_list])
+        nproc_delg_0_array = delg_0_ewald + delg_0_shift
+
+        if self.electric_field_active:
+            delg_s_shift = 0.5 * np.dot(nproc_hop_vector_array,
+                                        self.electric_field)
+        else:
+            delg_s_shift = 0
+        delg_s = (((lambda_value_array + nproc_delg_0_array) ** 2
+                   / (4 * lambda_value_array)) - v_ab_array) - delg_s_shift
+        k_list = self.material.vn * np.e**(-delg_s / self.temp)
+        process_rate_info = (k_list, nproc_delg_0_array,
+                             nproc_hop_vector_array)
+        return process_rate_info
+
+    def get_batch_process_rates(self, process_attributes, site_potential,
+                                occupancy, system_relative_energies, temp,
+                                electric_field):
+        """Returns rates, delG0 and hop vectors of all kinetic processes of
+            a batch of trajectories with one row per trajectory
+        :param process_attributes: process attributes of the batch
+        :param site_potential: site potential of each trajectory
+        :param occupancy: occupancy of each trajectory
+        :param system_relative_energies: site relative energies of each
+                trajectory
+        :param temp: temperature of each trajectory
+        :param electric_field: electric field of each trajectory
+        :return: """
+        (old_site_system_element_index_list,
+         new_site_system_element_index_list,
+         nproc_hop_vector_array, lambda_value_array,
+         v_ab_array) = process_attributes
+        batch_indices = np.arange(len(site_potential))[:, None]
+        old_sublattice_index_list = self.sublattice_index_array[
+                                        old_site_system_element_index_list]
+        new_sublattice_index_list = self.sublattice_index_array[
+                                        new_site_system_element_index_list]
+
+        term01 = self.get_site_potential_difference(
+                                site_potential, occupancy,
+                                old_sublattice_index_list,
+                                new_sublattice_index_list)
+        term02 = (
+            self.n_proc_species_charge_array
+            * (self.precomputed_array[old_sublattice_index_list,
+                                      old_sublattice_index_list]
+               - self.precomputed_array[old_sublattice_index_list,
+                                        new_sublattice_index_list]))
+        delg_0_ewald = 2 * self.n_proc_species_charge_array * (term01 + term02)
+        delg_0_shift = (
+            system_relative_energies[batch_indices,
+                                     new_site_system_element_index_list]
+            - system_relative_energies[batch_indices,
+                                       old_site_system_element_index_list])
+        nproc_delg_0_array = delg_0_ewald + delg_0_shift
+
+        if self.electric_field_active:
+            delg_s_shift = 0.5 * np.einsum('ijk,ik->ij', nproc_hop_vector_array,
+                                           electric_field)
+        else:
+            delg_s_shift = 0
+        delg_s = (((lambda_value_array + nproc_delg_0_array) ** 2
+                   / (4 * lambda_value_array)) - v_ab_array) - delg_s_shift
+        k_list = self.material.vn * np.e**(-delg_s / temp[:, None])
         process_rate_info = (k_list, nproc_delg_0_array,
                              nproc_hop_vector_array)
         return process_rate_info
 
     def compute_drift_mobility(self, drift_velocity_array, dst_path,
                                prefix_list):
-        drift_mobility_au = (np.dot(drift_velocity_array, self.electric_field)
-                             / self.electric_field_mag**2)
+        drift_mobility_au = (
+                np.einsum('ijk,ik->ij', drift_velocity_array,
+                          self.traj_electric_field)
+                / self.traj_electric_field_mag[:, None]**2)
         # mobility in cm2/V.s.
         drift_mobility_array = (drift_mobility_au * (constants.BOHR2CM**2
                                                      * constants.SEC2AUTIME
@@ -2003,17 +3001,19 @@ class Run(object):
         dopant_type_dopant_site_indices = []
         num_dopant_sites_inserted = 0
         while (num_dopants - num_dopant_sites_inserted) and available_site_indices:
-            dopant_site_index = rnd.choice(available_site_indices)
+            dopant_site_index = available_site_indices[
+                self.doping_random_generator.integers(
+                                            len(available_site_indices))]
             dopant_type_dopant_site_indices.append(dopant_site_index)
             num_dopant_sites_inserted += 1
             num_shells_discard = self.doping['min_shell_separation'][map_index]
             long_neighbor_shell_indices = self.get_shell_based_neighbors(
                             dopant_site_index, num_shells_discard, system_size,
                             system_class_index_list, hop_neighbor_list)
-            combined_long_neighbor_shell_indices = [
+            combined_long_neighbor_shell_indices = {
                     system_element_index
                     for shell_neighbors in long_neighbor_shell_indices
-                    for system_element_index in shell_neighbors]
+                    for system_element_index in shell_neighbors}
             available_site_indices = [
                 site_index
                 for site_index in available_site_indices
@@ -2087,20 +3087,24 @@ class Run(object):
                                                 substitution_element_type_index]),
                                 num_cells)
                         + system_element_index_offset_array)
-                    num_site_indices = len(site_indices)
-                    pair_wise_distance_vector_array = np.zeros((num_site_indices, num_site_indices, self.neighbors.n_dim))
-                    for index, site_index in enumerate(site_indices):
-                        pair_wise_distance_vector_array[index, :] = self.system.pairwise_min_image_vector_data[site_index][site_indices]
-                    pair_wise_distance_array = np.linalg.norm(pair_wise_distance_vector_array, axis=2)
                     intra_pair_distance_ang = self.doping['pairwise'][map_index]['intra_pair_distance']
                     intra_pair_distance = intra_pair_distance_ang * constants.ANG2BOHR
                     rounding_digits = len(str(intra_pair_distance_ang).split(".")[1])
-                    desired_pair_internal_indices_temp = np.where(pair_wise_distance_array.round(rounding_digits) == np.round(intra_pair_distance, rounding_digits))
-                    desired_pair_internal_indices = np.hstack((desired_pair_internal_indices_temp[0][:, None], desired_pair_internal_indices_temp[1][:, None]))
-
+                    # candidate pairs within reach of the rounded pair distance
+                    pair_neighbors = self.neighbors.cell_list.query_radius(
+                            site_indices,
+                            np.round(intra_pair_distance, rounding_digits) + 10.0**-rounding_digits,
+                            site_indices)
+                    pair_site_indices_1 = np.repeat(site_indices, np.diff(pair_neighbors.neighbor_offsets))
+                    pair_site_indices_2 = pair_neighbors.neighbor_site_indices
                     # avoiding duplicate pairs
-                    desired_pair_internal_indices = desired_pair_internal_indices[desired_pair_internal_indices[:, 1] > desired_pair_internal_indices[:, 0]]
-                    desired_pair_indices = site_indices[desired_pair_internal_indices]
+                    desired_pairs = ((pair_neighbors.displacements.round(rounding_digits)
+                                      == np.round(intra_pair_distance, rounding_digits))
+                                     & (pair_site_indices_2 > pair_site_indices_1))
+                    desired_pair_indices = np.column_stack((pair_site_indices_1[desired_pairs],
+                                                            pair_site_indices_2[desired_pairs]))
+                    desired_pair_indices = desired_pair_indices[np.lexsort((desired_pair_indices[:, 1],
+                                                                            desired_pair_indices[:, 0]))]
                     num_pairs = len(desired_pair_indices)
 
                     # arrange pairs in plane_of_arrangement
@@ -2234,11 +3238,14 @@ class Run(object):
             stat_decimals = 3
             if num_dopant_sites_inserted > 1:
                 prefix_list.append(f'{entry_list[0]}\t{entry_list[1]}\t{entry_list[2]}\t{entry_list[3]}\n')
+            inter_dopant_dist_array = np.linalg.norm(
+                    self.neighbors.min_image_vectors.get_rows(
+                        np.asarray(dopant_type_dopant_site_indices, dtype=int),
+                        np.asarray(dopant_type_dopant_site_indices, dtype=int)),
+                    axis=2) / constants.ANG2BOHR
             for index1, dopant_site_index_1 in enumerate(dopant_type_dopant_site_indices):
                 for index2, dopant_site_index_2 in enumerate(dopant_type_dopant_site_indices[index1+1:]):
-                    inter_dopant_dist = self.neighbors.compute_distance(self.system.system_size,
-                                                                        dopant_site_index_1,
-                                                                        dopant_site_index_2) / constants.ANG2BOHR
+                    inter_dopant_dist = inter_dopant_dist_array[index1, index1 + index2 + 1]
                     lookup_index = np.digitize(inter_dopant_dist,
                                                self.dist_based_shell_index_lookup[substitution_element_type_key]['dist_bins']) - 1
                     # number of shells in between
@@ -2389,9 +3396,11 @@ class Run(object):
                         'All shell based neighbor sites are NOT independent\n\n')
         return (site_wise_shell_indices_array, prefix_list)
 
-    def generate_initial_occupancy(self, dopant_site_indices):
+    def generate_initial_occupancy(self, dopant_site_indices,
+                                   random_generator):
         """generates initial occupancy list based on species count
         :param species_count:
+        :param random_generator: generator of the trajectory
         :return:
         """
         occupancy = []
@@ -2405,7 +3414,8 @@ class Run(object):
                         and dopant_species_type == species_type
                         and num_dopant_sites and num_species):
                         dopant_element_type = self.dopant_element_types[map_index]
-                        occupancy.extend(rnd.sample(dopant_site_indices[dopant_element_type], num_species)[:])
+                        occupancy.extend(random_generator.choice(
+                                dopant_site_indices[dopant_element_type], num_species, replace=False).tolist())
                         num_species -= len(dopant_site_indices[dopant_element_type][:num_species])
             if species_type in self.initial_occupancy:
                 occupancy.extend([index for index in self.initial_occupancy[species_type]])
@@ -2438,7 +3448,8 @@ class Run(object):
                     species_site_indices = [index
                                             for index in species_site_indices
                                             if index not in occupancy]
-                occupancy.extend(rnd.sample(species_site_indices, num_species)[:])
+                occupancy.extend(random_generator.choice(
+                        species_site_indices, num_species, replace=False).tolist())
         return occupancy
 
     def base_charge_config(self):
@@ -2451,6 +3462,19 @@ class Run(object):
                                                                 :, np.newaxis]
         return charge_list
 
+    def fixed_charge_config(self, dopant_site_indices):
+        """Returns the charges of the lattice ions and the dopants which
+            stay fixed along a trajectory
+        :param dopant_site_indices:
+        :return: """
+        charge_list = self.base_charge_config()
+        if self.doping_active:
+            for dopant_element_type, site_indices in dopant_site_indices.items():
+                dopant_site_charge = self.doping['charge'][
+                                    self.ion_charge_type][dopant_element_type]
+                charge_list[site_indices] = dopant_site_charge
+        return charge_list
+
     def charge_config(self, occupancy, dopant_site_indices):
         """Returns charge distribution of the current configuration
         :param occupancy:
@@ -2459,13 +3483,7 @@ class Run(object):
         :return:
         """
         
-        charge_list = self.base_charge_config()
-
-        if self.doping_active:
-            for dopant_element_type, site_indices in dopant_site_indices.items():
-                dopant_site_charge = self.doping['charge'][
-                                    self.ion_charge_type][dopant_element_type]
-                charge_list[site_indices] = dopant_site_charge
+        charge_list = self.fixed_charge_config(dopant_site_indices)
 
         for species_type_index in range(self.material.num_species_types):
             start_index = 0 + self.species_count[:species_type_index].sum()
@@ -2477,6 +3495,91 @@ class Run(object):
                                                         species_type_index])
         return charge_list
 
+    def carrier_charge_config(self, occupancy):
+        """Returns the charges of the carriers on the sublattice sites
+        :param occupancy:
+        :return: """
+        charge_list = np.zeros(len(self.sublattice_site_indices))
+        np.add.at(charge_list, self.sublattice_index_array[occupancy],
+                  self.species_charge_list)
+        return charge_list
+
+    def get_static_site_potential(self, dopant_site_indices):
+        """Returns the potential at the sublattice sites due to all fixed
+            charges of a trajectory along with their interaction energy.
+            The lattice charges outside the sublattice contribute the
+            precomputed lattice potential and the fixed charges on the
+            sublattice, including the dopants, are added through the
+            sublattice block
+        :param dopant_site_indices:
+        :return: """
+        dopant_site_index_list = [
+                            site_index
+                            for site_indices in dopant_site_indices.values()
+                            for site_index in site_indices]
+        assert np.all(self.sublattice_index_array[
+                        np.asarray(dopant_site_index_list, dtype=int)] >= 0), \
+            'Dopant sites must be sites of the substituted element types'
+        fixed_charge_config = self.fixed_charge_config(dopant_site_indices)[
+                                            self.sublattice_site_indices, 0]
+        static_site_potential = (self.lattice_site_potential
+                                 + self.precomputed_array.dot(
+                                                        fixed_charge_config))
+        static_energy = (self.lattice_energy
+                         + np.dot(fixed_charge_config,
+                                  self.lattice_site_potential
+                                  + static_site_potential))
+        return (static_site_potential, static_energy)
+
+    def get_configuration_energy(self, occupancy, static_site_potential,
+                                 static_energy):
+        """Returns the electrostatic energy of a configuration from the
+            static site potential and the pair terms among the carriers
+        :param occupancy:
+        :param static_site_potential:
+        :param static_energy: interaction energy of the fixed charges
+        :return: """
+        carrier_sublattice_index_list = self.sublattice_index_array[
+                                                        np.asarray(occupancy)]
+        species_charge_array = np.asarray(self.species_charge_list)
+        configuration_energy = (
+            static_energy
+            + 2 * np.dot(species_charge_array,
+                         static_site_potential[carrier_sublattice_index_list])
+            + np.dot(species_charge_array,
+                     np.dot(self.precomputed_array[
+                                carrier_sublattice_index_list[:, None],
+                                carrier_sublattice_index_list[None, :]],
+                            species_charge_array)))
+        return configuration_energy
+
+    def get_random_generator(self, random_seed, traj_index=None):
+        """Returns a PCG64 generator spawned from the SeedSequence of the
+            random seed. Child 0 of the sequence drives the doping
+            distributions of preproduction and child 1 spawns one stream per
+            trajectory, hence a trajectory draws the same numbers whether it
+            runs serially, on a worker process or in a batch
+        :param random_seed:
+        :param traj_index: index of the trajectory. Defaults to the
+                preproduction stream
+        :return: """
+        # same state as SeedSequence(random_seed).spawn(2)[1].spawn(n_traj)[traj_index]
+        spawn_key = (0,) if traj_index is None else (1, traj_index)
+        return np.random.Generator(np.random.PCG64(
+                    np.random.SeedSequence(random_seed, spawn_key=spawn_key)))
+
+    def get_traj_stream_index(self, traj_dir_path):
+        """Returns the index of the random stream of a trajectory. The
+            trajectory directory is named traj{stream index + 1} in every
+            compute mode, including parallel compute mode where each job
+            runs a single trajectory in its own trajectory directory
+        :param traj_dir_path:
+        :return: """
+        traj_dir_name = Path(traj_dir_path).resolve().name
+        assert traj_dir_name.startswith('traj') and traj_dir_name[4:].isdigit(), \
+            f'Trajectory directory {traj_dir_path} is not named traj<number>'
+        return int(traj_dir_name[4:]) - 1
+
     def preproduction(self, dst_path, random_seed):
         """Subroutine to setup input files to run the production stage of the simulation
         :param dst_path:
@@ -2484,14 +3587,10 @@ class Run(object):
         :return: """
         assert dst_path, 'Please provide the destination path where \
                           simulation output files needs to be saved'
-        rnd.seed(random_seed)
-        random_seed_list = [rnd.random() for traj_index in range(self.n_traj)]
+        self.doping_random_generator = self.get_random_generator(random_seed)
         for traj_index in range(self.n_traj):
             traj_dir_path = dst_path.joinpath(f'traj{traj_index+1}')
             Path.mkdir(traj_dir_path, parents=True, exist_ok=True)
-            random_state_file_path = traj_dir_path.joinpath(f'initial_rnd_state.dump')
-            rnd.seed(random_seed_list[traj_index])
-            pickle.dump(rnd.getstate(), open(random_state_file_path, 'wb'))
 
         if 'pairwise' in self.doping['insertion_type']:
             map_index = self.doping['insertion_type'].index('pairwise')
@@ -2558,239 +3657,1143 @@ class Run(object):
                                     print_time_elapsed, prefix)
         return None
 
-    def do_kmc_steps(self, dst_path, output_data, random_seed, compute_mode):
+    def get_traj_doping_state(self, traj_dir_path):
+        """Returns the dopant site indices of the trajectory together with
+            the site relative energies updated for the dopant shells
+        :param traj_dir_path:
+        :return: """
+        system_relative_energies = np.copy(self.undoped_system_relative_energies)
+        dopant_site_indices = {}
+        if not self.doping_active:
+            return (dopant_site_indices, system_relative_energies)
+
+        if 'pairwise' in self.doping['insertion_type']:
+            map_index = self.doping['insertion_type'].index('pairwise')
+            pairwise_insertion = self.doping['num_dopants'][map_index] != 0
+        else:
+            pairwise_insertion = 0
+
+        # Load doping distribution
+        if pairwise_insertion:
+            site_indices_file_path = traj_dir_path.parent / 'site_indices.npy'
+        else:
+            site_indices_file_path = traj_dir_path / 'site_indices.npy'
+        site_indices_data = np.load(site_indices_file_path)
+        site_indices_list = site_indices_data[:, 0]
+        dopant_element_type_index_list = site_indices_data[:, 1]
+        site_wise_shell_indices = site_indices_data[:, 3]
+        array_indices = np.where(site_wise_shell_indices == 0)[0]
+        for array_index in array_indices:
+            site_index = int(site_indices_list[array_index])
+            dopant_element_type = self.dopant_element_types[dopant_element_type_index_list[array_index]]
+            if dopant_element_type in dopant_site_indices:
+                dopant_site_indices[dopant_element_type].append(site_index)
+            else:
+                dopant_site_indices[dopant_element_type] = [site_index]
+
+        # update system_relative_energies
+        num_site_indices = len(dopant_element_type_index_list)
+        for index in range(num_site_indices):
+            site_index = site_indices_list[index]
+            shell_index = site_wise_shell_indices[index]
+            dopant_element_type = self.dopant_element_types[dopant_element_type_index_list[index]]
+            map_index = self.dopant_element_types.index(dopant_element_type)
+            substitution_element_type = self.substitution_element_types[map_index]
+            if shell_index < len(self.relative_energies['doping'][
+                                substitution_element_type][map_index]):
+                system_relative_energies[site_index] += (
+                    self.relative_energies['doping'][
+                        substitution_element_type][map_index][shell_index]
+                    * constants.EV2HARTREE)
+        return (dopant_site_indices, system_relative_energies)
+
+    def get_output_file_paths(self, traj_dir_path, output_data,
+                              write_occupancy):
+        """Returns the paths of the output data files of a trajectory
+        :param traj_dir_path:
+        :param output_data:
+        :param write_occupancy: if set, the occupancy at every kmc step is
+                written to occupancy.npy
+        :return: output file paths keyed by output data type """
+        output_file_paths = {
+                output_data_type: traj_dir_path / output_attributes['file_name']
+                for output_data_type, output_attributes in output_data.items()
+                if output_attributes['write']}
+        if write_occupancy:
+            output_file_paths['occupancy'] = traj_dir_path / 'occupancy.npy'
+        return output_file_paths
+
+    def get_output_streams(self, output_file_paths, background_writer,
+                           num_path_steps_per_traj, write_every_step,
+                           max_block_bytes=None):
+        """Returns the output streams of a trajectory, which write the data
+            arrays to disk in blocks on a background thread. Arrays sampled
+            at the path steps hold num_path_steps_per_traj rows and the
+            others a row per kmc step
+        :param output_file_paths: output file paths keyed by output data type
+        :param background_writer: BackgroundWriter executing the file writes
+        :param num_path_steps_per_traj:
+        :param write_every_step: if set, the unwrapped trajectory holds a row
+                per kmc step
+        :param max_block_bytes: size of the blocks of the streams
+        :return: ChunkedNpyWriter keyed by output data type """
+        row_attributes = {
+            'unwrapped_traj': ((self.total_species * 3,), float,
+                               None if write_every_step else num_path_steps_per_traj),
+            'time': ((), float, None),
+            'wrapped_traj': ((self.total_species * 3,), float,
+                             num_path_steps_per_traj),
+            'energy': ((), float, num_path_steps_per_traj),
+            'delg_0': ((), float, num_path_steps_per_traj),
+            'potential': ((self.total_species,), float,
+                          num_path_steps_per_traj),
+            'event_log': ((), self.event_log_dtype, None),
+            'occupancy': ((self.total_species,), int, None)}
+        output_streams = {}
+        for output_data_type, output_file_path in output_file_paths.items():
+            (row_shape, dtype, num_rows) = row_attributes[output_data_type]
+            output_streams[output_data_type] = ChunkedNpyWriter(
+                                output_file_path, row_shape, dtype,
+                                background_writer, num_rows, max_block_bytes)
+        return output_streams
+
+    def write_lane_kmc_steps(self, lane_output_streams, num_lane_kmc_steps,
+                             time_buffer, process_index_buffer,
+                             occupancy_buffer):
+        """Appends the kmc steps buffered for every trajectory of a batch to
+            its time, event log and occupancy streams
+        :param lane_output_streams: output streams of every trajectory
+        :param num_lane_kmc_steps: number of kmc steps buffered for every
+                trajectory, reset to zero
+        :param time_buffer:
+        :param process_index_buffer:
+        :param occupancy_buffer: None if the occupancy is not written
+        :return: """
+        for lane_index, output_streams in enumerate(lane_output_streams):
+            num_steps = num_lane_kmc_steps[lane_index]
+            if not num_steps:
+                continue
+            if 'time' in output_streams:
+                output_streams['time'].extend(time_buffer[lane_index,
+                                                          :num_steps])
+            if 'event_log' in output_streams:
+                event_log = np.zeros(num_steps, dtype=self.event_log_dtype)
+                event_log['time'] = time_buffer[lane_index, :num_steps]
+                event_log['process_index'] = process_index_buffer[
+                                                    lane_index, :num_steps]
+                event_log['species_index'] = np.asarray(
+                            self.n_proc_species_index_list)[
+                                                event_log['process_index']]
+                output_streams['event_log'].extend(event_log)
+            if 'occupancy' in output_streams:
+                output_streams['occupancy'].extend(
+                                    occupancy_buffer[lane_index, :num_steps])
+        num_lane_kmc_steps[:] = 0
+        return None
+
+    def store_traj_output_data(self, traj_dir_path, traj_index, output_data):
+        """Appends the output data files of a trajectory to the trajectory
+            store and removes them
+        :param traj_dir_path:
+        :param traj_index:
+        :param output_data:
+        :return: """
+        output_file_paths = {
+                output_data_type: traj_dir_path / output_attributes['file_name']
+                for output_data_type, output_attributes in output_data.items()
+                if output_attributes['write']}
+        if traj_dir_path.joinpath('occupancy.npy').exists():
+            output_file_paths['occupancy'] = traj_dir_path / 'occupancy.npy'
+        TrajectoryStore(self.trajectory_store_path).append(
+                traj_index, {output_data_type: np.load(output_file_path,
+                                                       mmap_mode='r')
+                             for output_data_type, output_file_path in (
+                                                output_file_paths.items())})
+        for output_file_path in output_file_paths.values():
+            output_file_path.unlink()
+        return None
+
+    def load_traj_checkpoint(self, traj_dir_path):
+        """Returns the state arrays of the checkpoint of a trajectory, or
+            None if checkpoints are inactive or the trajectory has none. A
+            checkpoint left by an earlier run is removed when checkpoints
+            are inactive since the trajectory is run from the start
+        :param traj_dir_path:
+        :return: """
+        checkpoint_file_path = traj_dir_path / self.checkpoint_file_name
+        if not self.checkpoint_active:
+            checkpoint_file_path.unlink(missing_ok=True)
+            return None
+        if not checkpoint_file_path.exists():
+            return None
+        with np.load(checkpoint_file_path) as checkpoint_data:
+            checkpoint = {key: checkpoint_data[key]
+                          for key in checkpoint_data.files}
+        return checkpoint
+
+    def write_traj_checkpoint(self, traj_dir_path, traj_state, output_streams,
+                              background_writer):
+        """Writes the state of a trajectory to its checkpoint along with the
+            number of rows of every output data array, once the rows written
+            so far are on disk. The checkpoint is replaced atomically, hence
+            a run killed at any point leaves the previous checkpoint intact
+        :param traj_dir_path:
+        :param traj_state: state arrays keyed by name
+        :param output_streams: ChunkedNpyWriter keyed by output data type
+        :param background_writer:
+        :return: """
+        for output_stream in output_streams.values():
+            output_stream.flush_block()
+        background_writer.wait()
+        traj_state['output_num_rows'] = json.dumps(
+                    {output_data_type: output_stream.get_num_rows()
+                     for output_data_type, output_stream in output_streams.items()})
+        checkpoint_file_path = traj_dir_path / self.checkpoint_file_name
+        staging_file_path = traj_dir_path / f'.{self.checkpoint_file_name}'
+        with open(staging_file_path, 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **traj_state)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(staging_file_path, checkpoint_file_path)
+        return None
+
+    def restore_traj_output_rows(self, output_file_path, traj_index,
+                                 output_data_type, output_stream, num_rows):
+        """Copies the rows of an output data array written up to the
+            checkpoint to its output stream. Rows are read from the output
+            file moved aside on resume, or from the trajectory store once
+            the trajectory was moved to it
+        :param output_file_path:
+        :param traj_index:
+        :param output_data_type:
+        :param output_stream: ChunkedNpyWriter of the output data array
+        :param num_rows: number of rows at the checkpoint
+        :return: """
+        previous_output_file_path = output_file_path.with_name(
+                                        f'{output_file_path.name}.previous')
+        if previous_output_file_path.exists():
+            output_stream.extend(np.load(previous_output_file_path,
+                                         mmap_mode='r')[:num_rows])
+            return None
+        assert self.trajectory_store_path is not None, \
+            f'{output_file_path} of the checkpoint is missing'
+        trajectory_store = TrajectoryStore(self.trajectory_store_path)
+        for start_row_index in range(0, num_rows, output_stream.block_size):
+            output_stream.extend(trajectory_store.get_array(
+                    traj_index, output_data_type, start_row_index,
+                    min(start_row_index + output_stream.block_size, num_rows)))
+        return None
+
+    def get_ewald_neut(self):
+        """Returns the energy correction of the net system charge
+        :return: """
+        system_charge = np.dot(self.species_count,
+                               self.material.species_charge_list[
+                                            self.species_charge_type])
+        ewald_neut = - (np.pi * (system_charge**2)
+                        / (2 * self.system.system_volume * self.system.alpha))
+        return ewald_neut
+
+    def do_kmc_steps(self, dst_path, output_data, random_seed, compute_mode,
+                     batch_size=None, num_workers=None, trajectory_store=0,
+                     checkpoint=None):
         """Subroutine to run the KMC simulation by specified number
         of steps
         :param dst_path:
+        :param compute_mode: 'serial' and 'parallel' run the trajectories one
+                after another, 'batch' advances batches of trajectories in
+                lockstep and 'multiprocess' runs trajectories on a pool of
+                worker processes
+        :param batch_size: number of trajectories advanced in lockstep in
+                'batch' compute mode. Defaults to all trajectories
+        :param num_workers: number of worker processes in 'multiprocess'
+                compute mode. Defaults to the number of CPUs
+        :param trajectory_store: if set, the output data arrays of all
+                trajectories are moved to a single TrajectoryStore in the
+                destination path once each trajectory is done
+        :param checkpoint: step_interval in kmc steps and
+                wall_time_interval in seconds between checkpoints of a
+                trajectory. When either is set, trajectories resume from
+                their checkpoint, hence interrupted runs are continued and
+                t_final of a finished run can be extended
         :return: """
         assert dst_path, 'Please provide the destination path where \
                           simulation output files needs to be saved'
+        if checkpoint is None:
+            checkpoint = {}
+        self.checkpoint_step_interval = int(checkpoint.get('step_interval', 0))
+        self.checkpoint_wall_time_interval = float(
+                                    checkpoint.get('wall_time_interval', 0))
+        self.checkpoint_active = bool(self.checkpoint_step_interval
+                                      or self.checkpoint_wall_time_interval)
+        if trajectory_store:
+            self.trajectory_store_path = dst_path / TrajectoryStore.file_name
+            # trajectories already in the store are kept when resuming
+            if not (self.checkpoint_active
+                    and self.trajectory_store_path.exists()):
+                TrajectoryStore.create(self.trajectory_store_path, self.n_traj)
+        else:
+            self.trajectory_store_path = None
+        self.random_seed = random_seed
 
         if compute_mode != 'parallel':
             self.preproduction(dst_path, random_seed)
-        num_path_steps_per_traj = int(self.t_final / self.time_interval) + 1
-        if self.electric_field_active:
-            drift_velocity_array = np.zeros((self.n_traj,
-                                             self.total_species, 3))
+        drift_velocity_array = np.zeros((self.n_traj, self.total_species, 3))
 
         prefix_list = []
-        system_charge = np.dot(self.species_count,
-                               self.material.species_charge_list[
-                                            self.species_charge_type])
-        ewald_neut = - (np.pi * (system_charge**2)
-                        / (2 * self.system.system_volume * self.system.alpha))
-        for traj_index in range(self.n_traj):
-            if output_data['unwrapped_traj']['write_every_step']:
-                kmc_step_index = 0
-            if compute_mode != 'parallel':
-                traj_dir_path = dst_path.joinpath(f'traj{traj_index+1}')
-                Path.mkdir(traj_dir_path, parents=True, exist_ok=True)
-            else:
-                traj_dir_path = dst_path
-
-            # Load random state
-            random_state_file_path = traj_dir_path.joinpath(f'initial_rnd_state.dump')
-            rnd.setstate(pickle.load(open(random_state_file_path, 'rb')))
-
-            # Initialize data arrays
-            write_time_data = 0
-            for output_data_type, output_attributes in output_data.items():
-                if output_attributes['write']:
-                    if output_data_type == 'unwrapped_traj':
-                        if output_data[output_data_type]['write_every_step']:
-                            write_every_step = 1
-                            unwrapped_position_array = np.zeros((1, self.total_species * 3))
-                        else:
-                            write_every_step = 0
-                            unwrapped_position_array = np.zeros(
-                                    (num_path_steps_per_traj, self.total_species * 3))
-                    elif output_data_type == 'time':
-                        time_data = [0.0]
-                        write_time_data = 1
-                    elif output_data_type == 'wrapped_traj':
-                        wrapped_position_array = np.zeros((num_path_steps_per_traj,
-                                                           self.total_species * 3))
-                    elif output_data_type == 'energy':
-                        energy_array = np.zeros(num_path_steps_per_traj)
-                    elif output_data_type == 'delg_0':
-                        delg_0_array = np.zeros(num_path_steps_per_traj)
-                    elif output_data_type == 'potential':
-                        potential_array = np.zeros((num_path_steps_per_traj,
-                                                    self.total_species))
-
-            if self.doping_active:
-                self.system_relative_energies = np.copy(self.undoped_system_relative_energies)
-
-                if 'pairwise' in self.doping['insertion_type']:
-                    map_index = self.doping['insertion_type'].index('pairwise')
-                    pairwise_insertion = self.doping['num_dopants'][map_index] != 0
+        ewald_neut = self.get_ewald_neut()
+        max_potential_drift = 0
+        if compute_mode == 'batch':
+            assert self.selection_backend == 'dense', \
+                'batch compute mode requires the dense selection_backend'
+            assert not self.checkpoint_active, \
+                'checkpoints are not supported in batch compute mode'
+            if batch_size is None:
+                batch_size = self.n_traj
+            batch_size = int(batch_size)
+            assert batch_size > 0, 'batch_size must be a positive integer'
+            for batch_start_index in range(0, self.n_traj, batch_size):
+                traj_indices = np.arange(
+                    batch_start_index, min(batch_start_index + batch_size,
+                                           self.n_traj))
+                potential_drift = self.do_lockstep_kmc_steps(
+                        dst_path, output_data, traj_indices, ewald_neut,
+                        drift_velocity_array)
+                max_potential_drift = max(max_potential_drift, potential_drift)
+            prefix_list.append(
+                f'Trajectories were advanced in lockstep batches of up to {batch_size} trajectories\n')
+        elif compute_mode == 'multiprocess':
+            if num_workers is None:
+                num_workers = os.cpu_count()
+            num_workers = int(num_workers)
+            assert num_workers > 0, 'num_workers must be a positive integer'
+            max_potential_drift = self.do_pooled_kmc_steps(
+                    dst_path, output_data, ewald_neut, drift_velocity_array,
+                    num_workers)
+            prefix_list.append(
+                f'Trajectories were distributed over {num_workers} worker processes\n')
+        else:
+            for traj_index in range(self.n_traj):
+                if compute_mode != 'parallel':
+                    traj_dir_path = dst_path.joinpath(f'traj{traj_index+1}')
+                    Path.mkdir(traj_dir_path, parents=True, exist_ok=True)
                 else:
-                    pairwise_insertion = 0
+                    traj_dir_path = dst_path
+                potential_drift = self.do_traj_kmc_steps(
+                        traj_dir_path, traj_index, output_data, ewald_neut,
+                        drift_velocity_array)
+                max_potential_drift = max(max_potential_drift, potential_drift)
 
-                # Load doping distribution
-                if pairwise_insertion:
-                    site_indices_file_path = traj_dir_path.parent / 'site_indices.npy'
-                else:
-                    site_indices_file_path = traj_dir_path / 'site_indices.npy'
-                site_indices_data = np.load(site_indices_file_path)
-                site_indices_list = site_indices_data[:, 0]
-                dopant_element_type_index_list = site_indices_data[:, 1]
-                site_wise_shell_indices = site_indices_data[:, 3]
-                dopant_site_indices = {}
-                array_indices = np.where(site_wise_shell_indices == 0)[0]
-                for array_index in array_indices:
-                    site_index = int(site_indices_list[array_index])
-                    dopant_element_type = self.dopant_element_types[dopant_element_type_index_list[array_index]]
-                    if dopant_element_type in dopant_site_indices:
-                        dopant_site_indices[dopant_element_type].append(site_index)
-                    else:
-                        dopant_site_indices[dopant_element_type] = [site_index]
-                
-                # update system_relative_energies
-                num_site_indices = len(dopant_element_type_index_list)
-                for index in range(num_site_indices):
-                    site_index = site_indices_list[index]
-                    shell_index = site_wise_shell_indices[index]
-                    dopant_element_type = self.dopant_element_types[dopant_element_type_index_list[index]]
-                    map_index = self.dopant_element_types.index(dopant_element_type)
-                    substitution_element_type = self.substitution_element_types[map_index]
-                    if shell_index < len(self.relative_energies['doping'][
-                                        substitution_element_type][map_index]):
-                        self.system_relative_energies[site_index] += (
-                            self.relative_energies['doping'][
-                                substitution_element_type][map_index][shell_index]
-                            * constants.EV2HARTREE)
-                occupancy_list = []
-            else:
-                dopant_site_indices = {}
+        if self.electric_field_active:
+            prefix_list = self.compute_drift_mobility(drift_velocity_array,
+                                                      dst_path, prefix_list)
+        prefix_list.append(
+            f'Site interactions were restricted to {len(self.sublattice_site_indices)} '
+            f'of {self.neighbors.num_system_elements} sites\n')
+        prefix_list.append(
+            f'Site potentials were evaluated with the {self.potential_evaluation} path\n')
+        prefix_list.append(
+            f'Maximum deviation of site potential cache from full recomputation: '
+            f'{max_potential_drift / constants.V2AUPOT:.3e} V\n')
 
-            current_state_occupancy = self.generate_initial_occupancy(
-                                                        dopant_site_indices)
-            if self.doping_active:
-                occupancy_list.append([index for index in current_state_occupancy])
-            current_state_charge_config = self.charge_config(
-                                current_state_occupancy, dopant_site_indices)
-            current_state_charge_config_prod = np.multiply(
-                                    current_state_charge_config.transpose(),
-                                    current_state_charge_config)
-            current_state_energy = (ewald_neut
-                                    + np.sum(np.multiply(current_state_charge_config_prod,
-                                                         self.precomputed_array)))
-            start_path_index = end_path_index = 1
+        file_name = 'Run'
+        prefix = ''.join(prefix_list)
+        print_time_elapsed = 1
+        generate_report(self.start_time, dst_path, file_name, print_time_elapsed,
+                        prefix)
+        return None
+
+    def do_pooled_kmc_steps(self, dst_path, output_data, ewald_neut,
+                            drift_velocity_array, num_workers):
+        """Runs the trajectories on a pool of worker processes.
+            precomputed_array, the pairwise min image vectors and the process
+            table are placed in shared memory once and attached by every
+            worker instead of being copied. Trajectories are handed out one
+            at a time to balance the load across workers
+        :param dst_path:
+        :param output_data:
+        :param ewald_neut: energy correction of the net system charge
+        :param drift_velocity_array: drift velocities of all trajectories
+                updated in place
+        :param num_workers: number of worker processes
+        :return: maximum deviation of the site potential cache """
+        shared_arrays = {}
+        if isinstance(self.precomputed_array, InteractionMatrix):
+            shared_arrays[('precomputed_array', 'compressed_array')] = (
+                                    self.precomputed_array.compressed_array)
+        elif isinstance(self.precomputed_array, PackedSymmetricMatrix):
+            shared_arrays[('precomputed_array', 'packed_array')] = (
+                                    self.precomputed_array.packed_array)
+        else:
+            shared_arrays[('run', 'precomputed_array')] = self.precomputed_array
+        if self.system.pairwise_min_image_vector_data is not None:
+            shared_arrays[('system', 'pairwise_min_image_vector_data')] = (
+                                    self.system.pairwise_min_image_vector_data)
+        for attribute, array in vars(self.process_table).items():
+            shared_arrays[('process_table', attribute)] = array
+
+        # worker copy of the run without the shared arrays
+        worker_run = copy.copy(self)
+        if isinstance(self.precomputed_array, InteractionMatrix):
+            worker_run.precomputed_array = copy.copy(self.precomputed_array)
+            worker_run.precomputed_array.compressed_array = None
+            worker_run.precomputed_array.fourier_compressed_array = None
+        elif isinstance(self.precomputed_array, PackedSymmetricMatrix):
+            worker_run.precomputed_array = copy.copy(self.precomputed_array)
+            worker_run.precomputed_array.packed_array = None
+        else:
+            worker_run.precomputed_array = None
+        worker_run.process_table = ReturnValues()
+        worker_run.system = copy.copy(self.system)
+        worker_run.system.pairwise_min_image_vector_data = None
+
+        traj_args_list = [(dst_path.joinpath(f'traj{traj_index+1}'), traj_index,
+                           output_data, ewald_neut)
+                          for traj_index in range(self.n_traj)]
+        max_potential_drift = 0
+        shared_memory_list = []
+        try:
+            shared_array_specs = {}
+            for array_key, array in shared_arrays.items():
+                array = np.ascontiguousarray(array)
+                shared_memory = SharedMemory(create=True,
+                                             size=max(array.nbytes, 1))
+                shared_memory_list.append(shared_memory)
+                np.ndarray(array.shape, dtype=array.dtype,
+                           buffer=shared_memory.buf)[...] = array
+                shared_array_specs[array_key] = (shared_memory.name,
+                                                 array.shape, array.dtype.str)
+            with Pool(num_workers, initializer=initialize_traj_worker,
+                      initargs=(worker_run, shared_array_specs)) as pool:
+                for (traj_index, traj_drift_velocity_array,
+                     potential_drift) in pool.imap_unordered(
+                                do_traj_kmc_steps_in_worker, traj_args_list,
+                                chunksize=1):
+                    drift_velocity_array[traj_index] = traj_drift_velocity_array
+                    max_potential_drift = max(max_potential_drift,
+                                              potential_drift)
+        finally:
+            for shared_memory in shared_memory_list:
+                shared_memory.close()
+                shared_memory.unlink()
+        return max_potential_drift
+
+    def get_initial_traj_state(self, traj_dir_path, traj_index, ewald_neut,
+                               random_generator):
+        """Loads the temperature, electric field and doping state of the
+            trajectory and returns its initial occupancy, carrier charge
+            configuration, static site potential, site potential and energy
+        :param traj_dir_path:
+        :param traj_index:
+        :param ewald_neut: energy correction of the net system charge
+        :param random_generator: generator of the trajectory, from which the
+                initial occupancy is drawn
+        :return: """
+        self.temp = self.traj_temp[traj_index]
+        self.electric_field = self.traj_electric_field[traj_index]
+
+        (dopant_site_indices, self.system_relative_energies) = (
+                                    self.get_traj_doping_state(traj_dir_path))
+        occupancy = self.generate_initial_occupancy(dopant_site_indices,
+                                                    random_generator)
+        (static_site_potential, static_energy) = (
+                        self.get_static_site_potential(dopant_site_indices))
+        charge_config = self.carrier_charge_config(occupancy)
+        if self.potential_evaluation == 'sparse':
+            site_potential = static_site_potential
+        else:
+            site_potential = self.get_site_potential(charge_config,
+                                                     static_site_potential)
+        energy = (ewald_neut
+                  + self.get_configuration_energy(occupancy,
+                                                  static_site_potential,
+                                                  static_energy))
+        return (occupancy, charge_config, static_site_potential,
+                site_potential, energy)
+
+    def do_traj_kmc_steps(self, traj_dir_path, traj_index, output_data,
+                          ewald_neut, drift_velocity_array):
+        """Runs the KMC simulation of a single trajectory and writes its
+            output data to the trajectory directory
+        :param traj_dir_path:
+        :param traj_index:
+        :param output_data:
+        :param ewald_neut: energy correction of the net system charge
+        :param drift_velocity_array: drift velocities of all trajectories
+                updated in place
+        :return: maximum deviation of the site potential cache """
+        num_path_steps_per_traj = int(self.t_final / self.time_interval) + 1
+        max_potential_drift = 0
+        write_every_step = (output_data['unwrapped_traj']['write']
+                            and output_data['unwrapped_traj']['write_every_step'])
+        kmc_step_index = 0
+        # the occupancy at every kmc step is recoverable from the event log
+        write_event_log = ('event_log' in output_data
+                           and output_data['event_log']['write'])
+        write_occupancy = self.doping_active and not write_event_log
+
+        output_file_paths = self.get_output_file_paths(
+                                traj_dir_path, output_data, write_occupancy)
+        checkpoint = self.load_traj_checkpoint(traj_dir_path)
+        if checkpoint is not None:
+            checkpoint_num_path_steps_per_traj = int(
+                                    checkpoint['num_path_steps_per_traj'])
+            assert checkpoint_num_path_steps_per_traj <= num_path_steps_per_traj, \
+                f'Checkpoint of trajectory {traj_index+1} is beyond t_final. t_final of a run can only be extended'
+            output_num_rows = json.loads(str(checkpoint['output_num_rows']))
+            assert set(output_num_rows) == set(output_file_paths), \
+                f'Output data of the checkpoint of trajectory {traj_index+1} differs from output_data'
+            if (checkpoint_num_path_steps_per_traj == num_path_steps_per_traj
+                    and checkpoint['end_path_index'] >= num_path_steps_per_traj):
+                # trajectory is complete
+                drift_velocity_array[traj_index] = checkpoint['drift_velocity']
+                if (self.trajectory_store_path is not None
+                        and traj_index not in TrajectoryStore(
+                                self.trajectory_store_path).get_traj_indices()):
+                    self.store_traj_output_data(traj_dir_path, traj_index,
+                                                output_data)
+                return float(checkpoint['max_potential_drift'])
+            # output data written up to the checkpoint is moved aside and
+            # copied to the new output files
+            for output_file_path in output_file_paths.values():
+                previous_output_file_path = output_file_path.with_name(
+                                        f'{output_file_path.name}.previous')
+                if (output_file_path.exists()
+                        and not previous_output_file_path.exists()):
+                    os.replace(output_file_path, previous_output_file_path)
+
+        # Initialize output streams, which write the data arrays to disk in
+        # blocks on a background thread
+        background_writer = BackgroundWriter()
+        output_streams = self.get_output_streams(
+                            output_file_paths, background_writer,
+                            num_path_steps_per_traj, write_every_step)
+
+        random_generator = self.get_random_generator(
+                    self.random_seed, self.get_traj_stream_index(traj_dir_path))
+        (current_state_occupancy, current_state_charge_config,
+         static_site_potential, current_state_site_potential,
+         current_state_energy) = self.get_initial_traj_state(
+                                        traj_dir_path, traj_index, ewald_neut,
+                                        random_generator)
+        random_numbers = UniformBlockStream(random_generator)
+        num_kmc_steps = 0
+        start_path_index = end_path_index = 1
+        sim_time = 0
+        delg_0 = 0.0
+        species_displacement_vector_list = np.zeros(
+                                            (1, self.total_species * 3))
+        last_position_array = np.zeros((1, self.total_species * 3))
+        if checkpoint is None:
+            if output_data['time']['write']:
+                output_streams['time'].append(0.0)
+            if write_occupancy:
+                output_streams['occupancy'].append(current_state_occupancy)
             if output_data['energy']['write']:
-                energy_array[0] = current_state_energy
-            species_displacement_vector_list = np.zeros(
-                                                (1, self.total_species * 3))
-            sim_time = 0
-            while end_path_index < num_path_steps_per_traj:
+                output_streams['energy'].write(0, 1, current_state_energy)
+        else:
+            for output_data_type, output_stream in output_streams.items():
+                self.restore_traj_output_rows(
+                            output_file_paths[output_data_type], traj_index,
+                            output_data_type, output_stream,
+                            output_num_rows[output_data_type])
+            background_writer.wait()
+            for output_file_path in output_file_paths.values():
+                output_file_path.with_name(
+                    f'{output_file_path.name}.previous').unlink(missing_ok=True)
+
+            current_state_occupancy = checkpoint['occupancy'].tolist()
+            current_state_charge_config = checkpoint['charge_config']
+            current_state_site_potential = checkpoint['site_potential']
+            current_state_energy = float(checkpoint['energy'])
+            num_kmc_steps = int(checkpoint['num_kmc_steps'])
+            kmc_step_index = int(checkpoint['kmc_step_index'])
+            start_path_index = int(checkpoint['start_path_index'])
+            end_path_index = int(checkpoint['end_path_index'])
+            sim_time = float(checkpoint['sim_time'])
+            delg_0 = float(checkpoint['delg_0'])
+            species_displacement_vector_list = checkpoint[
+                                        'species_displacement_vector_list']
+            last_position_array = checkpoint['last_position_array']
+            drift_velocity_array[traj_index] = checkpoint['drift_velocity']
+            max_potential_drift = float(checkpoint['max_potential_drift'])
+            random_generator.bit_generator.state = json.loads(
+                                            str(checkpoint['random_state']))
+            random_numbers.block = checkpoint['random_block'].tolist()
+            random_numbers.block_index = int(checkpoint['random_block_index'])
+            if start_path_index > checkpoint_num_path_steps_per_traj:
+                # rows of the last kmc step beyond the previous t_final
+                if output_data['delg_0']['write']:
+                    output_streams['delg_0'].write(
+                                    checkpoint_num_path_steps_per_traj,
+                                    start_path_index, delg_0)
+                if output_data['unwrapped_traj']['write'] and not write_every_step:
+                    output_streams['unwrapped_traj'].write(
+                                    checkpoint_num_path_steps_per_traj,
+                                    start_path_index, last_position_array)
+                if output_data['energy']['write']:
+                    output_streams['energy'].write(
+                                    checkpoint_num_path_steps_per_traj,
+                                    start_path_index, current_state_energy)
+        fenwick_selection = self.selection_backend == 'fenwick'
+        if fenwick_selection:
+            process_attributes = self.get_process_attributes(
+                                                current_state_occupancy)
+            process_rate_arrays = (
+                    (process_attributes[1],)
+                    + self.get_process_rates(process_attributes,
+                                             current_state_site_potential,
+                                             current_state_occupancy))
+            (new_site_system_element_index_list, k_list, nproc_delg_0_array,
+             nproc_hop_vector_array) = process_rate_arrays
+            rate_tree = FenwickTree(k_list)
+            if checkpoint is not None:
+                new_site_system_element_index_list[:] = checkpoint[
+                                        'new_site_system_element_index_list']
+                k_list[:] = checkpoint['k_list']
+                nproc_delg_0_array[:] = checkpoint['nproc_delg_0_array']
+                nproc_hop_vector_array[:] = checkpoint['nproc_hop_vector_array']
+                rate_tree.values = checkpoint['rate_tree_values'].tolist()
+                rate_tree.tree = checkpoint['rate_tree'].tolist()
+                rate_tree.total = float(checkpoint['rate_tree_total'])
+        checkpoint_time = time.monotonic()
+        checkpoint_kmc_step = num_kmc_steps
+        while True:
+            if self.checkpoint_active and (
+                    end_path_index >= num_path_steps_per_traj
+                    or (self.checkpoint_step_interval
+                        and (num_kmc_steps - checkpoint_kmc_step
+                             >= self.checkpoint_step_interval))
+                    or (self.checkpoint_wall_time_interval
+                        and (time.monotonic() - checkpoint_time
+                             >= self.checkpoint_wall_time_interval))):
+                traj_state = {
+                    'num_path_steps_per_traj': num_path_steps_per_traj,
+                    'occupancy': current_state_occupancy,
+                    'charge_config': current_state_charge_config,
+                    'site_potential': current_state_site_potential,
+                    'energy': current_state_energy,
+                    'num_kmc_steps': num_kmc_steps,
+                    'kmc_step_index': kmc_step_index,
+                    'start_path_index': start_path_index,
+                    'end_path_index': end_path_index,
+                    'sim_time': sim_time,
+                    'delg_0': delg_0,
+                    'species_displacement_vector_list':
+                                            species_displacement_vector_list,
+                    'last_position_array': last_position_array,
+                    'drift_velocity': drift_velocity_array[traj_index],
+                    'max_potential_drift': max_potential_drift,
+                    'random_state': json.dumps(
+                                        random_generator.bit_generator.state),
+                    'random_block': random_numbers.block,
+                    'random_block_index': random_numbers.block_index}
+                if fenwick_selection:
+                    traj_state.update({
+                        'new_site_system_element_index_list':
+                                            new_site_system_element_index_list,
+                        'k_list': k_list,
+                        'nproc_delg_0_array': nproc_delg_0_array,
+                        'nproc_hop_vector_array': nproc_hop_vector_array,
+                        'rate_tree_values': rate_tree.values,
+                        'rate_tree': rate_tree.tree,
+                        'rate_tree_total': rate_tree.total})
+                self.write_traj_checkpoint(traj_dir_path, traj_state,
+                                           output_streams, background_writer)
+                checkpoint_time = time.monotonic()
+                checkpoint_kmc_step = num_kmc_steps
+            if end_path_index >= num_path_steps_per_traj:
+                break
+
+            if fenwick_selection:
+                k_total = rate_tree.total
+                # Randomly choose a kinetic process
+                rand1 = random_numbers.random()
+                proc_index = rate_tree.search(rand1 * k_total)
+                # delG0 of the chosen process may be stale beyond the
+                # interaction radius
+                if self.interaction_radius is not None:
+                    nproc_delg_0_array[proc_index] = self.get_process_rates(
+                        self.get_process_attributes(current_state_occupancy,
+                                                    [proc_index]),
+                        current_state_site_potential, current_state_occupancy,
+                        [proc_index])[1][0]
+            else:
                 process_attributes = self.get_process_attributes(
                                                     current_state_occupancy)
                 new_site_system_element_index_list = process_attributes[1]
                 process_rate_info = self.get_process_rates(
-                            process_attributes, current_state_charge_config)
+                            process_attributes, current_state_site_potential,
+                            current_state_occupancy)
                 (k_list, nproc_delg_0_array,
                  nproc_hop_vector_array) = process_rate_info
 
                 k_total = sum(k_list)
                 k_cum_sum = (k_list / k_total).cumsum()
                 # Randomly choose a kinetic process
-                rand1 = rnd.random()
+                rand1 = random_numbers.random()
                 proc_index = np.where(k_cum_sum > rand1)[0][0]
-                # Update simulation time
-                rand2 = rnd.random()
-                sim_time -= np.log(rand2) / k_total
-                end_path_index = int(sim_time / self.time_interval)
-
-                # Update data arrays at each kmc step
-                if output_data['delg_0']['write']:
-                    delg_0_array[start_path_index:end_path_index] = \
-                        nproc_delg_0_array[proc_index]
-                species_index = self.n_proc_species_index_list[proc_index]
-                old_site_system_element_index = current_state_occupancy[
-                                                                species_index]
-                new_site_system_element_index = (
-                                new_site_system_element_index_list[proc_index])
-                current_state_occupancy[species_index] = \
-                    new_site_system_element_index
-                if self.doping_active:
-                    occupancy_list.append([index for index in current_state_occupancy])
-                species_displacement_vector_list[
-                    0, species_index * 3:(species_index + 1) * 3] += \
-                        nproc_hop_vector_array[proc_index]
-                if self.electric_field_active:
-                    drift_velocity_array[traj_index, species_index, :] += (
-                                            nproc_hop_vector_array[proc_index]
-                                            * k_list[proc_index])
-                current_state_energy += nproc_delg_0_array[proc_index]
-                current_state_charge_config[old_site_system_element_index] -= \
-                    self.species_charge_list[species_index]
-                current_state_charge_config[new_site_system_element_index] += \
-                    self.species_charge_list[species_index]
-
-                if write_every_step:
-                    if kmc_step_index == 0:
-                        unwrapped_position_array = np.zeros(
-                                                    (1, self.total_species * 3))
-                    else:
-                        unwrapped_position_array = np.vstack(
-                                    (unwrapped_position_array,
-                                     unwrapped_position_array[kmc_step_index-1]
-                                     + species_displacement_vector_list))
-                    kmc_step_index += 1
+            delg_0 = nproc_delg_0_array[proc_index]
+            # Update simulation time
+            rand2 = random_numbers.random()
+            sim_time -= np.log(rand2) / k_total
+            end_path_index = int(sim_time / self.time_interval)
+
+            # Update data arrays at each kmc step
+            if output_data['delg_0']['write']:
+                output_streams['delg_0'].write(start_path_index,
+                                               end_path_index, delg_0)
+            species_index = self.n_proc_species_index_list[proc_index]
+            old_site_system_element_index = current_state_occupancy[
+                                                            species_index]
+            new_site_system_element_index = (
+                            new_site_system_element_index_list[proc_index])
+            current_state_occupancy[species_index] = \
+                new_site_system_element_index
+            if write_occupancy:
+                output_streams['occupancy'].append(current_state_occupancy)
+            if write_event_log:
+                output_streams['event_log'].append(
+                                    (sim_time, species_index, proc_index))
+            species_displacement_vector_list[
+                0, species_index * 3:(species_index + 1) * 3] += \
+                    nproc_hop_vector_array[proc_index]
+            if self.electric_field_active:
+                drift_velocity_array[traj_index, species_index, :] += (
+                                        nproc_hop_vector_array[proc_index]
+                                        * k_list[proc_index])
+            current_state_energy += delg_0
+            current_state_charge_config[self.sublattice_index_array[
+                                        old_site_system_element_index]] -= \
+                self.species_charge_list[species_index]
+            current_state_charge_config[self.sublattice_index_array[
+                                        new_site_system_element_index]] += \
+                self.species_charge_list[species_index]
+            if self.potential_evaluation == 'incremental':
+                self.update_site_potential(
+                    current_state_site_potential, old_site_system_element_index,
+                    new_site_system_element_index,
+                    self.species_charge_list[species_index])
+            elif self.potential_evaluation == 'dense':
+                current_state_site_potential = self.get_site_potential(
+                        current_state_charge_config, static_site_potential)
+            num_kmc_steps += 1
+            if num_kmc_steps % self.potential_check_interval == 0:
+                if self.potential_evaluation == 'incremental':
+                    (current_state_site_potential, potential_drift) = (
+                        self.check_site_potential(
+                                current_state_site_potential,
+                                current_state_charge_config,
+                                static_site_potential))
+                    max_potential_drift = max(max_potential_drift,
+                                              potential_drift)
+                if fenwick_selection:
+                    process_attributes = self.get_process_attributes(
+                                                    current_state_occupancy)
+                    new_site_system_element_index_list[:] = \
+                        process_attributes[1]
+                    (k_list[:], nproc_delg_0_array[:],
+                     nproc_hop_vector_array[:]) = self.get_process_rates(
+                            process_attributes, current_state_site_potential,
+                            current_state_occupancy)
+                    rate_tree.rebuild(k_list)
+            elif fenwick_selection:
+                self.update_process_rates(
+                        rate_tree, process_rate_arrays, current_state_occupancy,
+                        current_state_site_potential,
+                        self.get_local_proc_indices(
+                                        current_state_occupancy,
+                                        old_site_system_element_index,
+                                        new_site_system_element_index))
+
+            if write_every_step:
+                if kmc_step_index != 0:
+                    last_position_array = (last_position_array
+                                           + species_displacement_vector_list)
+                output_streams['unwrapped_traj'].append(last_position_array)
+                kmc_step_index += 1
+                species_displacement_vector_list = np.zeros(
+                                                (1, self.total_species * 3))
+            if output_data['time']['write']:
+                output_streams['time'].append(sim_time)
+
+            # Update data arrays for each path step. Rows beyond t_final are
+            # clipped by the output streams
+            if end_path_index >= start_path_index + 1:
+                if not write_every_step:
+                    last_position_array = (last_position_array
+                                           + species_displacement_vector_list)
+                    if output_data['unwrapped_traj']['write']:
+                        output_streams['unwrapped_traj'].write(
+                                start_path_index, end_path_index,
+                                last_position_array)
+                if output_data['energy']['write']:
+                    output_streams['energy'].write(start_path_index,
+                                                   end_path_index,
+                                                   current_state_energy)
+                if not write_every_step:
                     species_displacement_vector_list = np.zeros(
-                                                    (1, self.total_species * 3))
-                if write_time_data:
-                    time_data.append(sim_time)
-
-                # Update data arrays for each path step
-                if end_path_index >= start_path_index + 1:
-                    if end_path_index >= num_path_steps_per_traj:
-                        end_path_index = num_path_steps_per_traj
-                    if not write_every_step:
-                        unwrapped_position_array[start_path_index:end_path_index] \
-                            = (unwrapped_position_array[start_path_index-1]
-                               + species_displacement_vector_list)
+                                                (1, self.total_species * 3))
+                start_path_index = end_path_index
+
+        # Write the remaining rows of the output data arrays to disk
+        for output_stream in output_streams.values():
+            output_stream.close()
+        background_writer.close()
+        if self.trajectory_store_path is not None:
+            self.store_traj_output_data(traj_dir_path, traj_index, output_data)
+        return max_potential_drift
+
+    def do_lockstep_kmc_steps(self, dst_path, output_data, traj_indices,
+                              ewald_neut, drift_velocity_array):
+        """Runs a batch of trajectories advanced in lockstep. The state of
+            the batch is held in 2-D arrays with one row per trajectory such
+            that rate evaluation and process selection are vectorized across
+            the batch. Each trajectory draws from its own random generator
+            and leaves the batch once it reaches t_final, hence its output
+            is the same as that of a serial run. Output data of every
+            trajectory is streamed to disk as in the serial engine
+        :param dst_path:
+        :param output_data:
+        :param traj_indices: indices of the trajectories in the batch
+        :param ewald_neut: energy correction of the net system charge
+        :param drift_velocity_array: drift velocities of all trajectories
+                updated in place
+        :return: maximum deviation of the site potential cache """
+        assert not output_data['unwrapped_traj']['write_every_step'], \
+            'write_every_step of unwrapped_traj is not supported in batch compute mode'
+        num_path_steps_per_traj = int(self.t_final / self.time_interval) + 1
+        num_lanes = len(traj_indices)
+        species_charge_array = np.asarray(self.species_charge_list)
+        n_proc_species_index_array = np.asarray(self.n_proc_species_index_list,
+                                                dtype=int)
+        lane_temp = self.traj_temp[traj_indices]
+        lane_electric_field = self.traj_electric_field[traj_indices]
+        max_potential_drift = 0
+
+        # Initialize the state of each trajectory from its random generator
+        traj_dir_path_list = []
+        lane_random_generator_list = []
+        occupancy = []
+        charge_config = []
+        static_site_potential = []
+        site_potential = []
+        system_relative_energies = []
+        energy = []
+        for traj_index in traj_indices:
+            traj_dir_path = dst_path.joinpath(f'traj{traj_index+1}')
+            Path.mkdir(traj_dir_path, parents=True, exist_ok=True)
+            traj_dir_path_list.append(traj_dir_path)
+            lane_random_generator = self.get_random_generator(
+                    self.random_seed, self.get_traj_stream_index(traj_dir_path))
+            lane_random_generator_list.append(lane_random_generator)
+            (dopant_site_indices, traj_relative_energies) = (
+                                    self.get_traj_doping_state(traj_dir_path))
+            traj_occupancy = self.generate_initial_occupancy(
+                                dopant_site_indices, lane_random_generator)
+            (traj_static_site_potential, traj_static_energy) = (
+                        self.get_static_site_potential(dopant_site_indices))
+            traj_charge_config = self.carrier_charge_config(traj_occupancy)
+            if self.potential_evaluation == 'sparse':
+                traj_site_potential = traj_static_site_potential
+            else:
+                traj_site_potential = self.get_site_potential(
+                            traj_charge_config, traj_static_site_potential)
+            occupancy.append(traj_occupancy)
+            charge_config.append(traj_charge_config)
+            static_site_potential.append(traj_static_site_potential)
+            site_potential.append(traj_site_potential)
+            system_relative_energies.append(traj_relative_energies)
+            energy.append(ewald_neut + self.get_configuration_energy(
+                                        traj_occupancy,
+                                        traj_static_site_potential,
+                                        traj_static_energy))
+        occupancy = np.asarray(occupancy, dtype=int)
+        charge_config = np.asarray(charge_config)
+        static_site_potential = np.asarray(static_site_potential)
+        site_potential = np.asarray(site_potential)
+        system_relative_energies = np.asarray(system_relative_energies)
+        energy = np.asarray(energy)
+
+        # Initialize output streams of every trajectory. The streams share
+        # a background writer and the blocks of the batch together take as
+        # much memory as those of a single trajectory
+        # the occupancy at every kmc step is recoverable from the event log
+        write_occupancy = self.doping_active and not (
+                'event_log' in output_data and output_data['event_log']['write'])
+        background_writer = BackgroundWriter()
+        lane_output_streams = []
+        for lane_index, traj_dir_path in enumerate(traj_dir_path_list):
+            output_streams = self.get_output_streams(
+                    self.get_output_file_paths(traj_dir_path, output_data,
+                                               write_occupancy),
+                    background_writer, num_path_steps_per_traj, 0,
+                    max(ChunkedNpyWriter.max_block_bytes // num_lanes, 2**12))
+            if output_data['time']['write']:
+                output_streams['time'].append(0.0)
+            if write_occupancy:
+                output_streams['occupancy'].append(occupancy[lane_index])
+            if output_data['energy']['write']:
+                output_streams['energy'].write(0, 1, energy[lane_index])
+            lane_output_streams.append(output_streams)
+        # time, process and occupancy of the kmc steps are buffered for up to
+        # num_buffered_steps steps and appended to the streams together
+        num_buffered_steps = 1024
+        time_buffer = np.zeros((num_lanes, num_buffered_steps))
+        process_index_buffer = np.zeros((num_lanes, num_buffered_steps),
+                                        dtype=int)
+        occupancy_buffer = (np.zeros((num_lanes, num_buffered_steps,
+                                      self.total_species), dtype=int)
+                            if write_occupancy else None)
+        num_lane_kmc_steps = np.zeros(num_lanes, dtype=int)
+        buffer_index = 0
+
+        sim_time = np.zeros(num_lanes)
+        start_path_index = np.ones(num_lanes, dtype=int)
+        end_path_index = np.ones(num_lanes, dtype=int)
+        last_position_array = np.zeros((num_lanes, self.total_species * 3))
+        species_displacement_vector_list = np.zeros(
+                                        (num_lanes, self.total_species * 3))
+        # uniforms are drawn in blocks of the same size as in the serial
+        # engine. Every lane in the batch consumes two per kmc step, hence
+        # the lanes share the position in their blocks
+        block_size = UniformBlockStream.block_size
+        random_blocks = np.asarray([
+                    lane_random_generator.random(block_size)
+                    for lane_random_generator in lane_random_generator_list])
+        random_block_index = 0
+        lanes = np.arange(num_lanes)
+        num_kmc_steps = 0
+        while len(lanes):
+            rows = np.arange(len(lanes))
+            process_attributes = self.get_process_attributes(occupancy[lanes])
+            (old_site_system_element_index_list,
+             new_site_system_element_index_list) = process_attributes[:2]
+            process_rate_info = self.get_batch_process_rates(
+                            process_attributes, site_potential[lanes],
+                            occupancy[lanes], system_relative_energies[lanes],
+                            lane_temp[lanes],
+                            lane_electric_field[lanes])
+            (k_list, nproc_delg_0_array,
+             nproc_hop_vector_array) = process_rate_info
+
+            # sequential sums as in the serial engine
+            k_total = np.cumsum(k_list, axis=1)[:, -1]
+            k_cum_sum = (k_list / k_total[:, None]).cumsum(axis=1)
+            if random_block_index == block_size:
+                for lane_index in lanes:
+                    random_blocks[lane_index] = lane_random_generator_list[
+                                            lane_index].random(block_size)
+                random_block_index = 0
+            random_numbers = random_blocks[
+                        lanes, random_block_index:random_block_index + 2]
+            random_block_index += 2
+            # Randomly choose a kinetic process
+            proc_index = np.argmax(k_cum_sum > random_numbers[:, 0:1], axis=1)
+            # Update simulation time
+            sim_time[lanes] -= np.log(random_numbers[:, 1]) / k_total
+            lane_end_path_index = (sim_time[lanes]
+                                   / self.time_interval).astype(int)
+
+            # Update state arrays at each kmc step
+            species_index = n_proc_species_index_array[proc_index]
+            old_site_system_element_index = old_site_system_element_index_list[
+                                                            rows, proc_index]
+            new_site_system_element_index = new_site_system_element_index_list[
+                                                            rows, proc_index]
+            hop_vector_array = nproc_hop_vector_array[rows, proc_index]
+            species_charge = species_charge_array[species_index]
+            occupancy[lanes, species_index] = new_site_system_element_index
+            species_displacement_vector_list[
+                lanes[:, None], species_index[:, None] * 3 + np.arange(3)] += \
+                hop_vector_array
+            if self.electric_field_active:
+                drift_velocity_array[traj_indices[lanes], species_index, :] += (
+                            hop_vector_array * k_list[rows, proc_index][:, None])
+            energy[lanes] += nproc_delg_0_array[rows, proc_index]
+            old_sublattice_index = self.sublattice_index_array[
+                                                old_site_system_element_index]
+            new_sublattice_index = self.sublattice_index_array[
+                                                new_site_system_element_index]
+            charge_config[lanes, old_sublattice_index] -= species_charge
+            charge_config[lanes, new_sublattice_index] += species_charge
+            if self.potential_evaluation == 'incremental':
+                site_potential[lanes] += species_charge[:, None] * (
+                                self.precomputed_array[new_sublattice_index]
+                                - self.precomputed_array[old_sublattice_index])
+            elif self.potential_evaluation == 'dense':
+                for lane_index in lanes:
+                    site_potential[lane_index] = self.get_site_potential(
+                                            charge_config[lane_index],
+                                            static_site_potential[lane_index])
+            num_kmc_steps += 1
+            if (num_kmc_steps % self.potential_check_interval == 0
+                    and self.potential_evaluation == 'incremental'):
+                for lane_index in lanes:
+                    (site_potential[lane_index], potential_drift) = (
+                        self.check_site_potential(
+                                site_potential[lane_index],
+                                charge_config[lane_index],
+                                static_site_potential[lane_index]))
+                    max_potential_drift = max(max_potential_drift,
+                                              potential_drift)
+
+            if buffer_index == num_buffered_steps:
+                self.write_lane_kmc_steps(lane_output_streams,
+                                          num_lane_kmc_steps, time_buffer,
+                                          process_index_buffer,
+                                          occupancy_buffer)
+                buffer_index = 0
+            time_buffer[lanes, buffer_index] = sim_time[lanes]
+            process_index_buffer[lanes, buffer_index] = proc_index
+            if write_occupancy:
+                occupancy_buffer[lanes, buffer_index] = occupancy[lanes]
+            buffer_index += 1
+            # all trajectories in the batch buffered the same kmc steps
+            num_lane_kmc_steps[lanes] = buffer_index
+
+            # Update data arrays for each path step
+            path_step_rows = np.where(lane_end_path_index
+                                      >= start_path_index[lanes] + 1)[0]
+            if len(path_step_rows):
+                path_step_lanes = lanes[path_step_rows]
+                end_path_index[path_step_lanes] = np.minimum(
+                                        lane_end_path_index[path_step_rows],
+                                        num_path_steps_per_traj)
+                path_step_delg_0 = nproc_delg_0_array[
+                                path_step_rows, proc_index[path_step_rows]]
+                position_array = (last_position_array[path_step_lanes]
+                                  + species_displacement_vector_list[
+                                                            path_step_lanes])
+                for row_index, lane_index in enumerate(path_step_lanes):
+                    output_streams = lane_output_streams[lane_index]
+                    path_step_range = (start_path_index[lane_index],
+                                       end_path_index[lane_index])
+                    if output_data['delg_0']['write']:
+                        output_streams['delg_0'].write(
+                                *path_step_range, path_step_delg_0[row_index])
+                    if output_data['unwrapped_traj']['write']:
+                        output_streams['unwrapped_traj'].write(
+                                *path_step_range, position_array[row_index])
                     if output_data['energy']['write']:
-                        energy_array[start_path_index:end_path_index] = \
-                            current_state_energy
-                    if not write_every_step:
-                        species_displacement_vector_list = np.zeros(
-                                                    (1, self.total_species * 3))
-                    start_path_index = end_path_index
-
-            # Write output data arrays to disk
-            for output_data_type, output_attributes in output_data.items():
-                if output_attributes['write']:
-                    output_file_name = traj_dir_path.joinpath(
-                                                output_attributes['file_name'])
-                    with open(output_file_name, 'ab') as output_file:
-                        if output_data_type == 'unwrapped_traj':
-                            np.save(output_file, unwrapped_position_array)
-                        elif output_data_type == 'time':
-                            np.save(output_file, np.asarray(time_data))
-                        elif output_data_type == 'wrapped_traj':
-                            np.save(output_file, wrapped_position_array)
-                        elif output_data_type == 'energy':
-                            np.save(output_file, energy_array)
-                        elif output_data_type == 'delg_0':
-                            np.save(output_file, delg_0_array)
-                        elif output_data_type == 'potential':
-                            np.save(output_file, potential_array)
-            if self.doping_active:
-                output_file_path = traj_dir_path / 'occupancy.npy'
-                occupancy_array = np.asarray(occupancy_list, dtype=int)
-                np.save(output_file_path, occupancy_array)
-
-        if self.electric_field_active:
-            prefix_list = self.compute_drift_mobility(drift_velocity_array,
-                                                      dst_path, prefix_list)
-
-        file_name = 'Run'
-        prefix = ''.join(prefix_list)
-        print_time_elapsed = 1
-        generate_report(self.start_time, dst_path, file_name, print_time_elapsed,
-                        prefix)
-        return None
+                        output_streams['energy'].write(*path_step_range,
+                                                       energy[lane_index])
+                last_position_array[path_step_lanes] = position_array
+                species_displacement_vector_list[path_step_lanes] = 0
+                start_path_index[path_step_lanes] = end_path_index[
+                                                            path_step_lanes]
+            lanes = lanes[end_path_index[lanes] < num_path_steps_per_traj]
+
+        # Write the remaining rows of the output data arrays to disk
+        self.write_lane_kmc_steps(lane_output_streams, num_lane_kmc_steps,
+                                  time_buffer, process_index_buffer,
+                                  occupancy_buffer)
+        for output_streams in lane_output_streams:
+            for output_stream in output_streams.values():
+                output_stream.close()
+        background_writer.close()
+        if self.trajectory_store_path is not None:
+            for lane_index, traj_dir_path in enumerate(traj_dir_path_list):
+                self.store_traj_output_data(traj_dir_path,
+                                            traj_indices[lane_index],
+                                            output_data)
+        return max_potential_drift
+
+    def replay_event_log(self, traj_dir_path, traj_index, random_seed,
+                         output_data_types, time_interval=None,
+                         event_log_file_name='event_log.npy'):
+        """Reconstructs output data arrays of a trajectory from its event
+            log, sampled at the given time interval. The initial state is
+            regenerated from the random generator of the trajectory and the
+            kmc steps of the log are applied to it, hence runs can be
+            resampled without being rerun
+        :param traj_dir_path: trajectory directory, which also sets the
+                random stream of the trajectory
+        :param traj_index: index of the trajectory in the run, 0 for a run
+                in parallel compute mode
+        :param random_seed: random seed of the run
+        :param output_data_types: any of 'time', 'occupancy',
+                'unwrapped_traj', 'energy' and 'delg_0'. 'time' holds the
+                times of the kmc steps and the others are sampled at the
+                path steps
+        :param time_interval: sampling interval in seconds. Defaults to the
+                time interval of the run
+        :param event_log_file_name:
+        :return: output data arrays keyed by output data type """
+        if time_interval is None:
+            time_interval = self.time_interval
+        else:
+            time_interval *= constants.SEC2AUTIME
+        num_path_steps_per_traj = int(self.t_final / time_interval) + 1
+        event_log = np.load(traj_dir_path / event_log_file_name)
+        compute_energy = any(output_data_type in ['energy', 'delg_0']
+                             for output_data_type in output_data_types)
+
+        (occupancy, charge_config, static_site_potential, site_potential,
+         energy) = self.get_initial_traj_state(
+                        traj_dir_path, traj_index, self.get_ewald_neut(),
+                        self.get_random_generator(
+                                random_seed,
+                                self.get_traj_stream_index(traj_dir_path)))
+        output_arrays = {
+            'time': np.concatenate(([0.0], event_log['time'])),
+            'occupancy': np.zeros((num_path_steps_per_traj,
+                                   self.total_species), dtype=int),
+            'unwrapped_traj': np.zeros((num_path_steps_per_traj,
+                                        self.total_species * 3)),
+            'energy': np.zeros(num_path_steps_per_traj),
+            'delg_0': np.zeros(num_path_steps_per_traj)}
+        output_arrays['occupancy'][0] = occupancy
+        output_arrays['energy'][0] = energy
+        position_array = np.zeros(self.total_species * 3)
+        start_path_index = 1
+        for kmc_step_index, (sim_time, species_index, proc_index) in enumerate(
+                                                        event_log.tolist()):
+            process_attributes = self.get_process_attributes(occupancy,
+                                                             [proc_index])
+            if compute_energy:
+                delg_0 = self.get_process_rates(process_attributes,
+                                                site_potential, occupancy,
+                                                [proc_index])[1][0]
+            old_site_system_element_index = occupancy[species_index]
+            new_site_system_element_index = process_attributes[1][0]
+            occupancy[species_index] = new_site_system_element_index
+            position_array[species_index * 3:(species_index + 1) * 3] += \
+                process_attributes[2][0]
+            if compute_energy:
+                species_charge = self.species_charge_list[species_index]
+                energy += delg_0
+                charge_config[self.sublattice_index_array[
+                                old_site_system_element_index]] -= species_charge
+                charge_config[self.sublattice_index_array[
+                                new_site_system_element_index]] += species_charge
+                if self.potential_evaluation == 'incremental':
+                    self.update_site_potential(
+                        site_potential, old_site_system_element_index,
+                        new_site_system_element_index, species_charge)
+                    if (kmc_step_index + 1) % self.potential_check_interval == 0:
+                        site_potential = self.get_site_potential(
+                                        charge_config, static_site_potential)
+                elif self.potential_evaluation == 'dense':
+                    site_potential = self.get_site_potential(
+                                        charge_config, static_site_potential)
+
+            # the state after a kmc step is sampled at the path steps
+            # preceding it as in do_traj_kmc_steps
+            end_path_index = min(int(sim_time / time_interval),
+                                 num_path_steps_per_traj)
+            if end_path_index > start_path_index:
+                path_steps = slice(start_path_index, end_path_index)
+                output_arrays['occupancy'][path_steps] = occupancy
+                output_arrays['unwrapped_traj'][path_steps] = position_array
+                if compute_energy:
+                    output_arrays['energy'][path_steps] = energy
+                    output_arrays['delg_0'][path_steps] = delg_0
+                start_path_index = end_path_index
+            if start_path_index == num_path_steps_per_traj:
+                break
+        return {output_data_type: output_arrays[output_data_type]
+                for output_data_type in output_data_types}
 
 
 class Analysis(object):
@@ -2855,17 +4858,28 @@ class Analysis(object):
         assert dst_path, 'Please provide the destination path where MSD ' \
                          'output files needs to be saved'
 
+        # positions are read from the trajectory store of the run if present
+        # and from the trajectory directories otherwise
         coordinate_file_name = output_data['unwrapped_traj']['file_name']
+        trajectory_store_path = dst_path / TrajectoryStore.file_name
+        if trajectory_store_path.exists():
+            trajectory_store = TrajectoryStore(trajectory_store_path)
+        position_array = np.zeros((self.n_traj * self.num_path_steps_per_traj,
+                                   self.total_species * 3))
         for traj_index in range(self.n_traj):
-            traj_coordinate_file_path = (dst_path / f'traj{traj_index+1}' / coordinate_file_name)
-            if traj_index == 0:
-                position_array = np.load(traj_coordinate_file_path)
+            if trajectory_store_path.exists():
+                traj_position_array = trajectory_store.get_array(
+                                traj_index, 'unwrapped_traj', 0,
+                                self.num_path_steps_per_traj)
             else:
-                position_array = np.vstack((position_array, np.load(traj_coordinate_file_path)))
+                traj_coordinate_file_path = (dst_path / f'traj{traj_index+1}' / coordinate_file_name)
+                traj_position_array = np.load(traj_coordinate_file_path)
+            position_array[traj_index * self.num_path_steps_per_traj:
+                           (traj_index + 1) * self.num_path_steps_per_traj] = \
+                traj_position_array
 
         position_array = (
-            position_array[
-                :self.n_traj * self.num_path_steps_per_traj + 1].reshape(
+            position_array.reshape(
                 (self.n_traj * self.num_path_steps_per_traj,
                  self.total_species, 3))
             * self.dist_conversion)
@@ -3008,9 +5022,1410 @@ class Analysis(object):
         return None
 
 
+class InteractionMatrix(object):
+    """Precomputed array of a system with periodic boundary conditions in
+        all dimensions stored by translational symmetry. The interaction
+        between two sites depends only on their sites within the unit cell
+        and the offset between their unit cells, hence only the rows of the
+        sites in the first unit cell are stored, with shape
+        (n_basis, num_cells, n_basis). Rows and elements of all other sites
+        are gathered by remapping the unit cell offsets"""
+    def __init__(self, compressed_array, system_size):
+        """
+
+        :param compressed_array: rows of the first unit cell sites with the
+                columns grouped by unit cell
+        :param system_size:
+        """
+        self.compressed_array = compressed_array
+        self.system_size = np.asarray(system_size)
+        (self.num_basis_sites, self.num_cells, _) = compressed_array.shape
+        assert self.num_cells == self.system_size.prod(), \
+            'Number of unit cells of the compressed array must match the ' \
+            'system size'
+        num_system_elements = self.num_cells * self.num_basis_sites
+        self.shape = (num_system_elements, num_system_elements)
+        self.dtype = compressed_array.dtype
+        # unit cell indices in the order of the system element indices
+        self.unit_cell_index_array = np.stack(np.unravel_index(
+                        np.arange(self.num_cells), self.system_size), axis=-1)
+        # conjugate Fourier transform of the compressed array over the unit
+        # cell offsets, computed on first use by dot
+        self.fourier_compressed_array = None
+
+    def get_cell_offset_indices(self, cell_indices, offset_cell_indices):
+        """Returns the indices of the unit cell offsets from the cells to the
+            offset cells under periodic boundary conditions
+        :param cell_indices:
+        :param offset_cell_indices:
+        :return: """
+        unit_cell_offset_array = (
+                        (self.unit_cell_index_array[offset_cell_indices]
+                         - self.unit_cell_index_array[cell_indices])
+                        % self.system_size)
+        cell_offset_indices = np.ravel_multi_index(
+                    tuple(np.moveaxis(unit_cell_offset_array, -1, 0)),
+                    self.system_size)
+        return cell_offset_indices
+
+    def get_rows(self, site_indices):
+        """Returns the rows of the sites
+        :param site_indices: site index or array of site indices
+        :return: """
+        (cell_indices, basis_site_indices) = np.divmod(site_indices,
+                                                       self.num_basis_sites)
+        cell_offset_indices = self.get_cell_offset_indices(
+                                        np.asarray(cell_indices)[..., None],
+                                        np.arange(self.num_cells))
+        rows = self.compressed_array[np.asarray(basis_site_indices)[..., None],
+                                     cell_offset_indices]
+        return rows.reshape(np.shape(site_indices) + self.shape[1:])
+
+    def get_elements(self, row_site_indices, column_site_indices):
+        """Returns the elements at the broadcast row and column sites
+        :param row_site_indices:
+        :param column_site_indices:
+        :return: """
+        (row_cell_indices, row_basis_site_indices) = np.divmod(
+                                    row_site_indices, self.num_basis_sites)
+        (column_cell_indices, column_basis_site_indices) = np.divmod(
+                                    column_site_indices, self.num_basis_sites)
+        elements = self.compressed_array[
+                    row_basis_site_indices,
+                    self.get_cell_offset_indices(row_cell_indices,
+                                                 column_cell_indices),
+                    column_basis_site_indices]
+        return elements
+
+    def __getitem__(self, key):
+        """Gathers rows for site indices and elements for a pair of row and
+            column site indices, following the indexing of the full array
+        :param key:
+        :return: """
+        if isinstance(key, tuple):
+            return self.get_elements(*key)
+        return self.get_rows(key)
+
+    def dot(self, charge_config):
+        """Returns the product with a vector in O(N log N). Each row is a
+            cyclic correlation of the compressed rows with the vector over
+            the unit cells, evaluated as a product of Fourier transforms
+        :param charge_config:
+        :return: """
+        grid_shape = tuple(self.system_size)
+        cell_axes = tuple(range(1, len(grid_shape) + 1))
+        if self.fourier_compressed_array is None:
+            self.fourier_compressed_array = np.conj(np.fft.rfftn(
+                    self.compressed_array.reshape(
+                        (self.num_basis_sites,) + grid_shape
+                        + (self.num_basis_sites,)), axes=cell_axes))
+        fourier_charge_config = np.fft.rfftn(
+                    np.reshape(charge_config, grid_shape
+                               + (self.num_basis_sites,)),
+                    axes=tuple(range(len(grid_shape))))
+        fourier_site_potential = np.einsum('i...j,...j->...i',
+                                           self.fourier_compressed_array,
+                                           fourier_charge_config)
+        site_potential = np.fft.irfftn(
+                    fourier_site_potential, s=grid_shape,
+                    axes=tuple(range(len(grid_shape)))).reshape(self.shape[0])
+        return site_potential
+
+
+class PackedSymmetricMatrix(object):
+    """Symmetric precomputed array stored as the upper triangle packed row
+        by row. Element (i, j) with i <= j is found at
+        i * N - i * (i - 1) / 2 + j - i, hence rows and elements are
+        gathered following the indexing of the full array"""
+    def __init__(self, packed_array):
+        """
+
+        :param packed_array: upper triangle of the symmetric array
+        """
+        self.packed_array = packed_array
+        num_sites = int(np.sqrt(8 * len(packed_array) + 1) - 1) // 2
+        assert num_sites * (num_sites + 1) // 2 == len(packed_array), \
+            'Length of the packed array must be a triangular number'
+        self.shape = (num_sites, num_sites)
+        self.dtype = packed_array.dtype
+        # bound on the number of elements of the rows gathered at once
+        self.max_row_block_elements = 2**22
+
+    def get_packed_indices(self, row_site_indices, column_site_indices):
+        """Returns the indices in the packed array of the elements at the
+            broadcast row and column sites
+        :param row_site_indices:
+        :param column_site_indices:
+        :return: """
+        lower_site_indices = np.minimum(row_site_indices, column_site_indices)
+        upper_site_indices = np.maximum(row_site_indices, column_site_indices)
+        packed_indices = (lower_site_indices * self.shape[0]
+                          - lower_site_indices * (lower_site_indices - 1) // 2
+                          + upper_site_indices - lower_site_indices)
+        return packed_indices
+
+    def get_rows(self, site_indices):
+        """Returns the rows of the sites
+        :param site_indices: site index or array of site indices
+        :return: """
+        return self.get_elements(np.asarray(site_indices)[..., None],
+                                 np.arange(self.shape[1]))
+
+    def get_elements(self, row_site_indices, column_site_indices):
+        """Returns the elements at the broadcast row and column sites
+        :param row_site_indices:
+        :param column_site_indices:
+        :return: """
+        return self.packed_array[self.get_packed_indices(row_site_indices,
+                                                         column_site_indices)]
+
+    def __getitem__(self, key):
+        """Gathers rows for site indices and elements for a pair of row and
+            column site indices, following the indexing of the full array
+        :param key:
+        :return: """
+        if isinstance(key, tuple):
+            return self.get_elements(*key)
+        return self.get_rows(key)
+
+    def get_row_blocks(self, num_rows):
+        """Returns blocks of row positions such that the rows gathered at
+            once stay within max_row_block_elements
+        :param num_rows:
+        :return: """
+        row_block_size = max(1, self.max_row_block_elements // self.shape[1])
+        return [np.arange(start_index, min(start_index + row_block_size,
+                                           num_rows))
+                for start_index in range(0, num_rows, row_block_size)]
+
+    def get_block(self, site_indices):
+        """Returns the packed block of the array over the sites
+        :param site_indices: site indices in ascending order
+        :return: """
+        num_block_sites = len(site_indices)
+        packed_block = []
+        for row_block in self.get_row_blocks(num_block_sites):
+            block_rows = self.get_elements(site_indices[row_block, None],
+                                           site_indices[None, :])
+            packed_block.append(block_rows[np.arange(num_block_sites)
+                                           >= row_block[:, None]])
+        return PackedSymmetricMatrix(np.concatenate(packed_block))
+
+    def dot(self, charge_config):
+        """Returns the product with a vector accumulated over blocks of rows
+        :param charge_config:
+        :return: """
+        site_potential = np.zeros(self.shape[0])
+        for row_block in self.get_row_blocks(self.shape[0]):
+            site_potential[row_block] = np.dot(self.get_rows(row_block),
+                                               charge_config)
+        return site_potential
+
+
+class MinImageVectors(object):
+    """Minimum image vectors between sites computed on demand instead of
+        being stored for all site pairs. Displacements are taken between
+        the fractional coordinates of the sites in the simulation cell and
+        the shortest of their periodic images is returned in Cartesian
+        coordinates. Where the nearest image may be tied, the images are
+        compared in Cartesian coordinates in the order of the system
+        translational vectors of Neighbors, hence ties resolve as in the
+        pairwise min image vector data"""
+    def __init__(self, cell_coordinates, translational_matrix, pbc,
+                 system_translational_vector_list):
+        """
+
+        :param cell_coordinates: Cartesian coordinates of all sites
+        :param translational_matrix: simulation cell vectors as rows
+        :param pbc:
+        :param system_translational_vector_list: translational vectors of
+                the periodic images of the simulation cell
+        """
+        self.cell_coordinates = np.asarray(cell_coordinates, dtype=float)
+        self.translational_matrix = np.asarray(translational_matrix,
+                                               dtype=float)
+        self.system_translational_vector_list = np.asarray(
+                                system_translational_vector_list, dtype=float)
+        self.fractional_coordinates = np.dot(
+                                cell_coordinates,
+                                np.linalg.inv(self.translational_matrix))
+        num_system_elements = len(cell_coordinates)
+        self.shape = (num_system_elements, num_system_elements,
+                      len(self.translational_matrix))
+        self.dtype = np.dtype(float)
+        self.periodic_dimensions = np.asarray(pbc) == 1
+        # the nearest image is the unique minimum image within half of the
+        # smallest periodic width of the simulation cell
+        cell_widths = 1 / np.linalg.norm(
+                            np.linalg.inv(self.translational_matrix), axis=0)
+        self.unique_image_radius = np.min(
+                    cell_widths[self.periodic_dimensions], initial=np.inf) / 2
+        # bound on the number of image vector elements evaluated at once
+        self.max_block_elements = 2**22
+
+    def get_elements(self, row_site_indices, column_site_indices):
+        """Returns the minimum image vectors from the broadcast row sites to
+            the column sites
+        :param row_site_indices:
+        :param column_site_indices:
+        :return: """
+        fractional_displacements = (
+                    self.fractional_coordinates[column_site_indices]
+                    - self.fractional_coordinates[row_site_indices])
+        elements = np.dot(fractional_displacements
+                          - np.round(fractional_displacements)
+                          * self.periodic_dimensions,
+                          self.translational_matrix)
+        # all images are compared where the nearest image may be tied
+        ambiguous_pairs = (np.linalg.norm(elements, axis=-1)
+                           >= self.unique_image_radius)
+        if np.any(ambiguous_pairs):
+            (row_site_indices, column_site_indices) = np.broadcast_arrays(
+                                    row_site_indices, column_site_indices)
+            image_vectors = (
+                (self.system_translational_vector_list
+                 + self.cell_coordinates[column_site_indices[ambiguous_pairs]][
+                                                                :, None, :])
+                - self.cell_coordinates[row_site_indices[ambiguous_pairs]][
+                                                                :, None, :])
+            image_indices = np.argmin(np.linalg.norm(image_vectors, axis=-1),
+                                      axis=-1)
+            elements[ambiguous_pairs] = image_vectors[
+                                np.arange(len(image_indices)), image_indices]
+        return elements
+
+    def get_row_blocks(self, num_rows, num_columns=None):
+        """Returns blocks of row positions such that the image vectors of a
+            block of rows stay within max_block_elements
+        :param num_rows:
+        :param num_columns: defaults to all sites
+        :return: """
+        if num_columns is None:
+            num_columns = self.shape[1]
+        row_block_size = max(1, self.max_block_elements // max(
+                    1, num_columns * self.system_translational_vector_list.size))
+        row_blocks = [np.arange(start_index, min(start_index + row_block_size,
+                                                 num_rows))
+                      for start_index in range(0, num_rows, row_block_size)]
+        return row_blocks
+
+    def get_rows(self, site_indices, column_site_indices=None):
+        """Returns the minimum image vectors from the sites to the column
+            sites, evaluated over blocks of rows
+        :param site_indices: site index or array of site indices
+        :param column_site_indices: defaults to all sites
+        :return: """
+        if column_site_indices is None:
+            column_site_indices = np.arange(self.shape[1])
+        column_site_indices = np.asarray(column_site_indices)
+        row_site_indices = np.ravel(site_indices)
+        rows = np.zeros((len(row_site_indices),) + column_site_indices.shape
+                        + self.shape[2:])
+        for row_block in self.get_row_blocks(len(row_site_indices),
+                                             column_site_indices.size):
+            rows[row_block] = self.get_elements(
+                    row_site_indices[row_block].reshape(
+                        (-1,) + (1,) * column_site_indices.ndim),
+                    column_site_indices)
+        return rows.reshape(np.shape(site_indices) + rows.shape[1:])
+
+    def __getitem__(self, key):
+        """Returns rows for site indices and elements for a pair of row and
+            column site indices, following the indexing of the pairwise min
+            image vector data
+        :param key:
+        :return: """
+        if isinstance(key, tuple):
+            return self.get_elements(*key)
+        return self.get_rows(key)
+
+
+class PeriodicCellList(object):
+    """Spatial index of the sites for radius and nearest neighbor queries.
+        Sites are binned on a grid over the fractional coordinates of the
+        simulation cell, which holds for triclinic cells as well, and a
+        query visits the bins within reach of its radius along the
+        perpendicular widths of the simulation cell. Candidate sites are
+        resolved with their minimum image vectors such that results follow
+        the minimum image convention of MinImageVectors"""
+    def __init__(self, min_image_vectors, pbc, num_sites_per_bin=8):
+        """
+
+        :param min_image_vectors: MinImageVectors of the sites
+        :param pbc:
+        :param num_sites_per_bin: average number of sites per bin
+        """
+        self.min_image_vectors = min_image_vectors
+        self.pbc = np.asarray(pbc)
+        translational_matrix = min_image_vectors.translational_matrix
+        self.num_sites = min_image_vectors.shape[0]
+        # perpendicular widths of the simulation cell
+        self.cell_widths = 1 / np.linalg.norm(
+                            np.linalg.inv(translational_matrix), axis=0)
+        bin_width = (abs(np.linalg.det(translational_matrix))
+                     * num_sites_per_bin / self.num_sites)**(1 / 3)
+        self.num_bins = np.maximum(
+                    1, np.floor(self.cell_widths / bin_width)).astype(int)
+        # fractional coordinates are wrapped into the simulation cell along
+        # periodic dimensions and sites beyond the cell along the others
+        # fall in the outermost bins
+        fractional_coordinates = (
+                    min_image_vectors.fractional_coordinates
+                    - np.floor(min_image_vectors.fractional_coordinates)
+                    * (self.pbc == 1))
+        self.site_bin_indices = np.clip(
+                    np.floor(fractional_coordinates
+                             * self.num_bins).astype(int),
+                    0, self.num_bins - 1)
+        # sites ordered by bin with the start of every bin
+        flat_site_bin_indices = np.ravel_multi_index(
+                                    tuple(self.site_bin_indices.T), self.num_bins)
+        self.sorted_site_indices = np.argsort(flat_site_bin_indices,
+                                              kind='stable')
+        self.bin_counts = np.bincount(flat_site_bin_indices,
+                                      minlength=self.num_bins.prod())
+        self.bin_starts = np.cumsum(self.bin_counts) - self.bin_counts
+        # bound on the number of candidate pairs resolved at once
+        self.max_block_elements = 2**22
+
+    def get_bin_offsets(self, radius):
+        """Returns the bin offsets within reach of the radius. Periodic
+            dimensions whose reach spans the grid visit every bin once
+        :param radius:
+        :return: """
+        reach = np.ceil(radius / self.cell_widths * self.num_bins).astype(int)
+        axis_offsets = [
+            np.arange(num_bins)
+            if periodic == 1 and 2 * axis_reach + 1 >= num_bins
+            else np.arange(-axis_reach, axis_reach + 1)
+            for (num_bins, axis_reach, periodic) in zip(self.num_bins, reach,
+                                                        self.pbc)]
+        bin_offsets = np.array(list(itertools.product(*axis_offsets)))
+        return bin_offsets
+
+    def get_candidate_pairs(self, site_indices, bin_offsets):
+        """Returns the query positions and the distinct sites of the bins
+            around the query sites
+        :param site_indices:
+        :param bin_offsets:
+        :return: """
+        neighbor_bin_indices = (self.site_bin_indices[site_indices][:, None]
+                                + bin_offsets)
+        within_system = np.all((self.pbc == 1)
+                               | ((neighbor_bin_indices >= 0)
+                                  & (neighbor_bin_indices < self.num_bins)),
+                               axis=2).ravel()
+        flat_neighbor_bin_indices = np.ravel_multi_index(
+                    tuple(np.moveaxis(neighbor_bin_indices % self.num_bins,
+                                      2, 0)), self.num_bins).ravel()
+        bin_counts = self.bin_counts[flat_neighbor_bin_indices] * within_system
+        num_candidates = bin_counts.sum()
+        query_positions = np.repeat(
+                        np.repeat(np.arange(len(site_indices)),
+                                  len(bin_offsets)), bin_counts)
+        sorted_positions = (np.arange(num_candidates)
+                            + np.repeat(self.bin_starts[flat_neighbor_bin_indices]
+                                        - (np.cumsum(bin_counts) - bin_counts),
+                                        bin_counts))
+        candidate_keys = np.unique(
+                    query_positions * self.num_sites
+                    + self.sorted_site_indices[sorted_positions])
+        return np.divmod(candidate_keys, self.num_sites)
+
+    def query_radius(self, site_indices, radius, neighbor_site_indices=None):
+        """Returns the sites within the radius of each of the query sites
+            along with their minimum image vectors and distances, ordered
+            by distance and site index per query site. The query site itself
+            is left out
+        :param site_indices:
+        :param radius:
+        :param neighbor_site_indices: restricts the neighbors to a subset of
+                sites
+        :return: offsets of the neighbors of every query site into
+                neighbor_site_indices, displacement_vectors and
+                displacements """
+        site_indices = np.atleast_1d(site_indices)
+        if neighbor_site_indices is None:
+            neighbor_mask = np.ones(self.num_sites, dtype=bool)
+        else:
+            neighbor_mask = np.zeros(self.num_sites, dtype=bool)
+            neighbor_mask[neighbor_site_indices] = True
+        bin_offsets = self.get_bin_offsets(radius)
+        num_image_elements = (
+                    self.min_image_vectors.system_translational_vector_list.size)
+        query_block_size = max(1, self.max_block_elements // max(
+                    1, len(bin_offsets) * int(np.ceil(
+                        self.num_sites / self.num_bins.prod()))
+                    * num_image_elements))
+        query_position_list = []
+        neighbor_site_index_list = []
+        displacement_vector_list = []
+        displacement_list = []
+        for start_index in range(0, len(site_indices), query_block_size):
+            block_site_indices = site_indices[start_index:
+                                              start_index + query_block_size]
+            (query_positions, candidate_site_indices) = (
+                    self.get_candidate_pairs(block_site_indices, bin_offsets))
+            candidate_mask = (neighbor_mask[candidate_site_indices]
+                              & (candidate_site_indices
+                                 != block_site_indices[query_positions]))
+            query_positions = query_positions[candidate_mask]
+            candidate_site_indices = candidate_site_indices[candidate_mask]
+            displacement_vectors = self.min_image_vectors.get_elements(
+                                    block_site_indices[query_positions],
+                                    candidate_site_indices)
+            displacements = np.linalg.norm(displacement_vectors, axis=1)
+            within_radius = displacements <= radius
+            query_position_list.append(query_positions[within_radius]
+                                       + start_index)
+            neighbor_site_index_list.append(
+                                    candidate_site_indices[within_radius])
+            displacement_vector_list.append(
+                                    displacement_vectors[within_radius])
+            displacement_list.append(displacements[within_radius])
+        query_positions = np.concatenate(query_position_list)
+        neighbor_site_indices = np.concatenate(neighbor_site_index_list)
+        displacements = np.concatenate(displacement_list)
+        sort_indices = np.lexsort((neighbor_site_indices, displacements,
+                                   query_positions))
+        neighbor_offsets = np.concatenate((
+                    [0], np.cumsum(np.bincount(query_positions,
+                                               minlength=len(site_indices)))))
+        return_neighbors = ReturnValues(
+            neighbor_offsets=neighbor_offsets,
+            neighbor_site_indices=neighbor_site_indices[sort_indices],
+            displacement_vectors=np.concatenate(
+                        displacement_vector_list).reshape(-1, 3)[sort_indices],
+            displacements=displacements[sort_indices])
+        return return_neighbors
+
+    def query_nearest(self, site_indices, num_neighbors,
+                      neighbor_site_indices=None):
+        """Returns the nearest sites of each of the query sites along with
+            their minimum image vectors and distances, ordered by distance
+            and site index. The radius of the query grows until every query
+            site has num_neighbors neighbors
+        :param site_indices:
+        :param num_neighbors:
+        :param neighbor_site_indices: restricts the neighbors to a subset of
+                sites
+        :return: neighbor_site_indices, displacement_vectors and
+                displacements with one row per query site """
+        site_indices = np.atleast_1d(site_indices)
+        num_candidate_sites = (self.num_sites if neighbor_site_indices is None
+                               else len(np.unique(neighbor_site_indices)))
+        assert num_neighbors < num_candidate_sites, \
+            'Number of nearest neighbors must be less than the number of ' \
+            'candidate sites'
+        translational_matrix = self.min_image_vectors.translational_matrix
+        max_radius = np.linalg.norm(translational_matrix, axis=1).sum()
+        radius = (3 * (num_neighbors + 1)
+                  * abs(np.linalg.det(translational_matrix))
+                  / (4 * np.pi * num_candidate_sites))**(1 / 3)
+        nearest_site_indices = np.zeros((len(site_indices), num_neighbors),
+                                        dtype=int)
+        nearest_displacement_vectors = np.zeros((len(site_indices),
+                                                 num_neighbors, 3))
+        nearest_displacements = np.zeros((len(site_indices), num_neighbors))
+        pending_positions = np.arange(len(site_indices))
+        while len(pending_positions):
+            radius = min(2 * radius, max_radius)
+            return_neighbors = self.query_radius(
+                    site_indices[pending_positions], radius,
+                    neighbor_site_indices)
+            neighbor_offsets = return_neighbors.neighbor_offsets
+            complete = (np.diff(neighbor_offsets) >= num_neighbors)
+            assert np.all(complete) or radius < max_radius, \
+                'Nearest neighbors could not be resolved within the ' \
+                'simulation cell'
+            neighbor_indices = (neighbor_offsets[:-1][complete, None]
+                                + np.arange(num_neighbors))
+            complete_positions = pending_positions[complete]
+            nearest_site_indices[complete_positions] = (
+                    return_neighbors.neighbor_site_indices[neighbor_indices])
+            nearest_displacement_vectors[complete_positions] = (
+                    return_neighbors.displacement_vectors[neighbor_indices])
+            nearest_displacements[complete_positions] = (
+                    return_neighbors.displacements[neighbor_indices])
+            pending_positions = pending_positions[~complete]
+        return_neighbors = ReturnValues(
+            neighbor_site_indices=nearest_site_indices,
+            displacement_vectors=nearest_displacement_vectors,
+            displacements=nearest_displacements)
+        return return_neighbors
+
+
+class FenwickTree(object):
+    """Binary indexed tree over non-negative values supporting value
+        updates and prefix sum search in O(log n)"""
+    def __init__(self, values):
+        """Builds the tree over the values
+        :param values:
+        """
+        self.size = len(values)
+        self.top_bit = 1 << (self.size.bit_length() - 1) if self.size else 0
+        self.rebuild(values)
+
+    def rebuild(self, values):
+        """Rebuilds the tree from the values discarding the round-off
+            accumulated by updates
+        :param values:
+        :return: """
+        values = np.asarray(values, dtype=float)
+        assert len(values) == self.size, \
+            'Number of values must match the size of the tree'
+        prefix_sum_array = np.concatenate(([0.0], np.cumsum(values)))
+        node_indices = np.arange(1, self.size + 1)
+        tree = np.zeros(self.size + 1)
+        tree[1:] = (prefix_sum_array[node_indices]
+                    - prefix_sum_array[node_indices
+                                       - (node_indices & -node_indices)])
+        self.values = values.tolist()
+        self.tree = tree.tolist()
+        self.total = prefix_sum_array[-1]
+        return None
+
+    def update(self, index, value):
+        """Sets the value at the index
+        :param index:
+        :param value:
+        :return: """
+        delta = value - self.values[index]
+        self.values[index] = value
+        self.total += delta
+        node_index = index + 1
+        while node_index <= self.size:
+            self.tree[node_index] += delta
+            node_index += node_index & -node_index
+        return None
+
+    def search(self, target):
+        """Returns the smallest index whose inclusive prefix sum exceeds the
+            target
+        :param target:
+        :return: """
+        node_index = 0
+        bit = self.top_bit
+        while bit:
+            next_node_index = node_index + bit
+            if (next_node_index <= self.size
+                    and self.tree[next_node_index] <= target):
+                node_index = next_node_index
+                target -= self.tree[next_node_index]
+            bit >>= 1
+        return min(node_index, self.size - 1)
+
+
+class UniformBlockStream(object):
+    """Uniform random numbers in [0, 1) of a generator drawn in blocks.
+        Drawing a block of n numbers advances the generator as n single
+        draws do, hence the stream does not depend on the block size"""
+    block_size = 4096
+
+    def __init__(self, random_generator):
+        """
+        :param random_generator:
+        """
+        self.random_generator = random_generator
+        self.refill()
+
+    def refill(self):
+        """Draws the next block of uniform random numbers
+        :return: """
+        self.block = self.random_generator.random(self.block_size).tolist()
+        self.block_index = 0
+        return None
+
+    def random(self):
+        """Returns the next uniform random number
+        :return: """
+        if self.block_index == self.block_size:
+            self.refill()
+        value = self.block[self.block_index]
+        self.block_index += 1
+        return value
+
+
+class NeighborRows(object):
+    """Rows of varying length stored flat in compressed sparse row (CSR)
+        form, where row i spans values[row_offsets[i]:row_offsets[i+1]].
+        Rows are indexed like an object array of arrays"""
+    def __init__(self, row_offsets, values):
+        """
+
+        :param row_offsets: offsets of the rows into values, one more than
+                the number of rows
+        :param values:
+        """
+        self.row_offsets = row_offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.row_offsets) - 1
+
+    def __getitem__(self, key):
+        """Returns a row for a row index and an object array of rows for an
+            array of row indices or a slice
+        :param key:
+        :return: """
+        if isinstance(key, (int, np.integer)):
+            return self.values[self.row_offsets[key]:self.row_offsets[key + 1]]
+        row_indices = np.arange(len(self))[key]
+        rows = np.empty(len(row_indices), dtype=object)
+        for index, row_index in enumerate(row_indices):
+            rows[index] = self[row_index]
+        return rows
+
+    def __iter__(self):
+        for row_index in range(len(self)):
+            yield self[row_index]
+
+
+class HopNeighborList(dict):
+    """Hop neighbor list held as flat arrays. Neighbors of the center sites
+        of all (hop_element_type, class_index, hop_dist_type) entries are
+        concatenated in CSR form, hence the arrays can be memory-mapped and
+        shared between processes. The nested mapping hop_element_type ->
+        class_index -> hop_dist_type of objects with num_neighbors,
+        neighbor_system_element_indices and displacement_vector_list
+        remains available as a view on the flat arrays"""
+    format_version = 1
+    directory_name = 'hop_neighbor_list'
+    index_file_name = 'index.json'
+    array_names = ['neighbor_offsets', 'num_neighbors',
+                   'neighbor_system_element_indices', 'displacement_vectors']
+
+    def __init__(self, entry_list, neighbor_offsets, num_neighbors,
+                 neighbor_system_element_indices, displacement_vectors,
+                 directory_path=None):
+        """
+
+        :param entry_list: hop_element_type, class_index, hop_dist_type,
+                center_start and num_centers of every entry, whose center
+                sites occupy num_neighbors[center_start:center_start
+                + num_centers]
+        :param neighbor_offsets: offsets of the neighbors of every center
+                site into the neighbor arrays, one more than the number of
+                center sites
+        :param num_neighbors: number of neighbors of every center site
+        :param neighbor_system_element_indices:
+        :param displacement_vectors:
+        :param directory_path: directory the arrays were loaded from
+        """
+        dict.__init__(self)
+        self.entry_list = entry_list
+        self.neighbor_offsets = neighbor_offsets
+        self.num_neighbors = num_neighbors
+        self.neighbor_system_element_indices = neighbor_system_element_indices
+        self.displacement_vectors = displacement_vectors
+        self.directory_path = directory_path
+        for entry in entry_list:
+            center_slice = slice(entry['center_start'],
+                                 entry['center_start'] + entry['num_centers'])
+            row_offsets = neighbor_offsets[entry['center_start']:
+                                           center_slice.stop + 1]
+            class_hop_neighbor_list = self.setdefault(
+                                        entry['hop_element_type'], [])
+            while len(class_hop_neighbor_list) <= entry['class_index']:
+                class_hop_neighbor_list.append([])
+            class_hop_neighbor_list[entry['class_index']].append(ReturnValues(
+                neighbor_system_element_indices=NeighborRows(
+                        row_offsets, neighbor_system_element_indices),
+                displacement_vector_list=NeighborRows(
+                        row_offsets, displacement_vectors),
+                num_neighbors=num_neighbors[center_slice]))
+
+    def __reduce__(self):
+        """Memory-mapped lists are pickled by their directory such that
+            every process maps the same files"""
+        if self.directory_path is not None:
+            return (load_hop_neighbor_list, (self.directory_path.parent,))
+        return (HopNeighborList,
+                (self.entry_list, self.neighbor_offsets, self.num_neighbors,
+                 self.neighbor_system_element_indices,
+                 self.displacement_vectors))
+
+    def save(self, dst_path):
+        """Writes the flat arrays to a hop_neighbor_list directory in the
+            destination path along with an index of the entries
+        :param dst_path:
+        :return: """
+        directory_path = dst_path.joinpath(self.directory_name)
+        Path.mkdir(directory_path, parents=True, exist_ok=True)
+        for array_name in self.array_names:
+            np.save(directory_path.joinpath(f'{array_name}.npy'),
+                    getattr(self, array_name))
+        with open(directory_path.joinpath(self.index_file_name), 'w') as index_file:
+            json.dump({'format_version': self.format_version,
+                       'entry_list': self.entry_list}, index_file, indent=1)
+        return None
+
+
+class ArtifactCache(object):
+    """Content-addressed store of setup artifacts shared across parameter
+        sweeps. Entries are keyed by a hash of the POSCAR file, the material
+        parameters, system size and pbc, and hold the artifacts written by
+        material_setup to the input directory: the hop neighbor list, the
+        pairwise min image vectors and the precomputed array along with its
+        log recording the chosen alpha, r_cut and k_cut. Entries are evicted
+        in the order of their last use once the cache exceeds max_size"""
+    cache_version = 1
+    artifact_file_names = {
+        'hop_neighbor_list': [HopNeighborList.directory_name],
+        'pairwise_min_image_vector_data': [
+                                    'pairwise_min_image_vector_data.npy'],
+        'precomputed_array': ['precomputed_array.npy',
+                              'precomputed_array.log']}
+
+    def __init__(self, cache_directory_path, max_size=None):
+        """
+
+        :param cache_directory_path:
+        :param max_size: maximum size of the cache in bytes, unbounded if None
+        """
+        self.cache_directory_path = Path(cache_directory_path).expanduser()
+        self.max_size = max_size
+        Path.mkdir(self.cache_directory_path, parents=True, exist_ok=True)
+
+    @classmethod
+    def from_params(cls, params, input_directory_path):
+        """Returns the cache configured by the artifact_cache entry of the
+            material parameters, or None if it is absent. Relative cache
+            directories are resolved against the input directory
+        :param params:
+        :param input_directory_path:
+        :return: """
+        cache_params = params.get('artifact_cache')
+        if not cache_params:
+            return None
+        cache_directory_path = Path(cache_params['directory']).expanduser()
+        if not cache_directory_path.is_absolute():
+            cache_directory_path = input_directory_path / cache_directory_path
+        max_size = cache_params.get('max_size')
+        return cls(cache_directory_path,
+                   None if max_size is None else int(max_size * 2**30))
+
+    @classmethod
+    def get_key(cls, params, system_size, pbc):
+        """Returns the hash of the inputs the setup artifacts depend on
+        :param params: material parameters including input_coord_file_location
+        :param system_size:
+        :param pbc:
+        :return: """
+        key_params = {key: value for key, value in params.items()
+                      if key not in ['artifact_cache',
+                                     'input_coord_file_location']}
+        hash_object = hashlib.sha256()
+        hash_object.update(f'{cls.cache_version}'.encode())
+        with open(params['input_coord_file_location'], 'rb') as poscar_file:
+            hash_object.update(poscar_file.read())
+        hash_object.update(json.dumps(key_params, sort_keys=True,
+                                      default=str).encode())
+        hash_object.update(json.dumps(
+            [np.asarray(system_size).tolist(), np.asarray(pbc).tolist()]).encode())
+        return hash_object.hexdigest()
+
+    def get_artifact_path(self, key, artifact_name):
+        """Returns the directory of the cached artifact, or None if it is
+            not in the cache. Hits count as use of the entry
+        :param key:
+        :param artifact_name:
+        :return: """
+        artifact_path = self.cache_directory_path / key / artifact_name
+        if not all(artifact_path.joinpath(file_name).exists()
+                   for file_name in self.artifact_file_names[artifact_name]):
+            return None
+        os.utime(self.cache_directory_path / key)
+        return artifact_path
+
+    def fetch(self, key, artifact_name, dst_path):
+        """Copies the cached artifact to the destination path and returns
+            whether the cache held it
+        :param key:
+        :param artifact_name:
+        :param dst_path:
+        :return: """
+        artifact_path = self.get_artifact_path(key, artifact_name)
+        if artifact_path is None:
+            return False
+        Path.mkdir(dst_path, parents=True, exist_ok=True)
+        # copies rather than links, since setup rewrites its outputs in
+        # place. Files are staged and renamed into place such that
+        # concurrent runs sharing the input directory never see partial files
+        staging_path = Path(tempfile.mkdtemp(prefix=f'.{artifact_name}.',
+                                             dir=dst_path))
+        for file_name in self.artifact_file_names[artifact_name]:
+            self.copy(artifact_path / file_name, staging_path / file_name,
+                      dst_path / file_name)
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return True
+
+    @staticmethod
+    def copy(src_file_path, staging_file_path, dst_file_path):
+        """Copies a file or directory to the destination through a staging
+            path on the same file system
+        :param src_file_path:
+        :param staging_file_path:
+        :param dst_file_path:
+        :return: """
+        if src_file_path.is_dir():
+            shutil.copytree(src_file_path, staging_file_path)
+            if dst_file_path.exists():
+                shutil.rmtree(dst_file_path, ignore_errors=True)
+        else:
+            shutil.copyfile(src_file_path, staging_file_path)
+        try:
+            os.replace(staging_file_path, dst_file_path)
+        except OSError:
+            # directory put in place concurrently by another process
+            pass
+        return None
+
+    def store(self, key, artifact_name, src_path):
+        """Adds the artifact written to the source path to the cache and
+            evicts the least recently used entries beyond max_size
+        :param key:
+        :param artifact_name:
+        :param src_path:
+        :return: """
+        if not all(src_path.joinpath(file_name).exists()
+                   for file_name in self.artifact_file_names[artifact_name]):
+            return None
+        entry_path = self.cache_directory_path / key
+        Path.mkdir(entry_path, exist_ok=True)
+        # artifacts are staged next to the entry and renamed into place
+        # such that concurrent readers never see partial files
+        staging_path = Path(tempfile.mkdtemp(prefix=f'.{artifact_name}.',
+                                             dir=entry_path))
+        for file_name in self.artifact_file_names[artifact_name]:
+            if src_path.joinpath(file_name).is_dir():
+                shutil.copytree(src_path / file_name, staging_path / file_name)
+            else:
+                shutil.copyfile(src_path / file_name, staging_path / file_name)
+        artifact_path = entry_path / artifact_name
+        if artifact_path.exists():
+            shutil.rmtree(artifact_path, ignore_errors=True)
+        try:
+            os.replace(staging_path, artifact_path)
+        except OSError:
+            # stored concurrently by another process
+            shutil.rmtree(staging_path, ignore_errors=True)
+        os.utime(entry_path)
+        self.evict(protected_keys=[key])
+        return None
+
+    def get_entry_size(self, key):
+        return sum(file_path.stat().st_size
+                   for file_path in (self.cache_directory_path / key).rglob('*')
+                   if file_path.is_file())
+
+    def evict(self, protected_keys=()):
+        """Removes entries in the order of their last use until the cache
+            fits within max_size
+        :param protected_keys: keys which are never evicted
+        :return: """
+        if self.max_size is None:
+            return None
+        entry_paths = sorted(
+                    (entry_path for entry_path in self.cache_directory_path.iterdir()
+                     if entry_path.is_dir()),
+                    key=lambda entry_path: entry_path.stat().st_mtime)
+        entry_sizes = {entry_path.name: self.get_entry_size(entry_path.name)
+                       for entry_path in entry_paths}
+        cache_size = sum(entry_sizes.values())
+        for entry_path in entry_paths:
+            if cache_size <= self.max_size:
+                break
+            if entry_path.name in protected_keys:
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            cache_size -= entry_sizes[entry_path.name]
+        return None
+
+
+class BackgroundWriter(object):
+    """Executes file writes on a background thread. The queue of pending
+        writes is bounded, hence at most max_pending_writes blocks are held
+        in memory in addition to those being filled"""
+    def __init__(self, max_pending_writes=4):
+        """
+
+        :param max_pending_writes:
+        """
+        self.write_queue = queue.Queue(max_pending_writes)
+        self.error = None
+        self.thread = threading.Thread(target=self.process_writes, daemon=True)
+        self.thread.start()
+
+    def process_writes(self):
+        while True:
+            write = self.write_queue.get()
+            if write is None:
+                return None
+            if self.error is None:
+                try:
+                    write[0](*write[1:])
+                except Exception as error:
+                    self.error = error
+            self.write_queue.task_done()
+
+    def submit(self, function, *args):
+        """Queues the call of the function with the arguments, blocking
+            while the queue is full
+        :param function:
+        :param args:
+        :return: """
+        if self.error is not None:
+            raise self.error
+        self.write_queue.put((function,) + args)
+        return None
+
+    def wait(self):
+        """Waits for the pending writes
+        :return: """
+        self.write_queue.join()
+        if self.error is not None:
+            raise self.error
+        return None
+
+    def close(self):
+        """Waits for the pending writes and stops the thread
+        :return: """
+        self.write_queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return None
+
+
+class ChunkedNpyWriter(object):
+    """Streams the rows of an array to a .npy file in blocks of up to
+        max_block_bytes. The header is padded to a fixed length and
+        rewritten after every block, hence the file is a valid .npy file
+        holding all rows written so far even if the process is killed.
+        Rows are written in increasing order either one at a time or as
+        ranges set to a value, and rows skipped are zero. The file is only
+        open while a block is written, hence many arrays may be streamed
+        at once"""
+    max_block_bytes = 2**20
+
+    def __init__(self, file_path, row_shape, dtype, background_writer,
+                 num_rows=None, max_block_bytes=None):
+        """
+
+        :param file_path:
+        :param row_shape: shape of a row, () for a 1-D array
+        :param dtype:
+        :param background_writer: BackgroundWriter executing the file writes
+        :param num_rows: number of rows of the array. Ranges are clipped to
+                and the array is padded with zeros up to num_rows when given
+        :param max_block_bytes: size of the blocks. Defaults to the class
+                attribute
+        """
+        self.file_path = Path(file_path)
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.background_writer = background_writer
+        self.num_rows = num_rows
+        if max_block_bytes is not None:
+            self.max_block_bytes = max_block_bytes
+        row_nbytes = self.dtype.itemsize * int(np.prod(self.row_shape))
+        self.block_size = max(1, self.max_block_bytes // max(row_nbytes, 1))
+        self.block = np.zeros((self.block_size,) + self.row_shape, self.dtype)
+        # rows before block_start are handed to the background writer
+        self.block_start = 0
+        self.num_block_rows = 0
+        self.num_file_rows = 0
+        # header length fitting any number of rows, aligned to 64 bytes as
+        # in numpy
+        self.header_length = 64 * -(-(len(self.get_header(2**63 - 1)) + 12)
+                                    // 64)
+        with open(self.file_path, 'wb') as output_file:
+            self.write_header(output_file, 0)
+
+    def get_header(self, num_rows):
+        return repr({'descr': np.lib.format.dtype_to_descr(self.dtype),
+                     'fortran_order': False,
+                     'shape': (num_rows,) + self.row_shape})
+
+    def write_header(self, output_file, num_rows):
+        header = self.get_header(num_rows)
+        header_prefix = np.lib.format.magic(1, 0)
+        header = header.ljust(self.header_length - len(header_prefix) - 3) + '\n'
+        output_file.seek(0)
+        output_file.write(header_prefix + len(header).to_bytes(2, 'little')
+                          + header.encode('latin1'))
+        return None
+
+    def write_rows(self, rows):
+        """Appends the rows to the file and updates the header. Executed
+            by the background writer
+        :param rows:
+        :return: """
+        with open(self.file_path, 'r+b') as output_file:
+            output_file.seek(self.header_length
+                             + self.num_file_rows * self.dtype.itemsize
+                             * int(np.prod(self.row_shape)))
+            output_file.write(rows.tobytes())
+            output_file.flush()
+            self.num_file_rows += len(rows)
+            self.write_header(output_file, self.num_file_rows)
+        return None
+
+    def flush_block(self):
+        if not self.num_block_rows:
+            return None
+        self.background_writer.submit(self.write_rows,
+                                      self.block[:self.num_block_rows])
+        self.block_start += self.num_block_rows
+        self.block = np.zeros((self.block_size,) + self.row_shape, self.dtype)
+        self.num_block_rows = 0
+        return None
+
+    def write(self, start_row_index, end_row_index, value):
+        """Sets the rows in [start_row_index, end_row_index) to the value
+        :param start_row_index:
+        :param end_row_index:
+        :param value:
+        :return: """
+        if self.num_rows is not None:
+            end_row_index = min(end_row_index, self.num_rows)
+        if end_row_index <= start_row_index:
+            return None
+        assert start_row_index >= self.block_start, \
+            'Rows must be written in increasing order'
+        while start_row_index < end_row_index:
+            if start_row_index >= self.block_start + self.block_size:
+                self.num_block_rows = self.block_size
+                self.flush_block()
+                continue
+            block_end_row_index = min(end_row_index,
+                                      self.block_start + self.block_size)
+            self.block[start_row_index - self.block_start:
+                       block_end_row_index - self.block_start] = value
+            self.num_block_rows = max(self.num_block_rows,
+                                      block_end_row_index - self.block_start)
+            start_row_index = block_end_row_index
+        return None
+
+    def append(self, row):
+        """Sets the row following the last row written to the value
+        :param row:
+        :return: """
+        start_row_index = self.block_start + self.num_block_rows
+        self.write(start_row_index, start_row_index + 1, row)
+        return None
+
+    def extend(self, rows):
+        """Sets the rows following the last row written to the rows. Rows
+            are copied block by block, hence memory-mapped arrays are never
+            loaded as a whole
+        :param rows:
+        :return: """
+        row_index = 0
+        while row_index < len(rows):
+            if self.num_block_rows == self.block_size:
+                self.flush_block()
+            num_rows = min(len(rows) - row_index,
+                           self.block_size - self.num_block_rows)
+            self.block[self.num_block_rows:self.num_block_rows + num_rows] = \
+                rows[row_index:row_index + num_rows]
+            self.num_block_rows += num_rows
+            row_index += num_rows
+        return None
+
+    def get_num_rows(self):
+        """Returns the number of rows written so far
+        :return: """
+        return self.block_start + self.num_block_rows
+
+    def close(self):
+        """Pads the array with zeros up to num_rows and writes the remaining
+            rows
+        :return: """
+        if self.num_rows is not None:
+            self.write(self.block_start + self.num_block_rows, self.num_rows,
+                       0)
+        self.flush_block()
+        return None
+
+
+class TrajectoryStore(object):
+    """Single file holding the output data arrays of all trajectories of a
+        run. The file starts with a header and a table of the offset and
+        length of the record of every trajectory, followed by the records
+        in the order they were appended. A record holds a JSON index of its
+        arrays followed by the contiguous array payloads aligned to 64
+        bytes. Appends are serialized with a lock on the file, hence
+        trajectories may be appended concurrently by several processes, and
+        arrays are read by trajectory and row window without loading the
+        other trajectories"""
+    file_name = 'trajectories.store'
+    magic = b'PYCDTRJ1'
+    header_dtype = np.dtype([('magic', 'S8'), ('num_traj', '<u8')])
+    table_dtype = np.dtype([('offset', '<u8'), ('length', '<u8')])
+    alignment = 64
+    max_block_bytes = 2**24
+
+    def __init__(self, file_path):
+        """Opens an existing store
+        :param file_path:
+        """
+        self.file_path = Path(file_path)
+        header = np.fromfile(self.file_path, dtype=self.header_dtype, count=1)
+        assert len(header) and header['magic'][0] == self.magic, \
+            f'{self.file_path} is not a trajectory store'
+        self.num_traj = int(header['num_traj'][0])
+
+    @classmethod
+    def create(cls, file_path, num_traj):
+        """Creates an empty store for the given number of trajectories,
+            replacing any existing store
+        :param file_path:
+        :param num_traj:
+        :return: """
+        header = np.zeros(1, dtype=cls.header_dtype)
+        header['magic'] = cls.magic
+        header['num_traj'] = num_traj
+        with open(file_path, 'wb') as store_file:
+            store_file.write(header.tobytes())
+            store_file.write(np.zeros(num_traj, dtype=cls.table_dtype).tobytes())
+        return cls(file_path)
+
+    def get_table(self):
+        """Returns the offset and length of the record of every trajectory.
+            Trajectories not yet appended have zero length
+        :return: """
+        return np.fromfile(self.file_path, dtype=self.table_dtype,
+                           count=self.num_traj,
+                           offset=self.header_dtype.itemsize)
+
+    def get_traj_indices(self):
+        """Returns the indices of the trajectories in the store
+        :return: """
+        return np.where(self.get_table()['length'] > 0)[0]
+
+    def append(self, traj_index, arrays):
+        """Appends the record of a trajectory. Arrays are copied block by
+            block, hence memory-mapped arrays are never loaded as a whole
+        :param traj_index:
+        :param arrays: arrays keyed by output data type
+        :return: """
+        array_index = {}
+        payload_offset = 0
+        for output_data_type, array in arrays.items():
+            array_index[output_data_type] = {
+                        'descr': repr(np.lib.format.dtype_to_descr(array.dtype)),
+                        'shape': list(array.shape),
+                        'offset': payload_offset}
+            payload_offset += -(-array.nbytes // self.alignment) * self.alignment
+        index_bytes = json.dumps(array_index).encode()
+        index_bytes = index_bytes.ljust(
+                -(-(len(index_bytes) + 8) // self.alignment) * self.alignment - 8)
+        with open(self.file_path, 'r+b') as store_file:
+            self.lock_file(store_file, 1)
+            try:
+                record_offset = store_file.seek(0, os.SEEK_END)
+                record_offset += -record_offset % self.alignment
+                store_file.seek(record_offset)
+                store_file.write(len(index_bytes).to_bytes(8, 'little'))
+                store_file.write(index_bytes)
+                payload_start = store_file.tell()
+                for output_data_type, array in arrays.items():
+                    store_file.seek(payload_start
+                                    + array_index[output_data_type]['offset'])
+                    flat_array = array.reshape(-1)
+                    block_size = max(1, self.max_block_bytes
+                                     // max(array.itemsize, 1))
+                    for start_index in range(0, flat_array.size, block_size):
+                        store_file.write(np.ascontiguousarray(
+                                flat_array[start_index:start_index
+                                           + block_size]).tobytes())
+                record_length = store_file.seek(0, os.SEEK_END) - record_offset
+                store_file.flush()
+                # the table entry is written last such that readers never
+                # see partial records
+                store_file.seek(self.header_dtype.itemsize
+                                + traj_index * self.table_dtype.itemsize)
+                store_file.write(np.array([(record_offset, record_length)],
+                                          dtype=self.table_dtype).tobytes())
+                store_file.flush()
+            finally:
+                self.lock_file(store_file, 0)
+        return None
+
+    @staticmethod
+    def lock_file(store_file, lock):
+        """Acquires or releases the exclusive lock on an open store file.
+            The lock is taken with fcntl on POSIX and on the first byte of
+            the file with msvcrt elsewhere
+        :param store_file:
+        :param lock: 1 to acquire and 0 to release the lock
+        :return: """
+        if os.name == 'posix':
+            import fcntl
+            fcntl.flock(store_file, fcntl.LOCK_EX if lock else fcntl.LOCK_UN)
+        else:
+            import msvcrt
+            store_file.seek(0)
+            if not lock:
+                msvcrt.locking(store_file.fileno(), msvcrt.LK_UNLCK, 1)
+                return None
+            # LK_LOCK gives up after 10 attempts
+            while True:
+                try:
+                    msvcrt.locking(store_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return None
+
+    def get_array_index(self, traj_index):
+        """Returns the index of the arrays of a trajectory along with the
+            offset of their payloads
+        :param traj_index:
+        :return: """
+        (record_offset, record_length) = self.get_table()[traj_index].tolist()
+        assert record_length, \
+            f'Trajectory {traj_index + 1} is not in {self.file_path}'
+        with open(self.file_path, 'rb') as store_file:
+            store_file.seek(record_offset)
+            index_length = int.from_bytes(store_file.read(8), 'little')
+            array_index = json.loads(store_file.read(index_length))
+        return (array_index, record_offset + 8 + index_length)
+
+    def get_array(self, traj_index, output_data_type, start_row_index=None,
+                  end_row_index=None):
+        """Returns the rows in [start_row_index, end_row_index) of an array
+            of a trajectory
+        :param traj_index:
+        :param output_data_type:
+        :param start_row_index:
+        :param end_row_index:
+        :return: """
+        (array_index, payload_start) = self.get_array_index(traj_index)
+        array_attributes = array_index[output_data_type]
+        shape = tuple(array_attributes['shape'])
+        # descr is stored as in .npy headers
+        dtype = np.lib.format.descr_to_dtype(
+                                ast.literal_eval(array_attributes['descr']))
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)[start_row_index:end_row_index]
+        array = np.memmap(self.file_path, mode='r', dtype=dtype,
+                          offset=payload_start + array_attributes['offset'],
+                          shape=shape)
+        return np.array(array[start_row_index:end_row_index])
+
+
 class ReturnValues(object):
     """dummy class to return objects from methods defined inside
         other classes"""
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
+
+
+# run and shared memory blocks attached by a trajectory worker process
+worker_run = None
+worker_shared_memory_list = []
+
+
+def flatten_hop_neighbor_list(hop_neighbor_list):
+    """Returns the HopNeighborList of a nested hop neighbor list
+    :param hop_neighbor_list: hop_element_type -> class_index ->
+            hop_dist_type of objects with num_neighbors,
+            neighbor_system_element_indices and displacement_vector_list
+    :return: """
+    entry_list = []
+    num_neighbors_blocks = []
+    neighbor_index_blocks = []
+    displacement_vector_blocks = []
+    center_start = 0
+    for hop_element_type, class_hop_neighbor_list in hop_neighbor_list.items():
+        for class_index, hop_dist_type_list in enumerate(class_hop_neighbor_list):
+            for hop_dist_type, hop_dist_type_neighbors in enumerate(
+                                                        hop_dist_type_list):
+                num_centers = len(hop_dist_type_neighbors.num_neighbors)
+                entry_list.append({'hop_element_type': hop_element_type,
+                                   'class_index': class_index,
+                                   'hop_dist_type': hop_dist_type,
+                                   'center_start': center_start,
+                                   'num_centers': num_centers})
+                center_start += num_centers
+                num_neighbors_blocks.append(np.asarray(
+                        hop_dist_type_neighbors.num_neighbors, dtype=np.int64))
+                neighbor_index_blocks.extend(
+                    np.asarray(neighbor_indices, dtype=np.int64)
+                    for neighbor_indices in (
+                        hop_dist_type_neighbors.neighbor_system_element_indices))
+                displacement_vector_blocks.extend(
+                    np.reshape(displacement_vectors, (-1, 3))
+                    for displacement_vectors in (
+                        hop_dist_type_neighbors.displacement_vector_list))
+    num_neighbors = np.concatenate(
+                    [np.zeros(0, dtype=np.int64)] + num_neighbors_blocks)
+    neighbor_offsets = np.concatenate(([0], np.cumsum(num_neighbors)))
+    return HopNeighborList(
+        entry_list, neighbor_offsets, num_neighbors,
+        np.concatenate([np.zeros(0, dtype=np.int64)] + neighbor_index_blocks),
+        np.concatenate([np.zeros((0, 3))] + displacement_vector_blocks))
+
+
+def load_hop_neighbor_list(input_directory_path, mmap_mode='r'):
+    """Loads the hop neighbor list of the input directory, memory-mapping
+        the flat arrays of the hop_neighbor_list directory or unpickling a
+        nested hop_neighbor_list.npy written by earlier versions
+    :param input_directory_path:
+    :param mmap_mode:
+    :return: """
+    directory_path = input_directory_path.joinpath(
+                                        HopNeighborList.directory_name)
+    if not directory_path.exists():
+        return np.load(input_directory_path.joinpath('hop_neighbor_list.npy'),
+                       allow_pickle=True)[()]
+    with open(directory_path.joinpath(HopNeighborList.index_file_name), 'r') as index_file:
+        index = json.load(index_file)
+    assert index['format_version'] == HopNeighborList.format_version, \
+        f'Unsupported hop neighbor list format version ' \
+        f'{index["format_version"]}; please regenerate the hop neighbor list'
+    arrays = [np.load(directory_path.joinpath(f'{array_name}.npy'),
+                      mmap_mode=mmap_mode)
+              for array_name in HopNeighborList.array_names]
+    return HopNeighborList(index['entry_list'], *arrays,
+                           directory_path=directory_path)
+
+
+def initialize_traj_worker(run, shared_array_specs):
+    """Initializes a trajectory worker process with the run and attaches
+        the arrays placed in shared memory
+    :param run: run without the shared arrays
+    :param shared_array_specs: name, shape and dtype of the shared memory
+            block of each shared array
+    :return: """
+    global worker_run
+    array_owners = {'run': run, 'system': run.system,
+                    'process_table': run.process_table,
+                    'precomputed_array': run.precomputed_array}
+    for (owner, attribute), (name, shape, dtype) in shared_array_specs.items():
+        shared_memory = SharedMemory(name=name)
+        worker_shared_memory_list.append(shared_memory)
+        array = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+        array.flags.writeable = False
+        setattr(array_owners[owner], attribute, array)
+    worker_run = run
+    return None
+
+
+def do_traj_kmc_steps_in_worker(traj_args):
+    """Runs a single trajectory in a trajectory worker process
+    :param traj_args: trajectory directory path, trajectory index, output
+            data and ewald_neut
+    :return: trajectory index, drift velocities of the trajectory and the
+            maximum deviation of the site potential cache """
+    (traj_dir_path, traj_index, output_data, ewald_neut) = traj_args
+    drift_velocity_array = np.zeros((worker_run.n_traj,
+                                     worker_run.total_species, 3))
+    potential_drift = worker_run.do_traj_kmc_steps(
+            traj_dir_path, traj_index, output_data, ewald_neut,
+            drift_velocity_array)
+    return (traj_index, drift_velocity_array[traj_index], potential_drift)
@@ -5,7 +5,8 @@
 import numpy as np
 import yaml
 
-from PyCD.core import Material, Neighbors, System, Run
+from PyCD.core import (Material, Neighbors, System, Run, ArtifactCache,
+                       load_hop_neighbor_list)
 
 
 def material_preprod(dst_path):
@@ -59,15 +60,36 @@ def material_preprod(dst_path):
     if dst_path.joinpath('Run.log').exists():
         file_exists = 1
     if not file_exists or sim_params['over_write']:
+        # setup artifacts missing from the input directory are copied from
+        # the cache
+        artifact_cache = ArtifactCache.from_params(params, input_directory_path)
+        if artifact_cache is not None:
+            artifact_key = ArtifactCache.get_key(params,
+                                                 sim_params['system_size'],
+                                                 sim_params['pbc'])
+            for artifact_name, file_names in (
+                    ArtifactCache.artifact_file_names.items()):
+                if not all(input_directory_path.joinpath(file_name).exists()
+                           for file_name in file_names):
+                    artifact_cache.fetch(artifact_key, artifact_name,
+                                         input_directory_path)
+
         # Load input files to instantiate system class
-        hop_neighbor_list_file_name = input_directory_path.joinpath(
-                                            'hop_neighbor_list.npy')
-        hop_neighbor_list = np.load(hop_neighbor_list_file_name, allow_pickle=True)[()]
+        hop_neighbor_list = load_hop_neighbor_list(input_directory_path)
+        # pairwise min image vectors are read from disk when generated and
+        # computed on demand otherwise
+        precomputed_array_format = params.get('precomputed_array_format',
+                                              'dense')
         pairwise_min_image_vector_data_file_path = (
-                            input_directory_path.joinpath(
-                                'pairwise_min_image_vector_data.npy'))
-        pairwise_min_image_vector_data = np.load(
-                                pairwise_min_image_vector_data_file_path)
+                                input_directory_path.joinpath(
+                                    'pairwise_min_image_vector_data.npy'))
+        if (precomputed_array_format != 'compressed'
+                and pairwise_min_image_vector_data_file_path.exists()):
+            pairwise_min_image_vector_data = np.load(
+                                    pairwise_min_image_vector_data_file_path,
+                                    mmap_mode='r')
+        else:
+            pairwise_min_image_vector_data = None
         alpha = config_params.alpha
         r_cut = config_params.r_cut
         k_cut = config_params.k_cut
@@ -112,20 +134,29 @@ def material_preprod(dst_path):
                                 dst_path.resolve().parents[sim_params['doping']['step_work_dir_depth'] - 1]
                                 / ('SystemSize[' + ','.join(str(element) for element in step_system_size) + ']')
                                 / sim_params['input_file_directory_name'])
-                            step_hop_neighbor_list_file_name = step_input_directory_path.joinpath(
-                                                                        'hop_neighbor_list.npy')
-                            step_hop_neighbor_list = np.load(step_hop_neighbor_list_file_name)[()]
+                            if (artifact_cache is not None and not step_input_directory_path.joinpath(
+                                    'hop_neighbor_list').exists()):
+                                artifact_cache.fetch(
+                                    ArtifactCache.get_key(params, step_system_size,
+                                                          sim_params['pbc']),
+                                    'hop_neighbor_list', step_input_directory_path)
+                            step_hop_neighbor_list = load_hop_neighbor_list(
+                                                                    step_input_directory_path)
                             step_hop_neighbor_master_list.append(step_hop_neighbor_list)
 
         material_system = System(
             material_info, material_neighbors, hop_neighbor_list,
             pairwise_min_image_vector_data, alpha, r_cut, k_cut, precision_parameters,
-            step_system_size_array, step_hop_neighbor_master_list)
+            step_system_size_array, step_hop_neighbor_master_list,
+            precomputed_array_format=precomputed_array_format,
+            precomputed_array_dtype=params.get('precomputed_array_dtype',
+                                               'float64'))
 
         # Load precomputed array to instantiate run class
         precomputed_array_file_path = input_directory_path.joinpath(
                                             'precomputed_array.npy')
-        precomputed_array = np.load(precomputed_array_file_path)
+        precomputed_array = np.load(precomputed_array_file_path,
+                                    mmap_mode='r')
         material_run = Run(
             material_system, precomputed_array, sim_params['temp'],
             sim_params['ion_charge_type'],
@@ -5,7 +5,8 @@
 import numpy as np
 import yaml
 
-from PyCD.core import Material, Neighbors, System
+from PyCD.core import (Material, Neighbors, System, ArtifactCache,
+                       load_hop_neighbor_list)
 
 
 def material_setup(input_directory_path, system_size, pbc,
@@ -37,28 +38,57 @@ def material_setup(input_directory_path, system_size, pbc,
     # Build neighbors object files
     material_neighbors = Neighbors(material_info, system_size, pbc)
 
+    # artifacts are copied from the cache when their inputs are unchanged
+    artifact_cache = ArtifactCache.from_params(params, input_directory_path)
+    if artifact_cache is not None:
+        artifact_key = ArtifactCache.get_key(params, system_size, pbc)
+
     # generate neighbor list
-    if generate_hop_neighbor_list:
+    if generate_hop_neighbor_list and not (
+            artifact_cache is not None
+            and artifact_cache.fetch(artifact_key, 'hop_neighbor_list',
+                                     input_directory_path)):
         local_system_size = np.array([3, 3, 3])
         material_neighbors.generate_neighbor_list(input_directory_path,
                                                   local_system_size)
+        if artifact_cache is not None:
+            artifact_cache.store(artifact_key, 'hop_neighbor_list',
+                                 input_directory_path)
 
     # generate cumulative displacement list
-    if generate_pairwise_min_image_vector_data:
+    if generate_pairwise_min_image_vector_data and not (
+            artifact_cache is not None
+            and artifact_cache.fetch(artifact_key,
+                                     'pairwise_min_image_vector_data',
+                                     input_directory_path)):
         material_neighbors.get_pairwise_min_image_vector_data(
                                                 input_directory_path)
+        if artifact_cache is not None:
+            artifact_cache.store(artifact_key,
+                                 'pairwise_min_image_vector_data',
+                                 input_directory_path)
 
     # Build precomputed array and save to disk
-    if generate_precomputed_array:
+    if generate_precomputed_array and not (
+            artifact_cache is not None
+            and artifact_cache.fetch(artifact_key, 'precomputed_array',
+                                     input_directory_path)):
         # Load input files to instantiate system class
-        hop_neighbor_list_file_name = input_directory_path.joinpath(
-                                            'hop_neighbor_list.npy')
-        hop_neighbor_list = np.load(hop_neighbor_list_file_name)[()]
+        hop_neighbor_list = load_hop_neighbor_list(input_directory_path)
+        # pairwise min image vectors are read from disk when generated and
+        # computed on demand otherwise
+        precomputed_array_format = params.get('precomputed_array_format',
+                                              'dense')
         pairwise_min_image_vector_data_file_path = (
-                            input_directory_path.joinpath(
-                                'pairwise_min_image_vector_data.npy'))
-        pairwise_min_image_vector_data = np.load(
-                                pairwise_min_image_vector_data_file_path)
+                                input_directory_path.joinpath(
+                                    'pairwise_min_image_vector_data.npy'))
+        if (precomputed_array_format != 'compressed'
+                and pairwise_min_image_vector_data_file_path.exists()):
+            pairwise_min_image_vector_data = np.load(
+                                    pairwise_min_image_vector_data_file_path,
+                                    mmap_mode='r')
+        else:
+            pairwise_min_image_vector_data = None
 
         alpha = config_params.alpha
         r_cut = config_params.r_cut
@@ -72,14 +102,21 @@ def material_setup(input_directory_path, system_size, pbc,
         material_system = System(
             material_info, material_neighbors, hop_neighbor_list,
             pairwise_min_image_vector_data, alpha, r_cut, k_cut, precision_parameters,
-            step_system_size_array, step_hop_neighbor_master_list)
-        (precomputed_array, output_dir) = material_system.get_precomputed_array(
-                                                input_directory_path,
-                                                compute_energy_contributions,
-                                                return_k_vector_data)
-        precomputed_array_file_path = output_dir.joinpath(
-                                            'precomputed_array.npy')
-        np.save(precomputed_array_file_path, precomputed_array)
+            step_system_size_array, step_hop_neighbor_master_list,
+            precomputed_array_format=precomputed_array_format,
+            reciprocal_space_method=params.get('reciprocal_space_method',
+                                               'direct'),
+            pme_parameters=params.get('pme_parameters'),
+            precomputed_array_dtype=params.get('precomputed_array_dtype',
+                                               'float64'))
+        # precomputed array is written to precomputed_array.npy in the
+        # output directory block by block
+        material_system.get_precomputed_array(input_directory_path,
+                                              compute_energy_contributions,
+                                              return_k_vector_data)
+        if artifact_cache is not None:
+            artifact_cache.store(artifact_key, 'precomputed_array',
+                                 input_directory_path)
     return None
 
 
@@ -6,7 +6,572 @@ Unit and regression test for the PyCD package.
 import PyCD
 import pytest
 import sys
+import shutil
+import itertools
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from PyCD import core
+from PyCD.core import (BackgroundWriter, ChunkedNpyWriter, FenwickTree,
+                       InteractionMatrix, Material, MinImageVectors,
+                       Neighbors, PackedSymmetricMatrix, PeriodicCellList, Run,
+                       TrajectoryStore, UniformBlockStream)
+from PyCD.material_run import ReturnValues, material_run
+
+examples_directory_path = Path(__file__).resolve().parents[2] / 'examples'
+
 
 def test_PyCD_imported():
     """Sample test, will always pass so long as import statement worked"""
     assert "PyCD" in sys.modules
+
+
+@pytest.fixture
+def bvo_path(tmp_path, monkeypatch):
+    """BVO example with the precomputed array log material_setup would
+        write"""
+    # material_run reads its parameters with yaml.load, which requires a
+    # Loader since PyYAML 6
+    yaml_load = yaml.load
+    monkeypatch.setattr(yaml, 'load', lambda stream, Loader=yaml.FullLoader:
+                                            yaml_load(stream, Loader))
+    dst_path = tmp_path / 'BVO'
+    shutil.copytree(examples_directory_path / 'BVO', dst_path,
+                    ignore=shutil.ignore_patterns('traj*'))
+    input_directory_path = dst_path / 'InputFiles'
+    with open(input_directory_path / 'sys_config.yml') as stream:
+        alpha = yaml.safe_load(stream)['alpha']
+    (input_directory_path / 'precomputed_array.log').write_text(
+                                    f'\n\n\nalpha: {alpha:.3e} / angstrom\n')
+    return dst_path
+
+
+@pytest.fixture
+def run_list(monkeypatch):
+    """Runs of material_run in the order they were started"""
+    run_list = []
+    do_kmc_steps = Run.do_kmc_steps
+
+    def recorded_do_kmc_steps(run, *args, **kwargs):
+        run_list.append(run)
+        return do_kmc_steps(run, *args, **kwargs)
+    monkeypatch.setattr(Run, 'do_kmc_steps', recorded_do_kmc_steps)
+    return run_list
+
+
+def write_sim_params(dst_path, **sim_params):
+    """Writes the simulation parameters of the BVO example updated with
+        sim_params to the destination path. Every output data type except
+        the wrapped trajectory and the potential is written"""
+    with open(examples_directory_path / 'BVO' / 'simulation_parameters.yml') as stream:
+        updated_sim_params = yaml.safe_load(stream)
+    for output_data_type in ['delg_0', 'energy', 'time', 'unwrapped_traj']:
+        updated_sim_params['output_data'][output_data_type]['write'] = 1
+    updated_sim_params.update(sim_params)
+    dst_path.mkdir(parents=True, exist_ok=True)
+    with open(dst_path / 'simulation_parameters.yml', 'w') as stream:
+        yaml.safe_dump(updated_sim_params, stream)
+    return updated_sim_params
+
+
+def load_output_data(traj_dir_path):
+    return {output_file_path.name: np.load(output_file_path)
+            for output_file_path in sorted(traj_dir_path.glob('*.npy'))}
+
+
+def test_replay_parallel_traj(bvo_path, run_list):
+    """A trajectory of a run in parallel compute mode draws from the stream
+        of its traj directory, in the run as well as in the replay"""
+    sim_params = write_sim_params(bvo_path, n_traj=2, t_final=2e-5)
+    material_run(bvo_path)
+    output_data = sim_params['output_data']
+    output_data['event_log']['write'] = 1
+    traj_dir_path = bvo_path / 'parallel' / 'traj2'
+    write_sim_params(traj_dir_path, t_final=2e-5, compute_mode='parallel',
+                     work_dir_depth=1, output_data=output_data)
+    material_run(traj_dir_path)
+
+    # same trajectory as in the serial run
+    serial_output_data = load_output_data(bvo_path / 'traj2')
+    parallel_output_data = load_output_data(traj_dir_path)
+    for output_file_name, array in serial_output_data.items():
+        assert np.array_equal(parallel_output_data[output_file_name], array)
+
+    run = run_list[-1]
+    output_arrays = run.replay_event_log(
+                        traj_dir_path, 0, sim_params['random_seed'],
+                        ['time', 'unwrapped_traj', 'energy', 'delg_0'])
+    assert np.array_equal(output_arrays['time'],
+                          parallel_output_data['time_data.npy'])
+    assert np.allclose(output_arrays['unwrapped_traj'],
+                       parallel_output_data['unwrapped_traj.npy'], rtol=0,
+                       atol=1e-8)
+    assert np.allclose(output_arrays['energy'],
+                       parallel_output_data['energy_traj.npy'], rtol=1e-12)
+    assert np.allclose(output_arrays['delg_0'],
+                       parallel_output_data['delG0_traj.npy'], rtol=1e-12)
+
+
+def test_chunked_npy_writer(tmp_path):
+    """Rows written one at a time, as ranges and as extensions in 1-row
+        blocks are padded to num_rows and loadable after every block"""
+    background_writer = BackgroundWriter()
+    file_path = tmp_path / 'array.npy'
+    row_shape = (3,)
+    output_stream = ChunkedNpyWriter(file_path, row_shape, float,
+                                     background_writer, num_rows=12,
+                                     max_block_bytes=1)
+    assert output_stream.block_size == 1
+    background_writer.wait()
+    assert np.load(file_path).shape == (0, 3)
+
+    expected_array = np.zeros((12, 3))
+    output_stream.append([1.0, 2.0, 3.0])
+    expected_array[0] = [1.0, 2.0, 3.0]
+    output_stream.write(2, 5, 4.0)
+    expected_array[2:5] = 4.0
+    output_stream.extend(np.arange(6.0).reshape(2, 3))
+    expected_array[5:7] = np.arange(6.0).reshape(2, 3)
+    # ranges are clipped to num_rows
+    output_stream.write(9, 20, -1.0)
+    expected_array[9:] = -1.0
+    assert output_stream.get_num_rows() == 12
+    background_writer.wait()
+    num_file_rows = len(np.load(file_path))
+    assert num_file_rows == 11
+    assert np.array_equal(np.load(file_path), expected_array[:num_file_rows])
+    output_stream.close()
+    background_writer.close()
+    assert np.array_equal(np.load(file_path), expected_array)
+
+
+def test_chunked_npy_writer_padding(tmp_path):
+    """close pads the array with zeros up to num_rows across blocks"""
+    background_writer = BackgroundWriter()
+    file_path = tmp_path / 'array.npy'
+    output_stream = ChunkedNpyWriter(file_path, (), int, background_writer,
+                                     num_rows=10,
+                                     max_block_bytes=4 * np.dtype(int).itemsize)
+    output_stream.extend([1, 2, 3])
+    output_stream.close()
+    background_writer.close()
+    array = np.load(file_path)
+    assert array.dtype == np.dtype(int)
+    assert np.array_equal(array, [1, 2, 3, 0, 0, 0, 0, 0, 0, 0])
+
+
+def test_background_writer_error():
+    """An error raised on the thread is re-raised by wait"""
+    def failing_write():
+        raise OSError('disk full')
+    background_writer = BackgroundWriter()
+    background_writer.submit(failing_write)
+    with pytest.raises(OSError, match='disk full'):
+        background_writer.wait()
+    with pytest.raises(OSError, match='disk full'):
+        background_writer.close()
+
+
+def test_trajectory_store(tmp_path):
+    """Arrays of the trajectories appended to a store are read back whole
+        and by row window, including empty and structured arrays"""
+    store = TrajectoryStore.create(tmp_path / TrajectoryStore.file_name, 3)
+    assert len(store.get_traj_indices()) == 0
+    event_log = np.zeros(5, dtype=[('time', '<f8'), ('species_index', '<i8'),
+                                   ('process_index', '<i8')])
+    event_log['time'] = np.arange(5.0)
+    event_log['process_index'] = np.arange(5) * 2
+    traj_arrays = {
+        2: {'unwrapped_traj': np.arange(30.0).reshape(10, 3),
+            'time': np.linspace(0.0, 1.0, 7),
+            'occupancy': np.arange(8, dtype=np.int32).reshape(4, 2),
+            'event_log': event_log},
+        0: {'unwrapped_traj': np.zeros((0, 3)),
+            'time': np.array([0.0])}}
+    for traj_index, arrays in traj_arrays.items():
+        store.append(traj_index, arrays)
+
+    store = TrajectoryStore(tmp_path / TrajectoryStore.file_name)
+    assert store.num_traj == 3
+    assert np.array_equal(store.get_traj_indices(), [0, 2])
+    for traj_index, arrays in traj_arrays.items():
+        for output_data_type, array in arrays.items():
+            stored_array = store.get_array(traj_index, output_data_type)
+            assert stored_array.dtype == array.dtype
+            assert np.array_equal(stored_array, array)
+            assert np.array_equal(
+                    store.get_array(traj_index, output_data_type, 2, 4),
+                    array[2:4])
+            assert np.array_equal(
+                    store.get_array(traj_index, output_data_type, 3),
+                    array[3:])
+    assert store.get_array(0, 'unwrapped_traj').shape == (0, 3)
+    with pytest.raises(AssertionError):
+        store.get_array(1, 'time')
+
+    # a trajectory appended again replaces its record
+    store.append(0, {'time': np.array([0.0, 2.0])})
+    assert np.array_equal(store.get_array(0, 'time'), [0.0, 2.0])
+    assert np.array_equal(store.get_array(2, 'time'),
+                          traj_arrays[2]['time'])
+
+
+class Interruption(Exception):
+    pass
+
+
+def test_checkpoint_extend_t_final(bvo_path):
+    """A finished run extended to a later t_final is the same as a run to
+        that t_final"""
+    checkpoint = {'step_interval': 100, 'wall_time_interval': 0}
+    reference_path = bvo_path / 'reference'
+    write_sim_params(reference_path, n_traj=2, t_final=2e-5, work_dir_depth=1)
+    material_run(reference_path)
+    extended_path = bvo_path / 'extended'
+    write_sim_params(extended_path, n_traj=2, t_final=1e-5, work_dir_depth=1,
+                     checkpoint=checkpoint)
+    material_run(extended_path)
+    write_sim_params(extended_path, n_traj=2, t_final=2e-5, work_dir_depth=1,
+                     checkpoint=checkpoint)
+    material_run(extended_path)
+
+    for traj_dir_name in ['traj1', 'traj2']:
+        reference_output_data = load_output_data(reference_path / traj_dir_name)
+        extended_output_data = load_output_data(extended_path / traj_dir_name)
+        assert extended_output_data.keys() == reference_output_data.keys()
+        for output_file_name, array in reference_output_data.items():
+            assert np.array_equal(extended_output_data[output_file_name], array)
+
+
+def test_checkpoint_resume(bvo_path, monkeypatch):
+    """A run interrupted partway and resumed from its checkpoints is the
+        same as an uninterrupted run"""
+    reference_path = bvo_path / 'reference'
+    write_sim_params(reference_path, n_traj=2, t_final=2e-5, work_dir_depth=1)
+    material_run(reference_path)
+
+    # interrupt the second trajectory between its checkpoints
+    num_random_calls = [0]
+    random = UniformBlockStream.random
+
+    def interrupted_random(random_numbers):
+        num_random_calls[0] += 1
+        if num_random_calls[0] == 2000:
+            raise Interruption
+        return random(random_numbers)
+    background_writer_list = []
+
+    class RecordedBackgroundWriter(BackgroundWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            background_writer_list.append(self)
+    resumed_path = bvo_path / 'resumed'
+    write_sim_params(resumed_path, n_traj=2, t_final=2e-5, work_dir_depth=1,
+                     checkpoint={'step_interval': 100, 'wall_time_interval': 0})
+    with monkeypatch.context() as patch:
+        patch.setattr(UniformBlockStream, 'random', interrupted_random)
+        patch.setattr(core, 'BackgroundWriter', RecordedBackgroundWriter)
+        with pytest.raises(Interruption):
+            material_run(resumed_path)
+    # the writes of the interrupted trajectory are done before resuming
+    for background_writer in background_writer_list:
+        background_writer.close()
+    assert (resumed_path / 'traj2' / Run.checkpoint_file_name).exists()
+    material_run(resumed_path)
+
+    for traj_dir_name in ['traj1', 'traj2']:
+        reference_output_data = load_output_data(reference_path / traj_dir_name)
+        resumed_output_data = load_output_data(resumed_path / traj_dir_name)
+        assert resumed_output_data.keys() == reference_output_data.keys()
+        for output_file_name, array in reference_output_data.items():
+            assert np.array_equal(resumed_output_data[output_file_name], array)
+
+
+def test_fenwick_selection_without_interaction_radius(bvo_path):
+    """Without an interaction radius the 'fenwick' selection backend
+        updates every process and selects the same processes as 'dense'"""
+    output_data_list = []
+    for selection_backend in ['dense', 'fenwick']:
+        dst_path = bvo_path / selection_backend
+        write_sim_params(dst_path, t_final=2e-5, work_dir_depth=1,
+                         selection_backend=selection_backend)
+        material_run(dst_path)
+        output_data_list.append(load_output_data(dst_path / 'traj1'))
+    (dense_output_data, fenwick_output_data) = output_data_list
+    assert fenwick_output_data.keys() == dense_output_data.keys()
+    for output_file_name, array in dense_output_data.items():
+        assert np.array_equal(fenwick_output_data[output_file_name], array)
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64, 100])
+def test_fenwick_tree(size):
+    """Searches after updates and rebuilds agree with np.searchsorted on the
+        cumulative sum of the values"""
+    random_generator = np.random.default_rng(size)
+    values = random_generator.random(size)
+    values[random_generator.random(size) < 0.2] = 0.0
+    rate_tree = FenwickTree(values)
+
+    def check_rate_tree():
+        cum_sum = np.cumsum(values)
+        assert np.isclose(rate_tree.total, cum_sum[-1], rtol=1e-12)
+        # targets off the prefix sums avoid ties decided by round-off
+        targets = np.concatenate((random_generator.random(50) * cum_sum[-1],
+                                  (cum_sum[:-1] + cum_sum[1:]) / 2))
+        for target in targets:
+            if values.any() and (np.abs(cum_sum - target) > 1e-9).all():
+                assert rate_tree.search(target) == min(
+                        np.searchsorted(cum_sum, target, side='right'),
+                        size - 1)
+    check_rate_tree()
+    for index in random_generator.integers(size, size=3 * size):
+        values[index] = random_generator.random() if index % 3 else 0.0
+        rate_tree.update(index, values[index])
+        check_rate_tree()
+    values = random_generator.random(size)
+    rate_tree.rebuild(values)
+    assert rate_tree.values == values.tolist()
+    check_rate_tree()
+
+
+def test_packed_symmetric_matrix():
+    """Rows, elements, blocks and products of the packed upper triangle
+        equal those of the dense array"""
+    random_generator = np.random.default_rng(0)
+    num_sites = 11
+    dense_array = random_generator.random((num_sites, num_sites))
+    dense_array = dense_array + dense_array.T
+    packed_matrix = PackedSymmetricMatrix(
+                                dense_array[np.triu_indices(num_sites)])
+    # rows are gathered in several blocks
+    packed_matrix.max_row_block_elements = 3 * num_sites
+    assert packed_matrix.shape == dense_array.shape
+    site_indices = np.array([4, 0, 10, 4])
+    assert np.array_equal(packed_matrix[site_indices], dense_array[site_indices])
+    assert np.array_equal(packed_matrix[7], dense_array[7])
+    assert np.array_equal(packed_matrix[site_indices, site_indices[::-1]],
+                          dense_array[site_indices, site_indices[::-1]])
+    block_site_indices = np.array([1, 3, 4, 9])
+    assert np.array_equal(
+            packed_matrix.get_block(block_site_indices)[np.arange(4)],
+            dense_array[np.ix_(block_site_indices, block_site_indices)])
+    charge_config = random_generator.random(num_sites)
+    assert np.allclose(packed_matrix.dot(charge_config),
+                       dense_array.dot(charge_config), rtol=1e-14)
+
+
+def test_interaction_matrix():
+    """Rows, elements and products of the array stored by translational
+        symmetry equal those of the dense array"""
+    random_generator = np.random.default_rng(0)
+    system_size = np.array([2, 3, 2])
+    num_cells = system_size.prod()
+    num_basis_sites = 2
+    compressed_array = random_generator.random(
+                                (num_basis_sites, num_cells, num_basis_sites))
+    interaction_matrix = InteractionMatrix(compressed_array, system_size)
+    num_sites = num_cells * num_basis_sites
+    dense_array = np.zeros((num_sites, num_sites))
+    for row_site_index in range(num_sites):
+        (row_cell_index, row_basis_site_index) = divmod(row_site_index,
+                                                        num_basis_sites)
+        for column_site_index in range(num_sites):
+            (column_cell_index, column_basis_site_index) = divmod(
+                                        column_site_index, num_basis_sites)
+            cell_offset = ((np.array(np.unravel_index(column_cell_index,
+                                                      system_size))
+                            - np.unravel_index(row_cell_index, system_size))
+                           % system_size)
+            dense_array[row_site_index, column_site_index] = compressed_array[
+                        row_basis_site_index,
+                        np.ravel_multi_index(tuple(cell_offset), system_size),
+                        column_basis_site_index]
+    assert interaction_matrix.shape == dense_array.shape
+    site_indices = np.array([5, 0, 23, 5])
+    assert np.array_equal(interaction_matrix[site_indices],
+                          dense_array[site_indices])
+    assert np.array_equal(interaction_matrix[17], dense_array[17])
+    assert np.array_equal(
+                interaction_matrix[site_indices, site_indices[::-1]],
+                dense_array[site_indices, site_indices[::-1]])
+    charge_config = random_generator.random(num_sites)
+    assert np.allclose(interaction_matrix.dot(charge_config),
+                       dense_array.dot(charge_config), rtol=1e-12)
+
+
+def test_min_image_vectors():
+    """Minimum image vectors computed on demand equal the pairwise min
+        image vector data of the BVO example, including the pairs half a
+        simulation cell apart whose nearest images are tied"""
+    input_directory_path = examples_directory_path / 'BVO' / 'InputFiles'
+    with open(input_directory_path / 'sys_config.yml') as stream:
+        params = yaml.safe_load(stream)
+    params['input_coord_file_location'] = input_directory_path / 'POSCAR'
+    material_neighbors = Neighbors(Material(ReturnValues(params)),
+                                   np.array([2, 2, 1]), np.array([1, 1, 1]))
+    pairwise_min_image_vector_data = np.load(
+                input_directory_path / 'pairwise_min_image_vector_data.npy')
+    min_image_vectors = material_neighbors.min_image_vectors
+    num_sites = min_image_vectors.shape[0]
+    assert np.allclose(min_image_vectors[np.arange(num_sites)],
+                       pairwise_min_image_vector_data, rtol=0, atol=1e-12)
+    site_indices = np.array([3, 17, 3])
+    assert np.allclose(min_image_vectors[site_indices, site_indices[::-1]],
+                       pairwise_min_image_vector_data[site_indices,
+                                                      site_indices[::-1]],
+                       rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('translational_matrix, pbc', [
+    (np.diag([12.0, 9.0, 15.0]), [1, 1, 1]),
+    (np.array([[11.0, 0.0, 0.0], [4.0, 10.0, 0.0], [-3.0, 2.5, 13.0]]),
+     [1, 1, 1]),
+    (np.array([[11.0, 0.0, 0.0], [4.0, 10.0, 0.0], [-3.0, 2.5, 13.0]]),
+     [1, 0, 1])])
+def test_periodic_cell_list(translational_matrix, pbc):
+    """Radius and nearest neighbor queries agree with brute-force minimum
+        image distances"""
+    random_generator = np.random.default_rng(0)
+    num_sites = 150
+    cell_coordinates = np.dot(random_generator.random((num_sites, 3)),
+                              translational_matrix)
+    system_translational_vector_list = np.dot(
+                    list(itertools.product(*[range(-1, 2) if periodic else [0]
+                                             for periodic in pbc])),
+                    translational_matrix)
+    min_image_vectors = MinImageVectors(cell_coordinates, translational_matrix,
+                                        pbc, system_translational_vector_list)
+    cell_list = PeriodicCellList(min_image_vectors, pbc, num_sites_per_bin=2)
+    assert cell_list.num_bins.prod() > 1
+    displacement_array = np.linalg.norm(
+                        min_image_vectors[np.arange(num_sites)], axis=2)
+    site_indices = np.array([0, 7, 42, 149, 7])
+    neighbor_site_indices = np.sort(random_generator.choice(num_sites, 60,
+                                                            replace=False))
+    radius = 5.0
+    for candidate_site_indices in [None, neighbor_site_indices]:
+        if candidate_site_indices is None:
+            candidate_mask = np.ones(num_sites, dtype=bool)
+        else:
+            candidate_mask = np.isin(np.arange(num_sites),
+                                     candidate_site_indices)
+        expected_neighbor_list = []
+        for site_index in site_indices:
+            site_candidates = np.where(candidate_mask
+                                       & (np.arange(num_sites) != site_index))[0]
+            expected_neighbor_list.append(site_candidates[np.argsort(
+                        displacement_array[site_index, site_candidates],
+                        kind='stable')])
+
+        return_neighbors = cell_list.query_radius(site_indices, radius,
+                                                  candidate_site_indices)
+        neighbor_offsets = return_neighbors.neighbor_offsets
+        for position, site_index in enumerate(site_indices):
+            expected_neighbors = expected_neighbor_list[position]
+            expected_neighbors = expected_neighbors[
+                    displacement_array[site_index, expected_neighbors] <= radius]
+            neighbor_slice = slice(neighbor_offsets[position],
+                                   neighbor_offsets[position + 1])
+            assert np.array_equal(
+                    return_neighbors.neighbor_site_indices[neighbor_slice],
+                    expected_neighbors)
+            assert np.array_equal(
+                    return_neighbors.displacement_vectors[neighbor_slice],
+                    min_image_vectors[site_index, expected_neighbors])
+            assert np.allclose(return_neighbors.displacements[neighbor_slice],
+                               displacement_array[site_index,
+                                                  expected_neighbors])
+
+        num_neighbors = 12
+        nearest_neighbors = cell_list.query_nearest(site_indices, num_neighbors,
+                                                    candidate_site_indices)
+        for position, site_index in enumerate(site_indices):
+            expected_neighbors = expected_neighbor_list[position][:num_neighbors]
+            assert np.array_equal(
+                    nearest_neighbors.neighbor_site_indices[position],
+                    expected_neighbors)
+            assert np.allclose(nearest_neighbors.displacements[position],
+                               displacement_array[site_index,
+                                                  expected_neighbors])
+
+
+def test_pairwise_doping(bvo_path):
+    """Pairwise doping selects the pairs of V sites at the intra pair
+        distance in the plane of arrangement and the run completes"""
+    with open(examples_directory_path / 'BVO' / 'simulation_parameters.yml') as stream:
+        doping = yaml.safe_load(stream)['doping']
+    doping['insertion_type'] = ['pairwise', 'random']
+    doping['num_dopants'] = [8, 0]
+    doping['pairwise'][0].update(intra_pair_distance=5.0935,
+                                 inter_plane_spacing=8,
+                                 plane_of_arrangement=[1, 0, 0])
+    write_sim_params(bvo_path, species_count=[2, 0], t_final=1e-5,
+                     doping=doping)
+    material_run(bvo_path)
+    site_indices = np.load(bvo_path / 'site_indices.npy')
+    assert np.array_equal(site_indices[site_indices[:, 3] == 1, 0],
+                          [64, 65, 66, 67, 88, 89, 90, 91])
+    assert len(np.load(bvo_path / 'traj1' / 'time_data.npy')) > 1
+
+
+def run_bvo(bvo_path, run_name, **sim_params):
+    """Runs two trajectories of the BVO example with the simulation
+        parameters updated with sim_params and returns their output data"""
+    dst_path = bvo_path / run_name
+    write_sim_params(dst_path, n_traj=2, t_final=2e-5, work_dir_depth=1,
+                     **sim_params)
+    material_run(dst_path)
+    return [load_output_data(dst_path / f'traj{traj_index+1}')
+            for traj_index in range(2)]
+
+
+def assert_same_trajectories(traj_output_data_list,
+                             reference_traj_output_data_list, exact_time=True):
+    """Trajectories are equal and energies agree to roundoff. Times are
+        equal if exact_time is set and agree to roundoff otherwise"""
+    for (output_data, reference_output_data) in zip(
+                    traj_output_data_list, reference_traj_output_data_list):
+        assert output_data.keys() == reference_output_data.keys()
+        assert np.array_equal(output_data['unwrapped_traj.npy'],
+                              reference_output_data['unwrapped_traj.npy'])
+        if exact_time:
+            assert np.array_equal(output_data['time_data.npy'],
+                                  reference_output_data['time_data.npy'])
+        else:
+            assert np.allclose(output_data['time_data.npy'],
+                               reference_output_data['time_data.npy'],
+                               rtol=1e-12, atol=0)
+        for output_file_name in ['energy_traj.npy', 'delG0_traj.npy']:
+            assert np.allclose(output_data[output_file_name],
+                               reference_output_data[output_file_name],
+                               rtol=1e-10, atol=1e-12)
+
+
+def test_batch_compute_mode(bvo_path):
+    """Trajectories advanced in lockstep match those of a serial run"""
+    assert_same_trajectories(
+            run_bvo(bvo_path, 'batch', compute_mode='batch', batch_size=2),
+            run_bvo(bvo_path, 'serial', compute_mode='serial'))
+
+
+def test_multiprocess_compute_mode(bvo_path):
+    """Trajectories run on a pool of worker processes match those of a
+        serial run"""
+    assert_same_trajectories(
+            run_bvo(bvo_path, 'multiprocess', compute_mode='multiprocess',
+                    num_workers=2),
+            run_bvo(bvo_path, 'serial', compute_mode='serial'))
+
+
+@pytest.mark.parametrize('potential_evaluation', ['sparse', 'incremental'])
+def test_potential_evaluation(bvo_path, potential_evaluation):
+    """Site potentials evaluated over the carriers or updated incrementally
+        select the same processes as those evaluated from the full charge
+        configuration. Rates differ by roundoff, hence so do the times"""
+    assert_same_trajectories(
+            run_bvo(bvo_path, potential_evaluation,
+                    potential_evaluation=potential_evaluation),
+            run_bvo(bvo_path, 'dense', potential_evaluation='dense'),
+            exact_time=False)